@@ -0,0 +1,80 @@
+"""Requests/s of the sync and async Todo routes at increasing concurrency.
+
+Starts ``uvicorn rp_poetry.main:app`` once with DB_ASYNC=false and once with
+DB_ASYNC=true against the database in DATABASE_URL, then hammers
+``GET /todos`` from ``--clients`` concurrent connections for ``--duration``
+seconds per level::
+
+    python benchmarks/bench_async.py --clients 50 100 250 500
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+async def drive(url: str, clients: int, duration: float) -> tuple[int, int]:
+    done = errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+
+        async def worker():
+            nonlocal done, errors
+            while time.perf_counter() < deadline:
+                try:
+                    response = await client.get("/todos", params={"limit": 20})
+                    response.raise_for_status()
+                    done += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(clients)))
+    return done, errors
+
+
+def start_server(port: int, db_async: bool) -> subprocess.Popen:
+    env = dict(os.environ, DB_ASYNC=str(db_async).lower())
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "rp_poetry.main:app",
+         "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'clients':>7} {'req/s':>9} {'errors':>7}")
+    for db_async in (False, True):
+        server = start_server(args.port, db_async)
+        try:
+            for clients in args.clients:
+                done, errors = asyncio.run(
+                    drive(f"http://127.0.0.1:{args.port}", clients, args.duration)
+                )
+                mode = "async" if db_async else "sync"
+                print(f"{mode:<6} {clients:>7} {done / args.duration:>9.1f} {errors:>7}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Per-request cost of GET /items/{item_id}/name and /public.
+
+Calls two FastAPI apps directly through ASGI: one with the routes as they
+were (look up the raw dict, let FastAPI validate it through ``Item`` and
+apply response_model_include/exclude), one with fastneon's catalog-backed
+handlers. Best of ``--repeat`` interleaved runs::
+
+    python benchmarks/bench_catalog.py --requests 50000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# settings require a database URL; nothing here connects to it
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("TEST_DATABASE_URL", os.environ["DATABASE_URL"])
+
+from fastapi import FastAPI  # noqa: E402
+
+from rp_poetry.fastneon import Item, items, read_item_name, read_item_public_data  # noqa: E402
+
+
+def build_app(catalog: bool) -> FastAPI:
+    app = FastAPI()
+    if catalog:
+        app.get("/items/{item_id}/name", response_model=Item,
+                response_model_include={"name", "description"})(read_item_name)
+        app.get("/items/{item_id}/public", response_model=Item,
+                response_model_exclude={"tax"})(read_item_public_data)
+        return app
+
+    @app.get("/items/{item_id}/name", response_model=Item, response_model_include={"name", "description"})
+    async def dict_item_name(item_id: str):
+        return items[item_id]
+
+    @app.get("/items/{item_id}/public", response_model=Item, response_model_exclude={"tax"})
+    async def dict_item_public(item_id: str):
+        return items[item_id]
+
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    paths = [f"/items/{item_id}/{projection}" for item_id in items for projection in ("name", "public")]
+
+    def scope(i: int):
+        path = paths[i % len(paths)]
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "root_path": "", "query_string": b"", "headers": [],
+            "server": ("testserver", 80), "client": ("127.0.0.1", 1234),
+        }
+
+    for i in range(1000):  # warm up
+        await app(scope(i), receive, send)
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5, help="report the best of N runs")
+    args = parser.parse_args()
+
+    raw = catalog = float("inf")
+    for _ in range(args.repeat):
+        # interleaved so that machine noise hits both variants alike
+        raw = min(raw, asyncio.run(run(build_app(False), args.requests)))
+        catalog = min(catalog, asyncio.run(run(build_app(True), args.requests)))
+    print(f"dict + response_model: {raw * 1e6:8.1f} us/request")
+    print(f"catalog:               {catalog * 1e6:8.1f} us/request "
+          f"({(1 - catalog / raw) * 100:.1f}% less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Size and CPU cost of each response compression encoding and level.
+
+Compresses a GET /todos page as the API serializes it, ``--todos`` todos
+long, with each encoding at a few levels, and reports the compressed size
+and the time per body. Bodies at least COMPRESSION_THREADPOOL_MIN_SIZE long
+are compressed off the event loop; the time here is what that saves the
+loop::
+
+    python benchmarks/bench_compression.py --todos 100 1000
+"""
+import argparse
+import time
+
+from rp_poetry.compression import compressors
+from rp_poetry.models import Todo, todo_list
+
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 11), "zstd": (1, 3, 10)}
+
+
+def page(todos: int) -> bytes:
+    return todo_list.dump_json([
+        Todo(id=i, content=f"Todo number {i}: buy milk, walk the dog", status=i % 2 == 0, version=1)
+        for i in range(1, todos + 1)
+    ])
+
+
+def best_time(compress, body: bytes, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compress(body)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--todos", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=20, help="report the best of N runs")
+    args = parser.parse_args()
+
+    for todos in args.todos:
+        body = page(todos)
+        print(f"{todos} todos, {len(body)} bytes")
+        for encoding, levels in LEVELS.items():
+            for level in levels:
+                factory = compressors([encoding], {encoding: level})[encoding]
+                compress = lambda data: factory().compress(data, final=True)  # noqa: E731
+                size = len(compress(body))
+                seconds = best_time(compress, body, args.repeat)
+                print(
+                    f"  {encoding:>4} {level:>2}: {size:8d} bytes ({size / len(body):6.1%}),"
+                    f" {seconds * 1000:7.2f} ms, {len(body) / seconds / 1e6:7.1f} MB/s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Per-request overhead of MetricsMiddleware.
+
+Calls a FastAPI app directly through ASGI (no sockets, no HTTP client) with
+and without the middleware and reports the difference in microseconds per
+request, best of ``--repeat`` interleaved runs::
+
+    python benchmarks/bench_metrics.py --requests 50000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from rp_poetry.metrics import MetricsMiddleware
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/todos/{todo_id}")
+    async def read(todo_id: int):
+        return {"id": todo_id}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i: int):
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": f"/todos/{i}", "raw_path": b"",
+            "root_path": "", "query_string": b"", "headers": [],
+            "server": ("testserver", 80), "client": ("127.0.0.1", 1234),
+        }
+
+    for i in range(1000):  # warm up
+        await app(scope(i), receive, send)
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5, help="report the best of N runs")
+    args = parser.parse_args()
+
+    bare = instrumented = float("inf")
+    for _ in range(args.repeat):
+        # interleaved so that machine noise hits both variants alike
+        bare = min(bare, asyncio.run(run(build_app(False), args.requests)))
+        instrumented = min(instrumented, asyncio.run(run(build_app(True), args.requests)))
+    print(f"without metrics: {bare * 1e6:8.1f} us/request")
+    print(f"with metrics:    {instrumented * 1e6:8.1f} us/request")
+    print(f"overhead:        {(instrumented - bare) * 1e6:8.1f} us/request "
+          f"({(instrumented / bare - 1) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
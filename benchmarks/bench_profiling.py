@@ -0,0 +1,83 @@
+"""Per-request overhead of the query profiler at different sample rates.
+
+Calls a FastAPI app directly through ASGI, as bench_metrics.py does, with a
+route that runs two statements on an in-memory SQLite engine. The engine is
+instrumented in every variant but "off"; the others differ only in
+PROFILE_SAMPLE_RATE::
+
+    python benchmarks/bench_profiling.py --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine
+
+from rp_poetry import profiling
+from rp_poetry.profiling import ProfilerMiddleware
+
+VARIANTS = {"off": None, "0%": 0.0, "1%": 0.01, "100%": 1.0}
+
+
+def build_app(sample_rate) -> FastAPI:
+    app = FastAPI()
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    if sample_rate is not None:
+        profiling.instrument_engine(engine)
+        app.add_middleware(
+            ProfilerMiddleware, sample_rate=sample_rate, slow_query_ms=100, repeat_threshold=3, log=False
+        )
+
+    @app.get("/todos/{todo_id}")
+    async def read(todo_id: int):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT :id"), {"id": todo_id}).scalar()
+            return {"id": conn.execute(text("SELECT :id"), {"id": todo_id}).scalar()}
+
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i: int):
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": f"/todos/{i}", "raw_path": b"",
+            "root_path": "", "query_string": b"", "headers": [],
+            "server": ("testserver", 80), "client": ("127.0.0.1", 1234),
+        }
+
+    for i in range(1000):  # warm up
+        await app(scope(i), receive, send)
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5, help="report the best of N runs")
+    args = parser.parse_args()
+
+    best = {name: float("inf") for name in VARIANTS}
+    for _ in range(args.repeat):
+        # interleaved so that machine noise hits every variant alike
+        for name, sample_rate in VARIANTS.items():
+            best[name] = min(best[name], asyncio.run(run(build_app(sample_rate), args.requests)))
+    for name, seconds in best.items():
+        overhead = (seconds / best["off"] - 1) * 100
+        print(f"{name:>5}: {seconds * 1e6:8.1f} us/request ({overhead:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Idle GET /todos/stream subscribers held by one worker, and how long a
+change takes to reach all of them.
+
+Starts one uvicorn worker with TODO_PUSH_ENABLED, opens ``--subscribers``
+SSE connections to it, reads the worker's RSS, then creates a todo and
+times its event arriving on every connection. Each connection is a bare
+asyncio stream, so the client stays cheaper than the server it measures::
+
+    python benchmarks/bench_stream.py --subscribers 1000 5000 10000
+
+Point DATABASE_URL at Postgres to measure LISTEN/NOTIFY; the SQLite
+default is polled every TODO_PUSH_POLL_INTERVAL.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REQUEST = b"GET /todos/stream HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n"
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def start_server(port: int, env: dict[str, str]) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "rp_poetry.main:app", "--port", str(port),
+         "--log-level", "warning", "--backlog", "4096"],
+        env=dict(os.environ, **env),
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def subscribe(port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(REQUEST)
+    await reader.readuntil(b": connected")
+    return reader, writer
+
+
+async def wait_for_event(reader: asyncio.StreamReader) -> float:
+    # the first event after connecting; chunked framing is skipped over
+    await reader.readuntil(b"data: ")
+    return time.perf_counter()
+
+
+async def run(port: int, subscribers: int, pid: int) -> tuple[float, list[float]]:
+    connections = []
+    # a few hundred at a time keeps the accept backlog from overflowing
+    for start in range(0, subscribers, 500):
+        connections += await asyncio.gather(
+            *(subscribe(port) for _ in range(min(500, subscribers - start)))
+        )
+    await asyncio.sleep(1)
+    rss = rss_mb(pid)
+
+    waiters = [asyncio.create_task(wait_for_event(reader)) for reader, _ in connections]
+    async with httpx.AsyncClient() as client:
+        start = time.perf_counter()
+        response = await client.post(f"http://127.0.0.1:{port}/todos", json={"content": "fan-out"})
+        response.raise_for_status()
+    arrivals = await asyncio.wait_for(asyncio.gather(*waiters), 120)
+    for _, writer in connections:
+        writer.close()
+    return rss, [arrival - start for arrival in arrivals]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    # two descriptors per subscriber on this machine: ours and the server's,
+    # which inherits the limit
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = max(args.subscribers) + 1024
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    tmp = tempfile.mkdtemp(prefix="rp-poetry-stream-")
+    env = {
+        "DATABASE_URL": os.environ.get("DATABASE_URL", f"sqlite:///{tmp}/bench.db"),
+        "TEST_DATABASE_URL": os.environ.get("TEST_DATABASE_URL", f"sqlite:///{tmp}/bench.db"),
+        "DB_MIGRATE_ON_STARTUP": "true",
+        "METRICS_ENABLED": "false",
+        "TODO_PUSH_ENABLED": "true",
+        "TODO_SYNC_LAG_MS": os.environ.get("TODO_SYNC_LAG_MS", "0"),
+        "TODO_PUSH_POLL_INTERVAL": os.environ.get("TODO_PUSH_POLL_INTERVAL", "0.1"),
+    }
+    print(f"{'subscribers':>12}{'idle RSS MiB':>14}{'KiB/sub':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for subscribers in args.subscribers:
+        server = start_server(args.port, env)
+        try:
+            baseline = rss_mb(server.pid)
+            rss, latencies = asyncio.run(run(args.port, subscribers, server.pid))
+        finally:
+            server.terminate()
+            server.wait()
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(
+            f"{subscribers:>12}{rss:>14.1f}{(rss - baseline) * 1024 / subscribers:>9.1f}"
+            f"{statistics.median(latencies) * 1000:>9.1f}{p99 * 1000:>9.1f}{latencies[-1] * 1000:>9.1f}"
+        )
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Peak server RSS while uploading files of increasing size to POST /files/.
+
+For every size it starts a fresh uvicorn worker, streams one multipart
+upload to it (the client generates the body on the fly, so it stays small
+too) and reads the worker's peak RSS (VmHWM, Linux only). ``streaming`` is
+``rp_poetry.fastneon:app``; ``buffered`` is the old ``File(bytes)`` handler,
+defined below, for comparison::
+
+    python benchmarks/bench_upload.py --sizes 16 64 256 512
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Annotated
+
+import httpx
+from fastapi import FastAPI, File, Form, UploadFile
+
+BOUNDARY = "bench-upload-boundary"
+CHUNK = 1024 * 1024
+
+buffered_app = FastAPI()
+
+
+@buffered_app.get("/")
+def root():
+    return {}
+
+
+@buffered_app.post("/files/")
+async def create_file(
+    file: Annotated[bytes, File()],
+    fileb: Annotated[UploadFile, File()],
+    token: Annotated[str, Form()],
+):
+    return {"file_size": len(file), "file_sha256": hashlib.sha256(file).hexdigest()}
+
+
+APPS = {"streaming": "rp_poetry.fastneon:app", "buffered": "bench_upload:buffered_app"}
+
+
+def multipart_body(size: int):
+    block = os.urandom(CHUNK)
+    for name in ("file", "fileb"):
+        yield (
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{name}.bin\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        remaining = size if name == "file" else 1024
+        while remaining:
+            chunk = block[:min(remaining, CHUNK)]
+            remaining -= len(chunk)
+            yield chunk
+        yield b"\r\n"
+    yield f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"token\"\r\n\r\nbench\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def start_server(app: str, port: int, env: dict[str, str]) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--app-dir", os.path.dirname(__file__),
+         "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ, **env),
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256], help="file sizes in MiB")
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=list(APPS))
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="rp-poetry-upload-")
+    env = {
+        "DATABASE_URL": os.environ.get("DATABASE_URL", f"sqlite:///{tmp}/bench.db"),
+        "TEST_DATABASE_URL": os.environ.get("TEST_DATABASE_URL", f"sqlite:///{tmp}/bench.db"),
+        "UPLOAD_DIR": os.path.join(tmp, "uploads"),
+        "UPLOAD_MAX_SIZE": str(max(args.sizes) * 2 * 1024 * 1024),
+    }
+    print(f"{'app':<10}{'MiB':>6}{'status':>8}{'seconds':>9}{'peak RSS MiB':>14}")
+    for app in args.apps:
+        for size in args.sizes:
+            server = start_server(APPS[app], args.port, env)
+            try:
+                start = time.perf_counter()
+                response = httpx.post(
+                    f"http://127.0.0.1:{args.port}/files/",
+                    content=multipart_body(size * 1024 * 1024),
+                    headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+                    timeout=600,
+                )
+                elapsed = time.perf_counter() - start
+                rss = peak_rss_mb(server.pid)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{app:<10}{size:>6}{response.status_code:>8}{elapsed:>9.2f}{rss:>14.1f}")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Diff two loadgen.py result files.
+
+Matches runs on (operation, rows, clients) and prints the change in
+throughput and p99 latency. Exits non-zero when any run regressed by more
+than ``--threshold`` percent, so it can gate CI::
+
+    python benchmarks/compare.py bench-main.json bench-branch.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict[tuple, dict]:
+    with open(path) as f:
+        data = json.load(f)
+    return {(r["operation"], r["rows"], r["clients"]): r for r in data["results"]}
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    regressions = 0
+    print(f"{'operation':<10}{'rows':>9}{'clients':>9}{'req/s':>20}{'p99 ms':>22}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        rps = change(old["rps"], new["rps"])
+        p99 = change(old["p99_ms"], new["p99_ms"])
+        regressed = rps < -args.threshold or p99 > args.threshold
+        regressions += regressed
+        print(
+            f"{key[0]:<10}{key[1]:>9}{key[2]:>9}"
+            f"{old['rps']:>9.1f} -> {new['rps']:<9.1f}{rps:+6.1f}%"
+            f"{old['p99_ms']:>8.2f} -> {new['p99_ms']:<8.2f}{p99:+6.1f}%"
+            + ("  REGRESSION" if regressed else "")
+        )
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{key[0]:<10}{key[1]:>9}{key[2]:>9}  only in one file")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Micro-benchmarks for the Todo handlers, run with pytest-benchmark.
+
+They run offline against a throwaway SQLite file by default; point
+BENCH_DATABASE_URL at a local Postgres (see docker-compose.yml) to measure
+the real driver. Table sizes come from BENCH_TABLE_SIZES::
+
+    BENCH_TABLE_SIZES=1000,100000 pytest benchmarks --benchmark-json=bench.json
+"""
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="rp-poetry-bench-")
+os.environ.setdefault("BENCH_DATABASE_URL", f"sqlite:///{_tmp}/bench.db")
+# settings are read at import time, so configure them before rp_poetry loads
+os.environ.setdefault("DATABASE_URL", os.environ["BENCH_DATABASE_URL"])
+os.environ.setdefault("TEST_DATABASE_URL", os.environ["BENCH_DATABASE_URL"])
+os.environ.setdefault("TODO_CACHE", "off")
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+from sqlmodel import Session  # noqa: E402
+
+from rp_poetry.db import make_engine  # noqa: E402
+from rp_poetry.repository import SqlTodoRepository  # noqa: E402
+from seed import seed, seed_memory  # noqa: E402
+
+TABLE_SIZES = [int(size) for size in os.environ.get("BENCH_TABLE_SIZES", "1000,10000").split(",")]
+
+
+@pytest.fixture(scope="session")
+def engine():
+    return make_engine(os.environ["BENCH_DATABASE_URL"])
+
+
+@pytest.fixture(scope="session", params=TABLE_SIZES, ids=lambda rows: f"{rows}rows")
+def table_size(request, engine):
+    seed(engine, request.param)
+    return request.param
+
+
+@pytest.fixture
+def session(engine, table_size):
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture(params=["database", "memory"])
+def repository(request, session, table_size):
+    # the handlers run against each TODO_BACKEND
+    if request.param == "memory":
+        return seed_memory(table_size)
+    return SqlTodoRepository(session)
@@ -0,0 +1,35 @@
+from sqlalchemy import column, insert, table, text
+from sqlalchemy.engine import Engine
+
+from rp_poetry import migrations
+from rp_poetry.models import Todo
+from rp_poetry.repository import MemoryTodoStore
+
+CHUNK_SIZE = 10_000
+
+# the columns of migration 1; the model's later ones are added after the load
+todo_v1 = table("todo", column("content"), column("status"))
+
+
+def seed_rows(start: int, stop: int) -> list[dict]:
+    return [{"content": f"Todo {i}", "status": i % 3 == 0} for i in range(start, stop)]
+
+
+def seed(engine: Engine, rows: int) -> None:
+    # recreate the table with exactly `rows` todos, ids 1..rows; the
+    # indexes are built after the load, as a real migration would
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS todo_fts"))
+        conn.execute(text("DROP TABLE IF EXISTS todo_tombstone"))
+        conn.execute(text("DROP TABLE IF EXISTS todo"))
+        conn.execute(text("DROP TABLE IF EXISTS schema_version"))
+    migrations.upgrade(engine, target=1)
+    with engine.begin() as conn:
+        for start in range(0, rows, CHUNK_SIZE):
+            conn.execute(insert(todo_v1), seed_rows(start, min(start + CHUNK_SIZE, rows)))
+    migrations.upgrade(engine)
+
+
+def seed_memory(rows: int) -> MemoryTodoStore:
+    # the same todos as seed(), ids 1..rows
+    return MemoryTodoStore(Todo(id=i + 1, **row) for i, row in enumerate(seed_rows(0, rows)))
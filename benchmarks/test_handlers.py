@@ -0,0 +1,44 @@
+import itertools
+
+import pytest
+from fastapi import Request, Response
+
+from rp_poetry.main import create_todo, delete_todo, get_todo, update_todo
+from rp_poetry.models import Todo, TodoUpdate, todo_list
+
+
+def test_list_page(benchmark, repository, table_size):
+    # a page from the middle of the table: the keyset seek plus serialization
+    response = benchmark(
+        get_todo, request=Request({"type": "http", "headers": []}), repository=repository, limit=100, after=str(table_size // 2),
+        stream=False, if_none_match=None,
+    )
+    assert response.status_code == 200
+
+
+def test_create(benchmark, repository, table_size):
+    todo = benchmark(lambda: create_todo(Todo(content="Benchmark"), repository=repository, response=Response()))
+    assert todo.id > table_size
+
+
+def test_update(benchmark, repository, table_size):
+    ids = itertools.cycle(range(1, table_size + 1, 7))
+    todo = benchmark(
+        lambda: update_todo(next(ids), TodoUpdate(status=True), repository=repository, response=Response())
+    )
+    assert todo.status is True
+
+
+def test_delete(benchmark, repository, table_size):
+    def setup():
+        todo = create_todo(Todo(content="Doomed"), repository=repository, response=Response())
+        return (todo.id,), {"repository": repository}
+
+    benchmark.pedantic(delete_todo, setup=setup, rounds=200)
+
+
+@pytest.mark.parametrize("items", [10, 1000, 10000])
+def test_serialize_list(benchmark, items):
+    todos = [Todo(id=i, content=f"Todo {i}", status=i % 2 == 0) for i in range(items)]
+    body = benchmark(todo_list.dump_json, todos)
+    assert body.startswith(b"[{")
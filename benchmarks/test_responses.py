@@ -0,0 +1,61 @@
+"""CPU cost of rendering a ``list[Todo]`` response.
+
+Each case is a GET through a FastAPI app called directly over ASGI, so the
+numbers cover response validation, encoding and the Response object but no
+sockets or database. To measure CPU time per request rather than wall time::
+
+    pytest benchmarks/test_responses.py --benchmark-timer=time.process_time
+"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from rp_poetry.models import Todo, todo_list
+from rp_poetry.responses import dump_response
+
+ENCODERS = ["json", "orjson", "direct"]
+
+
+def build_app(encoder: str, todos: list[Todo]) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse if encoder == "orjson" else JSONResponse)
+
+    # async so FastAPI validates the response inline instead of in a thread
+    @app.get("/todos", response_model=list[Todo])
+    async def get_todos():
+        if encoder == "direct":
+            return dump_response(todo_list, todos)
+        return todos
+
+    return app
+
+
+def request(app: FastAPI) -> bytes:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/todos", "raw_path": b"/todos",
+        "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message["body"])
+
+    asyncio.run(app(scope, receive, send))
+    return b"".join(body)
+
+
+@pytest.mark.parametrize("items", [10, 1000, 10000])
+@pytest.mark.parametrize("encoder", ENCODERS)
+def test_list_response(benchmark, encoder, items):
+    todos = [Todo(id=i, content=f"Todo {i}", status=i % 2 == 0) for i in range(items)]
+    app = build_app(encoder, todos)
+    benchmark.group = f"list[Todo] x {items}"
+    body = benchmark(request, app)
+    assert todo_list.validate_json(body) == todos
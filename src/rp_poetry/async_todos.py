@@ -0,0 +1,154 @@
+from typing import Optional, Annotated
+from sqlmodel.ext.asyncio.session import AsyncSession
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from rp_poetry import settings
+from rp_poetry.cache import etag_matches, todo_cache
+from rp_poetry.conditional import if_match_versions, list_etag, todo_etag
+from rp_poetry.db import get_async_read_session, get_async_session
+from rp_poetry.models import Todo, TodoBulkResult, TodoBulkUpdate, TodoCreate, TodoUpdate, todo_bulk_results, todo_list
+from rp_poetry import queries
+from rp_poetry.pagination import aiter_ndjson
+from rp_poetry.replicas import wrote_recently
+from rp_poetry.repository import SqlTodoRepository, TodoNotFound, TodoVersionMismatch, database_id
+from rp_poetry.responses import dump_response
+
+# Async twins of the Todo routes in main.py. They are mounted ahead of the
+# sync routes when DB_ASYNC is set, so requests wait on Postgres on the event
+# loop instead of holding one of the threadpool slots. Postgres only, and
+# only with the database backend: the core routes run SqlTodoRepository on
+# the async session's connection (run_sync), so both modes share its
+# statements.
+router = APIRouter()
+
+async def cache_call(func, *args):
+    # a network-backed cache must not block the event loop
+    if todo_cache.backend.blocking:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
+
+@router.post("/todos", response_model=Todo)
+async def create_todo(todo: TodoCreate, session: Annotated[AsyncSession, Depends(get_async_session)], response: Response):
+    todo = await session.run_sync(lambda sync_session: SqlTodoRepository(sync_session).create(todo))
+    await cache_call(todo_cache.invalidate)
+    response.headers["ETag"] = todo_etag(todo.version)
+    return todo
+
+@router.get("/todos", response_model=list[Todo])
+async def get_todo(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_async_read_session)],
+    primary: Annotated[AsyncSession, Depends(get_async_session)],
+    limit: Annotated[int, Query(ge=1, le=settings.TODO_MAX_PAGE_SIZE)] = settings.TODO_PAGE_SIZE,
+    after: Optional[str] = None,
+    status: Optional[bool] = None,
+    order_by: queries.TodoOrder = queries.TodoOrder.id,
+    include_total: bool = False,
+    stream: bool = False,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    try:
+        query = queries.list_todos(status, order_by, after)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    if stream:
+        return StreamingResponse(
+            aiter_ndjson(session.bind, query, settings.TODO_STREAM_BATCH_SIZE),
+            media_type="application/x-ndjson",
+        )
+    store_id = database_id(primary.bind)
+    key = f"{store_id}/todos?limit={limit}&after={after}&status={status}&order_by={order_by.value}"
+    generation = await cache_call(todo_cache.backend.generation)
+    page = None if wrote_recently(request) else await cache_call(todo_cache.get, key, generation)
+    # the same reads as the sync route, made by its repository on this session
+    response = None
+    if page is None and if_none_match:
+        etag = list_etag(await session.run_sync(lambda sync_session: SqlTodoRepository(sync_session, store_id).state_tag()))
+        if etag_matches(etag, if_none_match):
+            response = Response(status_code=304, headers={"ETag": etag})
+    if response is None:
+        if page is None:
+            todos, next_cursor, state_tag = await session.run_sync(
+                lambda sync_session: SqlTodoRepository(sync_session, store_id).list_page(status, order_by, after, limit)
+            )
+            page = await cache_call(
+                todo_cache.put, key, todo_list.dump_json(todos), next_cursor, generation, list_etag(state_tag)
+            )
+        response = page.to_response(if_none_match)
+    if include_total:
+        total, exact = await session.run_sync(
+            lambda sync_session: queries.count_todos(
+                sync_session.connection(), status, settings.TODO_COUNT_EXACT_MAX_ROWS
+            )
+        )
+        response.headers["X-Total-Count"] = str(total)
+        response.headers["X-Total-Count-Exact"] = str(exact).lower()
+    return response
+
+@router.post("/todos/bulk", response_model=list[Todo])
+async def create_todos(
+    todos: Annotated[list[TodoCreate], Body(min_length=1, max_length=settings.TODO_BULK_MAX_ITEMS)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+):
+    rows = (await session.exec(queries.bulk_insert(todos))).all()
+    await session.commit()
+    await cache_call(todo_cache.invalidate)
+    return dump_response(todo_list, queries.inserted_todos(rows))
+
+@router.patch("/todos/bulk", response_model=list[TodoBulkResult])
+async def update_todos(
+    todos: Annotated[list[TodoBulkUpdate], Body(min_length=1, max_length=settings.TODO_BULK_MAX_ITEMS)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+):
+    rows = (await session.exec(queries.bulk_update(todos, session.get_bind().dialect.name))).all()
+    await session.commit()
+    await cache_call(todo_cache.invalidate)
+    return dump_response(todo_bulk_results, queries.bulk_results([todo.id for todo in todos], rows))
+
+@router.delete("/todos/bulk", response_model=list[TodoBulkResult])
+async def delete_todos(
+    ids: Annotated[list[int], Body(min_length=1, max_length=settings.TODO_BULK_MAX_ITEMS)],
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+):
+    rows = (await session.exec(queries.bulk_delete(ids, session.get_bind().dialect.name))).all()
+    await session.commit()
+    await cache_call(todo_cache.invalidate)
+    return dump_response(todo_bulk_results, queries.bulk_results(ids, rows))
+
+@router.delete("/todos/{todo_id}", response_model=Todo)
+async def delete_todo(
+    todo_id: int,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    if_match: Annotated[Optional[str], Header()] = None,
+):
+    versions = if_match_versions(if_match)
+    try:
+        todo = await session.run_sync(lambda sync_session: SqlTodoRepository(sync_session).delete(todo_id, versions))
+    except TodoVersionMismatch:
+        raise HTTPException(status_code=412, detail="Todo has been modified")
+    except TodoNotFound:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    await cache_call(todo_cache.invalidate)
+    return todo
+
+@router.put("/todos/{todo_id}", response_model=Todo)
+async def update_todo(
+    todo_id: int,
+    todo: TodoUpdate,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    response: Response,
+    if_match: Annotated[Optional[str], Header()] = None,
+):
+    versions = if_match_versions(if_match)
+    try:
+        todo = await session.run_sync(
+            lambda sync_session: SqlTodoRepository(sync_session).update(todo_id, todo, versions)
+        )
+    except TodoVersionMismatch:
+        raise HTTPException(status_code=412, detail="Todo has been modified")
+    except TodoNotFound:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    await cache_call(todo_cache.invalidate)
+    response.headers["ETag"] = todo_etag(todo.version)
+    return todo
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from rp_poetry import queries
+from rp_poetry.cache import todo_cache
+from rp_poetry.conditional import todo_etag
+from rp_poetry.models import Todo, TodoCreate
+
+# Write-behind batching for POST /todos. Under a burst every create would
+# otherwise be its own transaction and its own WAL flush; here they wait in
+# a queue for at most a few milliseconds and go to the database together as
+# one multi-row INSERT ... RETURNING, each caller getting its own row back.
+# A caller is answered only after the batch has committed, so nothing is
+# acknowledged that could still be lost.
+
+Flush = Callable[[list[TodoCreate]], Awaitable[list[Todo]]]
+
+
+class BatchQueueFull(Exception):
+    pass
+
+
+class InsertBatcher:
+    def __init__(self, flush: Flush, max_size: int, max_delay: float, queue_size: int):
+        self.flush = flush
+        self.max_size = max_size
+        # seconds the first todo of a batch may wait for others to join it
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        # optional callback receiving (batch size, flush seconds), e.g. metrics
+        self.on_flush: Optional[Callable[[int, float], None]] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        # in the lifespan, so the queue and the task belong to the server's loop
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.create_task(self._run(), name="todo-insert-batcher")
+
+    async def stop(self) -> None:
+        # whatever is queued is still written before the engines go away
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, todo: TodoCreate) -> Todo:
+        """Queue one todo and wait for its row. Raises BatchQueueFull instead
+        of queueing without bound when the database cannot keep up."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((todo, future))
+        except asyncio.QueueFull:
+            raise BatchQueueFull() from None
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_size:
+                # take what is already waiting before sleeping on the queue
+                if not self._queue.empty():
+                    item = self._queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # one flush at a time: creates arriving meanwhile form the next batch
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[TodoCreate, asyncio.Future]]) -> None:
+        start = time.perf_counter()
+        try:
+            created = await self.flush([todo for todo, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            if self.on_flush is not None:
+                self.on_flush(len(batch), time.perf_counter() - start)
+        # RETURNING hands rows back in no promised order, but the ids of one
+        # INSERT come from the sequence in VALUES order
+        created = sorted(created, key=lambda todo: todo.id)
+        # a caller that went away has its future cancelled; its row stays
+        for (_, future), todo in zip(batch, created):
+            if not future.done():
+                future.set_result(todo)
+
+
+def sync_flush(engine: Engine) -> Flush:
+    def insert(todos: list[TodoCreate]) -> list[Todo]:
+        with Session(engine) as session:
+            rows = session.exec(queries.bulk_insert(todos)).all()
+            session.commit()
+        todo_cache.invalidate()
+        return queries.inserted_todos(rows)
+
+    async def flush(todos: list[TodoCreate]) -> list[Todo]:
+        return await run_in_threadpool(insert, todos)
+
+    return flush
+
+
+def async_flush(engine: AsyncEngine) -> Flush:
+    async def flush(todos: list[TodoCreate]) -> list[Todo]:
+        async with AsyncSession(engine) as session:
+            rows = (await session.exec(queries.bulk_insert(todos))).all()
+            await session.commit()
+        if todo_cache.backend.blocking:
+            await run_in_threadpool(todo_cache.invalidate)
+        else:
+            todo_cache.invalidate()
+        return queries.inserted_todos(rows)
+
+    return flush
+
+
+# Mounted ahead of the other todo routes when TODO_CREATE_BATCH_SIZE is set;
+# the lifespan puts the batcher on app.state.
+router = APIRouter()
+
+@router.post("/todos", response_model=Todo)
+async def create_todo(todo: TodoCreate, request: Request, response: Response):
+    try:
+        created = await request.app.state.todo_batcher.submit(todo)
+    except BatchQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending creates", headers={"Retry-After": "1"})
+    response.headers["ETag"] = todo_etag(created.version)
+    return created
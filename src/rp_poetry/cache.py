@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Protocol
+
+from fastapi import Response
+from rp_poetry import settings
+
+
+class CacheBackend(Protocol):
+    # True when the methods do network I/O, so async callers know to move
+    # them off the event loop
+    blocking: bool
+    evictions: int
+
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    def set(self, key: str, value: bytes) -> None: ...
+
+    def generation(self) -> int:
+        """Bumped by every invalidate(); ResponseCache keys entries by it,
+        so older entries are never read again."""
+
+    def invalidate(self) -> None: ...
+
+    def __len__(self) -> int: ...
+
+
+class LRUCache:
+    blocking = False
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._generation = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self) -> int:
+        return self._generation
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            # unreachable now; dropped to free the memory
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class NullCache:
+    blocking = False
+    evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes) -> None:
+        pass
+
+    def generation(self) -> int:
+        return 0
+
+    def invalidate(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+
+class RedisCache:
+    # Shared between workers, so a write on one worker invalidates them all:
+    # the generation is a Redis counter, one INCR per write, and the entries
+    # of older generations are left to expire. Works with anything speaking
+    # the Redis protocol (Valkey, KeyDB, ...).
+    blocking = True
+    evictions = 0
+
+    def __init__(self, url: str, ttl: float, prefix: str = "rp_poetry:todos:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self.client.set(self.prefix + key, value, px=int(self.ttl * 1000))
+
+    def generation(self) -> int:
+        return int(self.client.get(self.prefix + "generation") or 0)
+
+    def invalidate(self) -> None:
+        self.client.incr(self.prefix + "generation")
+
+    def __len__(self) -> int:
+        # every generation's entries still alive, for stats only
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*:*", count=500))
+
+
+def create_backend(url: str, maxsize: int, ttl: float) -> CacheBackend:
+    if url == "memory":
+        return LRUCache(maxsize, ttl)
+    if url == "off":
+        return NullCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, ttl)
+    raise ValueError(f"Unsupported cache backend: {url}")
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    next_cursor: str
+    body: bytes
+
+    def encode(self) -> bytes:
+        return b"\n".join((self.etag.encode(), self.next_cursor.encode(), self.body))
+
+    @classmethod
+    def decode(cls, value: bytes) -> "CachedResponse":
+        etag, next_cursor, body = value.split(b"\n", 2)
+        return cls(etag.decode(), next_cursor.decode(), body)
+
+    def to_response(self, if_none_match: Optional[str]) -> Response:
+        headers = {"ETag": self.etag} if self.etag else {}
+        if self.next_cursor:
+            headers["X-Next-Cursor"] = self.next_cursor
+        if self.etag and if_none_match and etag_matches(self.etag, if_none_match):
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+class ResponseCache:
+    # Read-through cache of serialized response bodies. Hits skip both the
+    # database and serialization, and so do revalidations (304) against a
+    # hit; writers call invalidate() after commit.
+    #
+    # Entries are keyed by the backend's generation, read before the page
+    # is: a reader that started before a write stores what it read under
+    # the generation the write ended, where nobody looks. With the memory
+    # backend each worker has its own generation, so a write on one worker
+    # leaves the others serving their pages for up to TODO_CACHE_TTL.
+    # Callers start keys with the repository's store_id: every app in the
+    # process shares this cache, whatever store it serves.
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return self.backend.generation()
+
+    def get(self, key: str, generation: int) -> Optional[CachedResponse]:
+        value = self.backend.get(f"{generation}:{key}")
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResponse.decode(value)
+
+    def put(self, key: str, body: bytes, next_cursor: str, generation: int, etag: str) -> CachedResponse:
+        # `etag` comes from the data's change counter rather than a hash of
+        # the body; a page without one is answered but not kept
+        entry = CachedResponse(etag, next_cursor, body)
+        if etag:
+            self.backend.set(f"{generation}:{key}", entry.encode())
+        return entry
+
+    def invalidate(self) -> None:
+        self.backend.invalidate()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+        }
+
+
+todo_cache = ResponseCache(
+    create_backend(settings.TODO_CACHE, settings.TODO_CACHE_MAX_ENTRIES, settings.TODO_CACHE_TTL)
+)
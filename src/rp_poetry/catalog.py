@@ -0,0 +1,118 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Generic, Mapping, Optional, TypeVar
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+M = TypeVar("M", bound=BaseModel)
+
+# A read-mostly catalog of pydantic models keyed by id. Every item is
+# validated once when the catalog is loaded and serialized once per
+# projection (a set of include/exclude options, as a route would pass to
+# response_model_include / response_model_exclude), so a lookup is one dict
+# access returning ready-made JSON bytes.
+#
+# Each load gets a strong ETag, so responses revalidate without comparing
+# bodies. A file's tag is its mtime; other catalogs are tagged with a hash
+# of what they serve. Either way every worker tags the same body alike.
+
+
+def snapshot_digest(snapshot: Mapping[str, Mapping[str, bytes]]) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(snapshot):
+        for item_id in sorted(snapshot[name]):
+            for part in (name.encode(), item_id.encode(), snapshot[name][item_id]):
+                # length-prefixed, so no two snapshots hash the same bytes
+                digest.update(len(part).to_bytes(8, "big") + part)
+    return digest.hexdigest()[:16]
+
+
+class Catalog(Generic[M]):
+    def __init__(self, model: type[M], projections: Mapping[str, Mapping[str, Any]]):
+        self.model = model
+        self.projections = dict(projections)
+        # {projection: {item_id: json bytes}}, replaced wholesale on reload
+        # so readers never see a half-built catalog and never take a lock
+        self._snapshot: dict[str, dict[str, bytes]] = {name: {} for name in self.projections}
+        self._models: dict[str, M] = {}
+        self.etag = ""
+        self.path: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def get(self, item_id: str, projection: str) -> Optional[bytes]:
+        return self._snapshot[projection].get(item_id)
+
+    def item(self, item_id: str) -> Optional[M]:
+        return self._models.get(item_id)
+
+    def load(self, raw: Mapping[str, Mapping[str, Any]], version: Optional[str] = None) -> None:
+        # raises pydantic.ValidationError and leaves the old catalog in place
+        models = {item_id: self.model.model_validate(item) for item_id, item in raw.items()}
+        snapshot = {
+            name: {item_id: item.model_dump_json(**options).encode() for item_id, item in models.items()}
+            for name, options in self.projections.items()
+        }
+        # the tag last: a reader taking it first never pairs a new tag
+        # with an old body
+        self._models, self._snapshot = models, snapshot
+        self.etag = f'"{version or snapshot_digest(snapshot)}"'
+
+    def load_file(self, path: str) -> None:
+        """Load a JSON object of {id: item} or a CSV file with an ``id`` column."""
+        stat = os.stat(path)
+        if path.endswith(".csv"):
+            with open(path, newline="") as f:
+                # empty cells fall back to the model's defaults
+                raw = {
+                    row.pop("id"): {key: value for key, value in row.items() if value != ""}
+                    for row in csv.DictReader(f)
+                }
+        else:
+            with open(path) as f:
+                raw = json.load(f)
+        self.load(raw, f"{stat.st_mtime_ns:x}")
+        self.path, self._mtime = path, stat.st_mtime
+
+    def reload_if_changed(self) -> bool:
+        if self.path is None:
+            return False
+        try:
+            if os.stat(self.path).st_mtime == self._mtime:
+                return False
+            self.load_file(self.path)
+        except Exception:
+            logger.exception("Could not reload catalog from %s, keeping the old one", self.path)
+            return False
+        return True
+
+    def watch(self, interval: float) -> None:
+        # polls the file's mtime from a daemon thread; reloads happen there,
+        # off the request path. Started and stopped by the app's lifespan.
+        if self._watcher is not None:
+            return
+
+        def run():
+            while not self._stopping.wait(interval):
+                self.reload_if_changed()
+
+        self._stopping.clear()
+        self._watcher = threading.Thread(target=run, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        if self._watcher is None:
+            return
+        self._stopping.set()
+        self._watcher.join()
+        self._watcher = None
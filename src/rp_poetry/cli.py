@@ -0,0 +1,156 @@
+"""Management commands, installed as the ``rp-poetry`` script::
+
+    rp-poetry migrate            # apply all pending migrations
+    rp-poetry migrate --to 3     # stop after version 3
+    rp-poetry migrate --list     # show applied and pending migrations
+    rp-poetry serve --workers 4 --db-connections 40
+    rp-poetry compact-tombstones # drop tombstones past their retention
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+
+from rp_poetry import migrations, settings, sync
+from rp_poetry.db import connection_url, make_engine
+
+
+def migrate(args: argparse.Namespace) -> int:
+    engine = make_engine(args.database_url or settings.DATABASE_URL)
+    try:
+        if args.list:
+            with engine.connect() as conn:
+                try:
+                    version = migrations.current_version(conn)
+                except DBAPIError:
+                    version = 0
+            for migration in migrations.MIGRATIONS:
+                state = "applied" if migration.version <= version else "pending"
+                print(f"{migration.version:>4}  {state:<8} {migration.name}")
+            return 0
+        applied = migrations.upgrade(engine, args.target)
+        for migration in applied:
+            print(f"applied {migration.version}: {migration.name}")
+        if not applied:
+            print("nothing to do")
+        return 0
+    finally:
+        engine.dispose()
+
+
+def compact_tombstones(args: argparse.Namespace) -> int:
+    engine = make_engine(args.database_url or settings.DATABASE_URL)
+    try:
+        with engine.begin() as conn:
+            removed = sync.compact_tombstones(conn, timedelta(days=args.older_than_days))
+        print(f"removed {removed} tombstones")
+        return 0
+    finally:
+        engine.dispose()
+
+
+def pool_budget(connections: int, workers: int, engines: int = 1, dedicated: int = 0) -> tuple[int, int]:
+    """Split a database connection budget into (pool_size, max_overflow)
+    for each engine of each worker, after the ``dedicated`` connections
+    each worker holds outside its pools; half of every share is kept open."""
+    share = (connections - workers * dedicated) // (workers * engines)
+    if share < 1:
+        raise ValueError(
+            f"{connections} connections cannot be shared by {workers} workers with {engines} engines each"
+        )
+    pool_size = max(1, share // 2)
+    return pool_size, share - pool_size
+
+
+def serve(args: argparse.Namespace) -> int:
+    import uvicorn
+
+    if args.migrate:
+        # once, here, rather than in every worker as DB_MIGRATE_ON_STARTUP would
+        engine = make_engine(settings.DATABASE_URL)
+        try:
+            migrations.upgrade(engine)
+        finally:
+            engine.dispose()
+
+    if args.db_connections and not settings.DB_PGBOUNCER:
+        # per database server: each replica gets pools of the same size
+        engines = 2 if settings.DB_ASYNC else 1
+        # the push source's LISTEN connection, see rp_poetry.events.listen
+        listens = make_url(connection_url(settings.DATABASE_URL)).get_backend_name() == "postgresql"
+        dedicated = 1 if settings.TODO_PUSH_ENABLED and listens else 0
+        pool_size, max_overflow = pool_budget(args.db_connections, args.workers, engines, dedicated)
+        # workers are spawned and read their settings from the environment;
+        # a single worker runs in this process and reads the module
+        os.environ["DB_POOL_SIZE"] = str(pool_size)
+        os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+        settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW = pool_size, max_overflow
+        print(
+            f"{args.workers} workers x {engines} engines: pool_size={pool_size} max_overflow={max_overflow}",
+            file=sys.stderr,
+        )
+
+    # Workers import the app themselves, and the engines are only built in
+    # the lifespan, so no pool ever crosses a process boundary. On SIGTERM
+    # uvicorn stops accepting, waits up to --graceful-timeout for in-flight
+    # requests and then runs the lifespan shutdown, which disposes the pools.
+    uvicorn.run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="rp-poetry", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_migrate = commands.add_parser("migrate", help="apply pending schema migrations")
+    parser_migrate.add_argument("--to", dest="target", type=int, default=None, help="last version to apply")
+    parser_migrate.add_argument("--list", action="store_true", help="show migrations and exit")
+    parser_migrate.add_argument("--database-url", default=None, help="defaults to DATABASE_URL")
+    parser_migrate.set_defaults(func=migrate)
+
+    parser_compact = commands.add_parser(
+        "compact-tombstones", help="delete tombstones of todos deleted long ago"
+    )
+    parser_compact.add_argument(
+        "--older-than-days", type=float, default=settings.TODO_TOMBSTONE_RETENTION_DAYS,
+        help="defaults to TODO_TOMBSTONE_RETENTION_DAYS",
+    )
+    parser_compact.add_argument("--database-url", default=None, help="defaults to DATABASE_URL")
+    parser_compact.set_defaults(func=compact_tombstones)
+
+    parser_serve = commands.add_parser("serve", help="run the API with uvicorn")
+    parser_serve.add_argument("--app", default="rp_poetry.main:app")
+    parser_serve.add_argument("--host", default=settings.HOST)
+    parser_serve.add_argument("--port", type=int, default=settings.PORT)
+    parser_serve.add_argument("--workers", type=int, default=settings.WEB_CONCURRENCY)
+    parser_serve.add_argument(
+        "--db-connections", type=int, default=settings.DB_MAX_CONNECTIONS,
+        help="database connections for all workers together; 0 keeps DB_POOL_SIZE and DB_MAX_OVERFLOW per worker",
+    )
+    parser_serve.add_argument("--loop", choices=("auto", "asyncio", "uvloop"), default="auto")
+    parser_serve.add_argument("--http", choices=("auto", "h11", "httptools"), default="auto")
+    parser_serve.add_argument(
+        "--graceful-timeout", type=int, default=settings.GRACEFUL_TIMEOUT,
+        help="seconds to let in-flight requests finish on SIGTERM",
+    )
+    parser_serve.add_argument("--migrate", action="store_true", help="apply pending migrations first")
+    parser_serve.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import zlib
+from typing import Any, Callable, Mapping, Optional, Protocol, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Response compression negotiated from Accept-Encoding, for the JSON and
+# NDJSON the APIs send (COMPRESSION_ENCODINGS). Bodies under
+# COMPRESSION_MIN_SIZE go out as they are: a few hundred bytes gain little
+# and cost a compressor. Streamed bodies are compressed chunk by chunk, each
+# flushed so the client is not kept waiting for the next one.
+#
+# Compressing 100 KB takes milliseconds, long enough to hold up every other
+# request on the event loop, so bodies and chunks of at least
+# COMPRESSION_THREADPOOL_MIN_SIZE are compressed in the threadpool.
+#
+# A compressed response is a different representation with its own strong
+# ETag: "tag" becomes "tag-gzip". The suffix is taken off If-None-Match
+# before the routes compare it, and put back on the 304.
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress ``data`` and flush; ``final`` ends the stream."""
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        import zstandard
+
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        self._flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._finish = zstandard.COMPRESSOBJ_FLUSH_FINISH
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(self._finish if final else self._flush)
+
+
+COMPRESSORS: dict[str, type] = {"gzip": GzipCompressor, "br": BrotliCompressor, "zstd": ZstdCompressor}
+
+
+def compressors(encodings: Sequence[str], levels: Mapping[str, int]) -> dict[str, Callable[[], Compressor]]:
+    """A factory per encoding, in order of preference. Builds one of each
+    so an unknown encoding or a missing extra (brotli, zstandard) fails at
+    startup, not on the first request."""
+    factories = {}
+    for encoding in encodings:
+        if encoding not in COMPRESSORS:
+            raise ValueError(f"Unsupported compression encoding: {encoding!r}")
+        factory = lambda compressor=COMPRESSORS[encoding], level=levels[encoding]: compressor(level)  # noqa: E731
+        factory()
+        factories[encoding] = factory
+    return factories
+
+
+def middleware_options(settings) -> dict[str, Any]:
+    levels = {
+        "gzip": settings.COMPRESSION_GZIP_LEVEL,
+        "br": settings.COMPRESSION_BROTLI_LEVEL,
+        "zstd": settings.COMPRESSION_ZSTD_LEVEL,
+    }
+    return {
+        "encodings": compressors(list(settings.COMPRESSION_ENCODINGS), levels),
+        "min_size": settings.COMPRESSION_MIN_SIZE,
+        "threadpool_min_size": settings.COMPRESSION_THREADPOOL_MIN_SIZE,
+    }
+
+
+def negotiate(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    # the first of ours the client accepts at all; clients rank codings
+    # they support about equally, while ours are ordered by what they cost
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compressible(content_type: str) -> bool:
+    media_type = content_type.partition(";")[0].strip().lower()
+    # not event streams, whose every event has to reach the client as sent
+    if media_type == "text/event-stream":
+        return False
+    return media_type in ("application/json", "application/x-ndjson") or media_type.startswith("text/")
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    return etag[:-1] + f'-{encoding}"' if etag.endswith('"') else etag
+
+
+def decoded_etags(if_none_match: str, encodings: Sequence[str]) -> str:
+    suffixes = tuple(f'-{encoding}"' for encoding in encodings)
+    tags = []
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        for suffix in suffixes:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+                break
+        tags.append(tag)
+    return ", ".join(tags)
+
+
+class CompressionMiddleware:
+    # Plain ASGI like MetricsMiddleware; Starlette's GZipMiddleware only
+    # speaks gzip, compresses on the event loop and keeps strong ETags as
+    # they are.
+    def __init__(
+        self,
+        app: ASGIApp,
+        encodings: Mapping[str, Callable[[], Compressor]],
+        min_size: int,
+        threadpool_min_size: int,
+    ):
+        self.app = app
+        self.encodings = encodings
+        self.min_size = min_size
+        self.threadpool_min_size = threadpool_min_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        encoding = negotiate(headers.get("accept-encoding", ""), list(self.encodings))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        revalidating = False
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            decoded = decoded_etags(if_none_match, list(self.encodings))
+            if decoded != if_none_match:
+                revalidating = True
+                # in place, not in a copy: the router leaves the matched
+                # route in this scope for the metrics and profiler outside
+                scope["headers"] = [
+                    *((name, value) for name, value in scope["headers"] if name != b"if-none-match"),
+                    (b"if-none-match", decoded.encode("latin-1")),
+                ]
+
+        # the start message is held back until the first body chunk shows
+        # whether the response is worth compressing
+        start: Optional[Message] = None
+        compressor: Optional[Compressor] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", []))
+                response_headers = MutableHeaders(raw=message["headers"])
+                status = message["status"]
+                if status == 304 and revalidating and "etag" in response_headers:
+                    response_headers["ETag"] = encoded_etag(response_headers["etag"], encoding)
+                if (
+                    status in (204, 206, 304)
+                    or "content-encoding" in response_headers
+                    or not compressible(response_headers.get("content-type", ""))
+                ):
+                    await send(message)
+                    return
+                response_headers.add_vary_header("Accept-Encoding")
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.min_size:
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                response_headers = MutableHeaders(raw=start["headers"])
+                response_headers["Content-Encoding"] = encoding
+                if "etag" in response_headers:
+                    response_headers["ETag"] = encoded_etag(response_headers["etag"], encoding)
+                del response_headers["content-length"]
+                compressor = self.encodings[encoding]()
+                data = await self.compress(compressor, body, not more_body)
+                if not more_body:
+                    response_headers["Content-Length"] = str(len(data))
+                await send(start)
+            else:
+                data = await self.compress(compressor, body, not more_body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def compress(self, compressor: Compressor, data: bytes, final: bool) -> bytes:
+        if len(data) >= self.threadpool_min_size:
+            return await run_in_threadpool(compressor.compress, data, final)
+        return compressor.compress(data, final)
@@ -0,0 +1,31 @@
+from typing import Optional
+
+# Optimistic concurrency for single todos: a todo's ETag is its version,
+# and PUT/DELETE with If-Match only apply while the version still matches,
+# checked by the write statement itself rather than a prior SELECT.
+#
+# A page of GET /todos is tagged with the repository's state_tag() instead,
+# which changes with every write to the table.
+
+
+def todo_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def list_etag(state_tag: str) -> str:
+    # "" when the page's state could not be told: no ETag
+    return f'"todos-{state_tag}"' if state_tag else ""
+
+
+def if_match_versions(if_match: Optional[str]) -> Optional[list[int]]:
+    """The versions an If-Match header accepts, or None when any will do (no
+    header, or ``*``). Weak and foreign tags never match, so a header made
+    of only those gives [] and the write fails."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
@@ -0,0 +1,249 @@
+import os
+import time
+from typing import Annotated, Any, Callable, Optional
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from starlette.datastructures import Secret
+from rp_poetry import settings
+from rp_poetry.replicas import ReplicaSet, wrote_recently
+
+
+class WaitCountingPool:
+    # Counts checkouts that found the pool exhausted and had to block for a
+    # connection to be returned, which is what "the pool is the bottleneck"
+    # looks like from the inside.
+    waits = 0
+    wait_seconds = 0.0
+    timeouts = 0
+    # callbacks receiving each wait in seconds, e.g. a histogram
+    wait_listeners: list[Callable[[float], None]] = []
+
+    def _do_get(self):
+        exhausted = (
+            self._max_overflow > -1
+            and self._overflow >= self._max_overflow
+            and self._pool.empty()
+        )
+        if not exhausted:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.waits += 1
+            self.wait_seconds += elapsed
+            for listener in self.wait_listeners:
+                listener(elapsed)
+
+
+class WaitCountingQueuePool(WaitCountingPool, QueuePool):
+    pass
+
+
+class WaitCountingAsyncPool(WaitCountingPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def connection_url(url: str | Secret) -> str:
+    # only needed for psycopg 3 - replace postgresql
+    # with postgresql+psycopg in settings.DATABASE_URL
+    url = str(url)
+    for scheme in ("postgresql://", "postgres://"):
+        if url.startswith(scheme):
+            return "postgresql+psycopg://" + url[len(scheme):]
+    return url
+
+
+def engine_options(url: str, async_: bool = False) -> dict[str, Any]:
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    connect_args: dict[str, Any] = {"sslmode": settings.DB_SSLMODE}
+    if settings.DB_STATEMENT_TIMEOUT:
+        # a startup parameter; behind PgBouncer it needs
+        # ignore_startup_parameters = options or it will refuse the connection
+        connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT}"
+    if settings.DB_PGBOUNCER:
+        # PgBouncer in transaction mode already pools connections, and a
+        # server-side prepared statement may land on a different backend
+        connect_args["prepare_threshold"] = None
+        return {"connect_args": connect_args, "poolclass": NullPool}
+    return {
+        "connect_args": connect_args,
+        "poolclass": WaitCountingAsyncPool if async_ else WaitCountingQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+# Set on every SQLite connection. WAL lets readers carry on while a write
+# commits instead of waiting on it; with WAL, synchronous=NORMAL only syncs
+# at checkpoints, so a power cut can lose the last commits but not corrupt
+# the file. A writer waits up to busy_timeout for another to finish rather
+# than failing at once with "database is locked".
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "busy_timeout=5000",
+    "foreign_keys=ON",
+    "temp_store=MEMORY",
+    # KiB when negative: 64 MiB of page cache per connection
+    "cache_size=-65536",
+    "mmap_size=268435456",
+)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def make_engine(url: str | Secret) -> Engine:
+    url = connection_url(url)
+    engine = create_engine(url, **engine_options(url))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def make_async_engine(url: str | Secret) -> AsyncEngine:
+    # psycopg 3 ships its own asyncio driver, so the same URL works for both
+    # engines; pysqlite has none, so async mode is Postgres only
+    url = connection_url(url)
+    if make_url(url).get_backend_name() != "postgresql":
+        raise ValueError("DB_ASYNC needs a Postgres database URL")
+    return create_async_engine(url, **engine_options(url, async_=True))
+
+
+def pool_stats(pool: Pool) -> dict[str, Any]:
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # SQLAlchemy counts overflow from -size; only report real extras
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+        "waits": getattr(pool, "waits", 0),
+        "wait_seconds": getattr(pool, "wait_seconds", 0.0),
+        "timeouts": getattr(pool, "timeouts", 0),
+    }
+
+
+# Built on first use instead of at import: importing the app must not open
+# a pool or touch the network.
+engine: Optional[Engine] = None
+
+async_engine: Optional[AsyncEngine] = None
+
+replicas: Optional[ReplicaSet[Engine]] = None
+
+async_replicas: Optional[ReplicaSet[AsyncEngine]] = None
+
+def get_engine() -> Engine:
+    global engine
+    if engine is None:
+        engine = make_engine(settings.DATABASE_URL)
+    return engine
+
+def get_async_engine() -> Optional[AsyncEngine]:
+    global async_engine
+    if async_engine is None and settings.DB_ASYNC:
+        async_engine = make_async_engine(settings.DATABASE_URL)
+    return async_engine
+
+def get_replicas() -> Optional[ReplicaSet[Engine]]:
+    global replicas
+    if replicas is None and settings.DATABASE_REPLICA_URLS:
+        replicas = ReplicaSet(
+            [make_engine(url) for url in settings.DATABASE_REPLICA_URLS], settings.DB_REPLICA_POLICY
+        )
+    return replicas
+
+def get_async_replicas() -> Optional[ReplicaSet[AsyncEngine]]:
+    global async_replicas
+    if async_replicas is None and settings.DATABASE_REPLICA_URLS and settings.DB_ASYNC:
+        async_replicas = ReplicaSet(
+            [make_async_engine(url) for url in settings.DATABASE_REPLICA_URLS], settings.DB_REPLICA_POLICY
+        )
+    return async_replicas
+
+def worker_engines() -> list[Engine]:
+    """Every engine this worker opens, primary and replicas, sync and
+    async, built if need be. Async engines are given as their sync_engine,
+    where their events fire."""
+    binds = [get_engine(), get_async_engine()]
+    for replica_set in (get_replicas(), get_async_replicas()):
+        if replica_set is not None:
+            binds += replica_set.engines
+    return [getattr(bind, "sync_engine", bind) for bind in binds if bind is not None]
+
+def reset_engines_after_fork():
+    # A pool inherited through fork() shares its sockets with the parent.
+    # The child starts over with fresh engines, leaving the parent's
+    # connections open for the parent (gunicorn --preload and friends).
+    global engine, async_engine, replicas, async_replicas
+    for bind in (engine, *(replicas.engines if replicas else ())):
+        if bind is not None:
+            bind.dispose(close=False)
+    for bind in (async_engine, *(async_replicas.engines if async_replicas else ())):
+        if bind is not None:
+            bind.sync_engine.dispose(close=False)
+    engine = async_engine = replicas = async_replicas = None
+
+os.register_at_fork(after_in_child=reset_engines_after_fork)
+
+async def dispose_engines():
+    global engine, async_engine, replicas, async_replicas
+    for bind in (async_engine, *(async_replicas.engines if async_replicas else ())):
+        if bind is not None:
+            await bind.dispose()
+    for bind in (engine, *(replicas.engines if replicas else ())):
+        if bind is not None:
+            bind.dispose()
+    engine = async_engine = replicas = async_replicas = None
+
+def get_session():
+    with Session(get_engine()) as session:
+        yield session
+
+async def get_async_session():
+    # nothing may lazy-load after a commit in async code, so keep loaded state
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+# For routes that only read. The primary's session is still built so that
+# overriding get_session (as the tests do) covers these routes too; it
+# costs nothing until it is used.
+def get_read_session(request: Request, session: Annotated[Session, Depends(get_session)]):
+    replica_set = get_replicas()
+    if replica_set is None or wrote_recently(request):
+        yield session
+        return
+    with Session(replica_set.choose()) as replica_session:
+        yield replica_session
+
+async def get_async_read_session(
+    request: Request, session: Annotated[AsyncSession, Depends(get_async_session)]
+):
+    replica_set = get_async_replicas()
+    if replica_set is None or wrote_recently(request):
+        yield session
+        return
+    async with AsyncSession(replica_set.choose(), expire_on_commit=False) as replica_session:
+        yield replica_session
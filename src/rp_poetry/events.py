@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+from sqlalchemy.engine import URL, Engine
+
+from rp_poetry import settings, sync
+
+logger = logging.getLogger(__name__)
+
+# Push of todo changes to connected clients, GET /todos/stream (SSE) and
+# /todos/ws (WebSocket). Each event is a small JSON object,
+# {"type": "created" | "updated" | "deleted", "id": ..., "version": ...};
+# clients fetch the todos themselves with GET /todos/changes.
+#
+# One task per worker feeds a Broadcaster, which copies every event into a
+# bounded queue per connection. On Postgres the task LISTENs for the
+# notifications a trigger sends when a todo changes (migration 10), so
+# writes on every worker reach every worker, delivered when they commit.
+# Elsewhere it polls sync.changes().
+#
+# A connection whose queue is full is evicted rather than allowed to hold
+# back the others or grow without bound; it is told so and can reconnect
+# and catch up through GET /todos/changes.
+
+CHANNEL = "todo_changes"
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, buffer: int):
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue(buffer)
+        self.evicted = False
+
+    async def get(self, timeout: float) -> Optional[str]:
+        """The next event, "" when ``timeout`` passed without one, or None
+        once evicted."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return ""
+
+
+class Broadcaster:
+    def __init__(self, buffer: int, max_subscribers: int):
+        self.buffer = buffer
+        self.max_subscribers = max_subscribers
+        self.subscribers: set[Subscription] = set()
+        self.published = 0
+        self.evictions = 0
+        # whether the source is following changes right now
+        self.connected = False
+        # called with "subscribed", "unsubscribed", "published" or "evicted";
+        # set by metrics.instrument_broadcaster
+        self.on_event: Optional[Callable[[str], None]] = None
+
+    def subscribe(self) -> Subscription:
+        if self.max_subscribers and len(self.subscribers) >= self.max_subscribers:
+            raise TooManySubscribers()
+        subscription = Subscription(self.buffer)
+        self.subscribers.add(subscription)
+        self._event("subscribed")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self.subscribers:
+            self.subscribers.remove(subscription)
+            self._event("unsubscribed")
+
+    def _event(self, name: str) -> None:
+        if self.on_event is not None:
+            self.on_event(name)
+
+    def publish(self, event: str) -> None:
+        # called on the event loop; never waits on a subscriber
+        self.published += 1
+        self._event("published")
+        for subscription in list(self.subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.evict(subscription)
+
+    def evict(self, subscription: Subscription) -> None:
+        self.evictions += 1
+        self._event("evicted")
+        self.unsubscribe(subscription)
+        subscription.evicted = True
+        # drop the backlog, the client resyncs anyway, and wake the reader
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "connected": int(self.connected),
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "evictions": self.evictions,
+        }
+
+
+async def listen(broadcaster: Broadcaster, url: URL, retry: float = 1.0) -> None:
+    # a connection of its own outside the pool, sitting in LISTEN for the
+    # life of the worker; it has to reach Postgres directly, LISTEN does not
+    # work through PgBouncer in transaction mode
+    import psycopg
+
+    conninfo = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                conninfo, autocommit=True, sslmode=settings.DB_SSLMODE
+            ) as conn:
+                await conn.execute(f"LISTEN {CHANNEL}")
+                broadcaster.connected = True
+                async for notify in conn.notifies():
+                    broadcaster.publish(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            broadcaster.connected = False
+            # changes made while reconnecting are not pushed; clients that
+            # care catch up with GET /todos/changes
+            logger.exception("Lost the %s listener, reconnecting in %.0fs", CHANNEL, retry)
+            await asyncio.sleep(retry)
+
+
+async def poll(broadcaster: Broadcaster, engine: Engine, interval: float) -> None:
+    lag = timedelta(milliseconds=settings.TODO_SYNC_LAG_MS)
+    retention = timedelta(days=settings.TODO_TOMBSTONE_RETENTION_DAYS)
+
+    def read(cursor: Optional[str]):
+        with engine.connect() as conn:
+            if cursor is None:
+                return [], sync.head_cursor(conn, lag)
+            events, has_more = [], True
+            while has_more:
+                page = sync.changes(conn, cursor, settings.TODO_MAX_PAGE_SIZE, lag, retention)
+                events += [
+                    {"type": "created" if todo.version == 1 else "updated", "id": todo.id, "version": todo.version}
+                    for todo in page.todos
+                ]
+                events += [{"type": "deleted", "id": todo_id} for todo_id in page.deleted]
+                cursor, has_more = page.cursor, page.has_more
+            return events, cursor
+
+    cursor = None
+    while True:
+        try:
+            events, cursor = await run_in_threadpool(read, cursor)
+        except Exception:
+            broadcaster.connected = False
+            logger.exception("Could not poll for todo changes")
+        else:
+            broadcaster.connected = True
+            for event in events:
+                broadcaster.publish(json.dumps(event))
+        await asyncio.sleep(interval)
+
+
+def start_source(broadcaster: Broadcaster, engine: Engine) -> asyncio.Task:
+    if engine.dialect.name == "postgresql":
+        source = listen(broadcaster, engine.url)
+    else:
+        source = poll(broadcaster, engine, settings.TODO_PUSH_POLL_INTERVAL)
+    return asyncio.create_task(source, name="todo-change-source")
+
+
+# Mounted when TODO_PUSH_ENABLED is set; the lifespan puts the broadcaster
+# on app.state and starts its source. A stream stays open until the client
+# leaves, so on shutdown the server's graceful timeout is what ends them.
+router = APIRouter()
+
+async def sse_events(broadcaster: Broadcaster, subscription: Subscription) -> AsyncIterator[bytes]:
+    try:
+        yield b": connected\n\n"
+        while True:
+            event = await subscription.get(settings.TODO_PUSH_HEARTBEAT)
+            if event is None:
+                yield b'event: evicted\ndata: {"reason": "slow consumer"}\n\n'
+                return
+            if event == "":
+                # a comment line keeps proxies from closing an idle stream
+                yield b": keepalive\n\n"
+            else:
+                yield b"data: " + event.encode() + b"\n\n"
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+class EventStreamResponse(StreamingResponse):
+    # The body's own finally only runs once the body has started; a client
+    # gone before that would keep its subscription, and its slot under
+    # max_subscribers, for good. The response releases it however it ends.
+    def __init__(self, broadcaster: Broadcaster, subscription: Subscription):
+        super().__init__(
+            sse_events(broadcaster, subscription),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.broadcaster = broadcaster
+        self.subscription = subscription
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.broadcaster.unsubscribe(self.subscription)
+
+@router.get("/todos/stream")
+async def stream_todos(request: Request):
+    broadcaster = request.app.state.todo_broadcaster
+    try:
+        subscription = broadcaster.subscribe()
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many subscribers", headers={"Retry-After": "5"})
+    return EventStreamResponse(broadcaster, subscription)
+
+@router.websocket("/todos/ws")
+async def websocket_todos(websocket: WebSocket):
+    broadcaster = websocket.app.state.todo_broadcaster
+    try:
+        subscription = broadcaster.subscribe()
+    except TooManySubscribers:
+        # 1013: try again later
+        await websocket.close(code=1013, reason="too many subscribers")
+        return
+    await websocket.accept()
+
+    async def send():
+        while True:
+            event = await subscription.get(settings.TODO_PUSH_HEARTBEAT)
+            if event is None:
+                await websocket.close(code=1013, reason="slow consumer")
+                return
+            if event:
+                await websocket.send_text(event)
+
+    async def receive():
+        # nothing is expected from the client; this notices it leaving
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        broadcaster.unsubscribe(subscription)
@@ -2,8 +2,14 @@
 from contextlib import asynccontextmanager
 from typing import Union, Optional, Annotated
 from rp_poetry import settings
-from sqlmodel import Field, Session, SQLModel, create_engine, select
-from fastapi import FastAPI, Depends, Body
+from sqlmodel import Field, Session, SQLModel, select
+from fastapi import FastAPI, Depends, Body, Query
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from rp_poetry.compression import CompressionMiddleware, middleware_options
+from rp_poetry.db import make_engine
+from rp_poetry.pagination import iter_ndjson, keyset
+from rp_poetry.responses import default_response_class, dump_response
 
 
 class Todo(SQLModel, table=True):
@@ -11,18 +17,10 @@ class Todo(SQLModel, table=True):
     content: str = Field(index=True)
 
 
-# only needed for psycopg 3 - replace postgresql
-# with postgresql+psycopg in settings.DATABASE_URL
-connection_string = str(settings.DATABASE_URL).replace(
-    "postgresql", "postgresql+psycopg"
-)
-
+todo_list = TypeAdapter(list[Todo])
 
-# recycle connections after 5 minutes
-# to correspond with the compute scale down
-engine = create_engine(
-    connection_string, connect_args={"sslmode": "require"}, pool_recycle=300
-)
+# created by the lifespan, so importing this module does not connect
+engine = None
 
 
 def create_db_and_tables():
@@ -34,12 +32,20 @@ def create_db_and_tables():
 # https://fastapi.tiangolo.com/advanced/events/#lifespan-function
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global engine
     print("Creating tables..")
+    engine = make_engine(settings.DATABASE_URL)
     create_db_and_tables()
+    if settings.ITEMS_CATALOG_PATH:
+        item_catalog.load_file(settings.ITEMS_CATALOG_PATH)
+        item_catalog.watch(settings.ITEMS_CATALOG_RELOAD_INTERVAL)
     yield
+    item_catalog.stop()
+    engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan, title="Hello World API with DB", 
+    default_response_class=default_response_class(),
     version="0.0.1",
     servers=[
         {
@@ -48,6 +54,9 @@ app = FastAPI(lifespan=lifespan, title="Hello World API with DB",
         }
         ])
 
+if settings.COMPRESSION_ENCODINGS:
+    app.add_middleware(CompressionMiddleware, **middleware_options(settings))
+
 def get_session():
     with Session(engine) as session:
         yield session
@@ -66,9 +75,21 @@ def create_todo(todo: Todo, session: Annotated[Session, Depends(get_session)]):
 
 
 @app.get("/todos/", response_model=list[Todo])
-def read_todos(session: Annotated[Session, Depends(get_session)]):
-        todos = session.exec(select(Todo)).all()
-        return todos
+def read_todos(
+    session: Annotated[Session, Depends(get_session)],
+    limit: Annotated[int, Query(ge=1, le=settings.TODO_MAX_PAGE_SIZE)] = settings.TODO_PAGE_SIZE,
+    after: Optional[int] = None,
+    stream: bool = False,
+):
+        query = keyset(select(Todo), Todo.id, after)
+        if stream:
+            return StreamingResponse(
+                iter_ndjson(session.get_bind(), query, settings.TODO_STREAM_BATCH_SIZE),
+                media_type="application/x-ndjson",
+            )
+        todos = session.exec(query.limit(limit)).all()
+        headers = {"X-Next-Cursor": str(todos[-1].id)} if len(todos) == limit else None
+        return dump_response(todo_list, todos, headers)
 
 # @fastapp.get("/users/me")
 # def read_user():
@@ -497,17 +518,17 @@ class Item(BaseModel):
     tags: list[str] = []
 
 
-@app.post("/items/")
-async def create_item(item: Item) -> Item:
-    return item
+# @app.post("/items/")
+# async def create_item(item: Item) -> Item:
+#     return item
 
 
-@app.get("/items/")
-async def list_read_items() -> list[Item]:
-    return [
-        Item(name="Portal Gun", price=42.0),
-        Item(name="Plumbus", price=32.0),
-    ]
+# @app.get("/items/")
+# async def list_read_items() -> list[Item]:
+#     return [
+#         Item(name="Portal Gun", price=42.0),
+#         Item(name="Plumbus", price=32.0),
+#     ]
 
 from typing import Any
 from pydantic import BaseModel, EmailStr
@@ -547,7 +568,7 @@ async def create_user(user: UserIn) -> BaseUser:
 from fastapi import FastAPI, Response
 from fastapi.responses import JSONResponse, RedirectResponse
 
-app = FastAPI()
+# app = FastAPI()  # one app for the whole file, created at the top
 
 # @app.get("/portal")
 # async def get_portal(teleport: bool = False) -> Response:
@@ -567,10 +588,12 @@ async def get_portal(teleport: bool = False) -> Response | dict:
         return RedirectResponse(url="https://www.youtube.com/watch?v=dQw4w9WgXcQ")
     return {"message": "Here's your interdimensional portal."}
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
+from rp_poetry.cache import etag_matches
+from rp_poetry.catalog import Catalog
 
-app = FastAPI()
+# app = FastAPI()  # one app for the whole file, created at the top
 
 # class Item(BaseModel):
 #     name: str
@@ -611,18 +634,40 @@ items = {
 }
 
 
+# Validated and serialized once per projection; the routes below hand out
+# the stored bytes. response_model and its include/exclude stay on the
+# routes to document the shape.
+item_catalog = Catalog(Item, {
+    "full": {},
+    "name": {"include": {"name", "description"}},
+    "public": {"exclude": {"tax"}},
+})
+# the built-in items until the lifespan loads ITEMS_CATALOG_PATH
+item_catalog.load(items)
+
+
+def catalog_response(item_id: str, projection: str, if_none_match: Optional[str]) -> Response:
+    etag = item_catalog.etag
+    body = item_catalog.get(item_id, projection)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if if_none_match and etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
 @app.get(
     "/items/{item_id}/name",
     response_model=Item,
     response_model_include={"name", "description"},
 )
-async def read_item_name(item_id: str):
-    return items[item_id]
+async def read_item_name(item_id: str, if_none_match: Annotated[Optional[str], Header()] = None):
+    return catalog_response(item_id, "name", if_none_match)
 
 
 @app.get("/items/{item_id}/public", response_model=Item, response_model_exclude={"tax"})
-async def read_item_public_data(item_id: str):
-    return items[item_id]
+async def read_item_public_data(item_id: str, if_none_match: Annotated[Optional[str], Header()] = None):
+    return catalog_response(item_id, "public", if_none_match)
 
 
 from fastapi import File, UploadFile
@@ -689,19 +734,52 @@ from fastapi import File, UploadFile
 # </body>
 #     """
 #     return HTMLResponse(content=content)
-from fastapi import FastAPI, File, Form, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from rp_poetry.uploads import stream_upload
 
-@app.post("/files/")
-async def create_file(
-    file: Annotated[bytes, File()],
-    fileb: Annotated[UploadFile, File()],
-    token: Annotated[str, Form()],
-):
-    return {
-        "file_size": len(file),
-        "token": token,
-        "fileb_content_type": fileb.content_type,
-    }
+# @app.post("/files/")
+# async def create_file(
+#     file: Annotated[bytes, File()],
+#     fileb: Annotated[UploadFile, File()],
+#     token: Annotated[str, Form()],
+# ):
+#     return {
+#         "file_size": len(file),
+#         "token": token,
+#         "fileb_content_type": fileb.content_type,
+#     }
+
+# Same form as above, but the body is read by stream_upload() instead of
+# FastAPI's form parsing, so the request body schema is spelled out by hand.
+@app.post("/files/", openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["file", "fileb", "token"],
+    "properties": {
+        "file": {"type": "string", "format": "binary"},
+        "fileb": {"type": "string", "format": "binary"},
+        "token": {"type": "string"},
+    },
+}}}}})
+async def create_file(request: Request):
+    form = await stream_upload(
+        request, settings.UPLOAD_DIR, settings.UPLOAD_CHUNK_SIZE, settings.UPLOAD_MAX_SIZE
+    )
+    try:
+        missing = [name for name in ("file", "fileb") if name not in form.files]
+        missing += [name for name in ("token",) if name not in form.fields]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Missing form fields: {', '.join(missing)}")
+        file, fileb = form.files["file"], form.files["fileb"]
+        return {
+            "file_size": file.size,
+            "file_sha256": file.sha256,
+            "token": form.fields["token"],
+            "fileb_content_type": fileb.content_type,
+        }
+    finally:
+        # only the sizes and digests are kept
+        await run_in_threadpool(form.remove_files)
 
 # from fastapi import FastAPI, Request
 # from fastapi.responses import JSONResponse
@@ -752,7 +830,7 @@ from enum import Enum
 
 from fastapi import FastAPI
 
-app = FastAPI()
+# app = FastAPI()  # one app for the whole file, created at the top
 
 
 class Tags(Enum):
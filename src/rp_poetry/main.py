@@ -1,89 +1,420 @@
 from contextlib import asynccontextmanager
+from datetime import timedelta
 from typing import Optional, Union, Annotated
-from sqlmodel import SQLModel, create_engine, Session, select, Field
-from fastapi import FastAPI, Depends, HTTPException
+from sqlalchemy.engine import make_url
+from sqlmodel import Session
+from fastapi import APIRouter, FastAPI, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from rp_poetry import settings
+from rp_poetry.cache import etag_matches, todo_cache
+from rp_poetry import db
+from rp_poetry.db import dispose_engines, get_async_engine, get_engine, get_read_session, get_replicas, get_session, pool_stats
+from rp_poetry import migrations
+from rp_poetry.conditional import if_match_versions, list_etag, todo_etag
+from rp_poetry.models import Todo, TodoBulkResult, TodoBulkUpdate, TodoChanges, TodoCreate, TodoUpdate, todo_bulk_results, todo_changes, todo_list
+from rp_poetry import queries
+from rp_poetry.repository import (
+    MemoryTodoStore, TodoNotFound, TodoRepository, TodoVersionMismatch, get_read_todo_repository,
+    get_todo_repository,
+)
+from rp_poetry.responses import default_response_class, dump_response
+from rp_poetry.replicas import wrote_recently
+from rp_poetry.search import SearchMode, parse_after as parse_search_after, search_cursor, search_statement
+from rp_poetry import sync
 from fastapi.middleware.cors import CORSMiddleware
 
-class Todo(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    content: str =  Field(index=True)
-    status: bool = Field(default=False)
+# Importing this module only defines routes. Engines are built and the
+# schema version checked in the lifespan, and metrics and the async routes
+# are imported only when enabled, so a cold worker is serving as early as
+# possible.
 
-connectionstring = str(settings.DATABASE_URL).replace(
-    "postgresql", "postgresql+psycopg"
-)
+@asynccontextmanager
+async def life_span(app:FastAPI):
+    if app.state.settings.TODO_BACKEND == "memory":
+        # nothing to connect to or migrate
+        yield
+        return
+    engine = get_engine()
+    if app.state.settings.PROFILE_SAMPLE_RATE:
+        from rp_poetry import profiling
 
-engine = create_engine(connectionstring, connect_args={"sslmode": "require"}, pool_recycle=600)
+        for bind in db.worker_engines():
+            profiling.instrument_engine(bind)
+    if app.state.settings.METRICS_ENABLED:
+        from rp_poetry import metrics
 
-def create_db_and_table():
-    SQLModel.metadata.create_all(engine)
+        # replicas too: their pools are sized like the primary's
+        for bind in db.worker_engines():
+            metrics.instrument_engine(bind)
+    if app.state.settings.DB_MIGRATE_ON_STARTUP:
+        migrations.upgrade(engine)
+    else:
+        # one query; the schema is changed by `rp-poetry migrate`, not by
+        # every worker that boots
+        migrations.check(engine)
+    batcher = None
+    if app.state.settings.TODO_CREATE_BATCH_SIZE:
+        from rp_poetry.batching import InsertBatcher, async_flush, sync_flush
 
-@asynccontextmanager
-async def life_span(app:FastAPI):
-    print("Create database...")
-    create_db_and_table()
+        async_engine = get_async_engine()
+        batcher = app.state.todo_batcher = InsertBatcher(
+            async_flush(async_engine) if async_engine is not None else sync_flush(engine),
+            app.state.settings.TODO_CREATE_BATCH_SIZE,
+            app.state.settings.TODO_CREATE_BATCH_DELAY_MS / 1000,
+            app.state.settings.TODO_CREATE_QUEUE_SIZE,
+        )
+        if app.state.settings.METRICS_ENABLED:
+            from rp_poetry import metrics
+
+            metrics.instrument_batcher(batcher)
+        batcher.start()
+    push_source = None
+    if app.state.settings.TODO_PUSH_ENABLED:
+        from rp_poetry.events import Broadcaster, start_source
+
+        broadcaster = app.state.todo_broadcaster = Broadcaster(
+            app.state.settings.TODO_PUSH_BUFFER, app.state.settings.TODO_PUSH_MAX_SUBSCRIBERS
+        )
+        if app.state.settings.METRICS_ENABLED:
+            from rp_poetry import metrics
+
+            metrics.instrument_broadcaster(broadcaster)
+        push_source = start_source(broadcaster, engine)
     yield 
+    if push_source is not None:
+        push_source.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    await dispose_engines()
 
-app = FastAPI(
-    lifespan=life_span,
-    title="Todo API",
-    version="0.0.1",
-    servers=[
-        {
-            "url": "http://0.0.0.0:8000", # ADD NGROK URL Here Before Creating GPT Action
-            "description": "Development Server"
-        }
-        ])
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "DELETE", "PUT"],
-    allow_headers=["*"],
-)
+def collect_pool_and_cache():
+    from rp_poetry import metrics
+
+    binds = [("sync", db.engine), ("async", db.async_engine)]
+    binds += [(f"replica{i}", bind) for i, bind in enumerate(db.replicas.engines if db.replicas else ())]
+    binds += [
+        (f"async_replica{i}", bind) for i, bind in enumerate(db.async_replicas.engines if db.async_replicas else ())
+    ]
+    for name, bind in binds:
+        if bind is None:
+            continue
+        stats = pool_stats(bind.pool)
+        yield from metrics.sample_lines(
+            f"db_pool_{name}_connections", "Connections by pool state.", "gauge", "state",
+            {key: stats[key] for key in ("checked_out", "checked_in", "overflow") if key in stats},
+        )
+    yield from metrics.sample_lines(
+        "todo_cache_events_total", "Todo list cache lookups and evictions.", "counter", "event",
+        {key: value for key, value in todo_cache.stats().items() if key != "entries"},
+    )
+
+def get_metrics():
+    from rp_poetry import metrics
+
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+router = APIRouter()
+
+# routes built on SQL features, served only by the database backend;
+# included before `router` so DELETE /todos/bulk is not taken for a todo id
+database_router = APIRouter()
+
+def create_app(settings=settings) -> FastAPI:
+    app = FastAPI(
+        lifespan=life_span,
+        default_response_class=default_response_class(settings.JSON_RESPONSE),
+        title="Todo API",
+        version="0.0.1",
+        servers=[
+            {
+                "url": "http://0.0.0.0:8000", # ADD NGROK URL Here Before Creating GPT Action
+                "description": "Development Server"
+            }
+            ])
+    app.state.settings = settings
+
+    # added before CORS and metrics so they wrap these: rejected requests
+    # are counted and still readable from the browser
+    on_reject = None
+    if settings.METRICS_ENABLED and (settings.ADMISSION_CONTROL or settings.RATE_LIMIT_PER_SECOND):
+        from rp_poetry import metrics
+
+        on_reject = metrics.http_requests_rejected.inc
+
+    if settings.ADMISSION_CONTROL and settings.TODO_BACKEND == "database":
+        from rp_poetry.ratelimit import AdmissionController, AdmissionMiddleware
+
+        admission = app.state.admission = AdmissionController(
+            settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+            settings.ADMISSION_MAX_QUEUE,
+            settings.ADMISSION_QUEUE_TIMEOUT,
+        )
+        app.add_middleware(
+            AdmissionMiddleware, controller=admission, retry_after=settings.ADMISSION_RETRY_AFTER, on_reject=on_reject
+        )
+
+    if settings.RATE_LIMIT_PER_SECOND:
+        from rp_poetry.ratelimit import RateLimitMiddleware, create_limiter
+
+        # outside admission control: a client over its rate never queues
+        app.add_middleware(
+            RateLimitMiddleware,
+            limiter=create_limiter(settings.RATE_LIMIT_BACKEND, settings.RATE_LIMIT_PER_SECOND, settings.RATE_LIMIT_BURST),
+            key_header=settings.RATE_LIMIT_KEY_HEADER,
+            on_reject=on_reject,
+        )
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "DELETE", "PUT", "PATCH"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Total-Count-Exact", "ETag", "Retry-After"],
+    )
+
+    if settings.COMPRESSION_ENCODINGS:
+        from rp_poetry.compression import CompressionMiddleware, middleware_options
+
+        # inside metrics and the profiler, whose timings include it
+        app.add_middleware(CompressionMiddleware, **middleware_options(settings))
+
+    if settings.METRICS_ENABLED:
+        from rp_poetry import metrics
+
+        app.add_middleware(metrics.MetricsMiddleware)
+        if collect_pool_and_cache not in metrics.registry.collectors:
+            metrics.registry.collectors.append(collect_pool_and_cache)
+        app.add_api_route("/metrics", get_metrics, response_class=PlainTextResponse, include_in_schema=False)
+
+    if settings.TODO_BACKEND == "memory":
+        # one store per app, behind the core routes only
+        store = app.state.todo_store = MemoryTodoStore()
+        app.dependency_overrides[get_todo_repository] = lambda: store
+        app.dependency_overrides[get_read_todo_repository] = lambda: store
+        app.include_router(router)
+        return app
 
-def get_session():
-    with Session(engine) as session:
-        yield session
+    if settings.PROFILE_SAMPLE_RATE:
+        from rp_poetry.profiling import ProfilerMiddleware
 
-@app.get("/")
+        # added after the others so it wraps them: the total covers everything
+        app.add_middleware(
+            ProfilerMiddleware,
+            sample_rate=settings.PROFILE_SAMPLE_RATE,
+            slow_query_ms=settings.PROFILE_SLOW_QUERY_MS,
+            repeat_threshold=settings.PROFILE_REPEATED_QUERY_THRESHOLD,
+            log=settings.PROFILE_LOG,
+        )
+
+    if settings.DATABASE_REPLICA_URLS and settings.DB_READ_YOUR_WRITES_SECONDS:
+        from rp_poetry.replicas import ReadYourWritesMiddleware
+
+        app.add_middleware(ReadYourWritesMiddleware, window=settings.DB_READ_YOUR_WRITES_SECONDS)
+
+    if settings.TODO_CREATE_BATCH_SIZE:
+        from rp_poetry.batching import router as batching_router
+
+        app.include_router(batching_router)
+
+    if settings.TODO_PUSH_ENABLED:
+        from rp_poetry.events import router as events_router
+
+        app.include_router(events_router)
+
+    if settings.DB_ASYNC:
+        from rp_poetry.async_todos import router as async_todos_router
+
+        # refused here rather than on the first request
+        if make_url(db.connection_url(settings.DATABASE_URL)).get_backend_name() != "postgresql":
+            raise ValueError("DB_ASYNC needs a Postgres DATABASE_URL")
+
+        # registered first so these take precedence over the sync handlers
+        app.include_router(async_todos_router)
+
+    app.include_router(database_router)
+    app.include_router(router)
+    return app
+
+@router.get("/")
 async def root():
     return {"greeting": "Welcome To Todo App!"}
 
-@app.post("/todos", response_model=Todo)
-def create_todo(todo: Todo, session: Annotated[Session, Depends(get_session)]):
-    session.add(todo)
-    session.commit()
-    session.refresh(todo)
+@router.post("/todos", response_model=Todo)
+def create_todo(todo: TodoCreate, repository: Annotated[TodoRepository, Depends(get_todo_repository)], response: Response):
+    todo = repository.create(todo)
+    todo_cache.invalidate()
+    response.headers["ETag"] = todo_etag(todo.version)
     return todo
 
-@app.get("/todos", response_model=list[Todo])
-def get_todo(session: Annotated[Session, Depends(get_session)]):
-    todos = session.exec(select(Todo)).all()
-    return todos
+@router.get("/todos", response_model=list[Todo])
+def get_todo(
+    request: Request,
+    repository: Annotated[TodoRepository, Depends(get_read_todo_repository)],
+    limit: Annotated[int, Query(ge=1, le=settings.TODO_MAX_PAGE_SIZE)] = settings.TODO_PAGE_SIZE,
+    after: Optional[str] = None,
+    status: Optional[bool] = None,
+    order_by: queries.TodoOrder = queries.TodoOrder.id,
+    include_total: bool = False,
+    stream: bool = False,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    # `after` is the X-Next-Cursor of the previous page
+    try:
+        queries.parse_after(order_by, after)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    if stream:
+        # full export as NDJSON, `limit` does not apply
+        return StreamingResponse(
+            repository.export(status, order_by, after), media_type="application/x-ndjson"
+        )
+    key = f"{repository.store_id}/todos?limit={limit}&after={after}&status={status}&order_by={order_by.value}"
+    # a client reading its own writes skips the cache, which may hold a
+    # page read from a replica that had not caught up yet
+    # read before the page, so a write in between keeps it from being stored
+    generation = todo_cache.generation
+    page = None if wrote_recently(request) else todo_cache.get(key, generation)
+    response = None
+    if page is None and if_none_match:
+        # a miss is revalidated too, by one read of the change counter
+        # instead of the page
+        etag = list_etag(repository.state_tag())
+        if etag_matches(etag, if_none_match):
+            response = Response(status_code=304, headers={"ETag": etag})
+    if response is None:
+        if page is None:
+            todos, next_cursor, state_tag = repository.list_page(status, order_by, after, limit)
+            page = todo_cache.put(key, todo_list.dump_json(todos), next_cursor, generation, list_etag(state_tag))
+        response = page.to_response(if_none_match)
+    if include_total:
+        # not cached: an estimate costs one catalog lookup, and small tables
+        # are counted from the status index
+        total, exact = repository.count(status)
+        response.headers["X-Total-Count"] = str(total)
+        response.headers["X-Total-Count-Exact"] = str(exact).lower()
+    return response
 
-@app.delete("/todos/{todo_id}", response_model=Todo)
-def delete_todo(todo_id: int, session: Annotated[Session, Depends(get_session)]):
-    todo = session.exec(select(Todo).where(Todo.id == todo_id)).first()
-    if not todo:
-        raise HTTPException(status_code=404, detail="Todo not found")
-    session.delete(todo)
+@database_router.get("/todos/search", response_model=list[Todo])
+def search_todos(
+    session: Annotated[Session, Depends(get_read_session)],
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    mode: SearchMode = SearchMode.fulltext,
+    status: Optional[bool] = None,
+    limit: Annotated[int, Query(ge=1, le=settings.TODO_MAX_PAGE_SIZE)] = settings.TODO_PAGE_SIZE,
+    after: Optional[str] = None,
+):
+    # fulltext results come best match first; `after` is the X-Next-Cursor
+    # of the previous page, sent only while there may be more
+    try:
+        parse_search_after(mode, after)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    rows = session.exec(search_statement(session.get_bind(), q, mode, status, after).limit(limit)).all()
+    todos = [todo for todo, _ in rows] if mode is SearchMode.fulltext else rows
+    headers = {"X-Next-Cursor": search_cursor(mode, rows[-1])} if len(rows) == limit else None
+    return dump_response(todo_list, todos, headers)
+
+@database_router.get("/todos/changes", response_model=TodoChanges)
+def get_changes(
+    session: Annotated[Session, Depends(get_session)],
+    since: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=settings.TODO_MAX_PAGE_SIZE)] = settings.TODO_PAGE_SIZE,
+):
+    # `since` is the cursor of the previous call; without it the first call
+    # returns every todo. Keep calling while has_more is true. Always on the
+    # primary: on a lagging replica a change older than the sync lag could
+    # still be missing and the cursor would move past it.
+    try:
+        changes = sync.changes(
+            session.connection(), since, limit,
+            lag=timedelta(milliseconds=settings.TODO_SYNC_LAG_MS),
+            retention=timedelta(days=settings.TODO_TOMBSTONE_RETENTION_DAYS),
+        )
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    except sync.CursorExpired:
+        raise HTTPException(status_code=410, detail="Cursor expired, sync again without `since`")
+    return dump_response(todo_changes, changes)
+
+@router.get("/cache/stats")
+def cache_stats():
+    return todo_cache.stats()
+
+@database_router.get("/pool/stats")
+def get_pool_stats(request: Request):
+    stats = {"sync": pool_stats(get_engine().pool)}
+    if get_async_engine() is not None:
+        stats["async"] = pool_stats(get_async_engine().pool)
+    if get_replicas() is not None:
+        stats["replicas"] = [pool_stats(replica.pool) for replica in get_replicas().engines]
+    if hasattr(request.app.state, "admission"):
+        stats["admission"] = request.app.state.admission.stats()
+    return stats
+
+@database_router.post("/todos/bulk", response_model=list[Todo])
+def create_todos(
+    todos: Annotated[list[TodoCreate], Body(min_length=1, max_length=settings.TODO_BULK_MAX_ITEMS)],
+    session: Annotated[Session, Depends(get_session)],
+):
+    rows = session.exec(queries.bulk_insert(todos)).all()
     session.commit()
-    return todo
-    
-# Create a function that take the id of the todo and update the status of the given id of the todo and return a updated list of the todo
+    todo_cache.invalidate()
+    return dump_response(todo_list, queries.inserted_todos(rows))
 
-class updateTodo():
-    status: bool
+@database_router.patch("/todos/bulk", response_model=list[TodoBulkResult])
+def update_todos(
+    todos: Annotated[list[TodoBulkUpdate], Body(min_length=1, max_length=settings.TODO_BULK_MAX_ITEMS)],
+    session: Annotated[Session, Depends(get_session)],
+):
+    rows = session.exec(queries.bulk_update(todos, session.get_bind().dialect.name)).all()
+    session.commit()
+    todo_cache.invalidate()
+    return dump_response(todo_bulk_results, queries.bulk_results([todo.id for todo in todos], rows))
 
-@app.put("/todos/{todo_id}", response_model=Todo)
-def update_todo(todo_id: int, todo: Todo, session: Annotated[Session, Depends(get_session)]):
-    todo_query = session.exec(select(Todo).where(Todo.id == todo_id)).first()
-    if not todo_query:
-        raise HTTPException(status_code=404, detail="Todo not found")
-    todo_query.status = todo.status
+@database_router.delete("/todos/bulk", response_model=list[TodoBulkResult])
+def delete_todos(
+    ids: Annotated[list[int], Body(min_length=1, max_length=settings.TODO_BULK_MAX_ITEMS)],
+    session: Annotated[Session, Depends(get_session)],
+):
+    rows = session.exec(queries.bulk_delete(ids, session.get_bind().dialect.name)).all()
     session.commit()
-    session.refresh(todo_query)
-    return todo_query
+    todo_cache.invalidate()
+    return dump_response(todo_bulk_results, queries.bulk_results(ids, rows))
+
+@router.delete("/todos/{todo_id}", response_model=Todo)
+def delete_todo(
+    todo_id: int,
+    repository: Annotated[TodoRepository, Depends(get_todo_repository)],
+    if_match: Annotated[Optional[str], Header()] = None,
+):
+    try:
+        todo = repository.delete(todo_id, if_match_versions(if_match))
+    except TodoVersionMismatch:
+        raise HTTPException(status_code=412, detail="Todo has been modified")
+    except TodoNotFound:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    todo_cache.invalidate()
+    return todo
+
+@router.put("/todos/{todo_id}", response_model=Todo)
+def update_todo(
+    todo_id: int,
+    todo: TodoUpdate,
+    repository: Annotated[TodoRepository, Depends(get_todo_repository)],
+    response: Response,
+    if_match: Annotated[Optional[str], Header()] = None,
+):
+    try:
+        todo = repository.update(todo_id, todo, if_match_versions(if_match))
+    except TodoVersionMismatch:
+        raise HTTPException(status_code=412, detail="Todo has been modified")
+    except TodoNotFound:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    todo_cache.invalidate()
+    response.headers["ETag"] = todo_etag(todo.version)
+    return todo
+
+app = create_app()
@@ -0,0 +1,250 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from rp_poetry.db import WaitCountingPool
+
+# A small Prometheus text-format registry. Everything is kept in plain dicts
+# keyed by label tuples behind one lock, which keeps the per-request cost to
+# a few dictionary updates.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, value in self.values.items():
+                lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # per label set: [count per bucket..., +Inf count, sum]
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0.0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            rows = [(labels, list(row)) for labels, row in self.values.items()]
+        for labels, row in rows:
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, "+Inf"), row):
+                cumulative += count
+                le = format_labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {row[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        # called at scrape time for values that already live elsewhere
+        self.collectors: list[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests handled.", ("method", "route", "status")
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests.", ("method", "route")
+))
+http_requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled.", ("method",)
+))
+http_requests_rejected = registry.register(Counter(
+    "http_requests_rejected_total", "HTTP requests turned away before routing, by rate limiting or admission control.",
+    ("reason",),
+))
+db_statement_duration = registry.register(Histogram(
+    "db_statement_duration_seconds", "Time spent executing SQL statements.", ("operation",)
+))
+db_pool_wait = registry.register(Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a connection from an exhausted pool."
+))
+todo_create_batch_size = registry.register(Histogram(
+    "todo_create_batch_size", "Todos written per batched INSERT.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+))
+todo_create_flush_duration = registry.register(Histogram(
+    "todo_create_flush_duration_seconds", "Time spent writing one batch of todos."
+))
+todo_push_events = registry.register(Counter(
+    "todo_push_events_total", "Todo change events published, and subscribers evicted for falling behind.",
+    ("event",),
+))
+todo_push_subscribers = registry.register(Gauge(
+    "todo_push_subscribers", "Open todo change streams."
+))
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware: no extra task per request
+    # and streaming bodies pass through untouched.
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_progress.dec(method)
+            # the router leaves the matched route in the scope; label by its
+            # template so /todos/1 and /todos/2 share one series
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_requests.inc(method, path, str(status))
+            http_request_duration.observe(elapsed, method, path)
+
+
+instrumented_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+def instrument_engine(engine: Engine) -> None:
+    # the lifespan runs once per app, and tests build more than one
+    if engine in instrumented_engines:
+        return
+    instrumented_engines.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+        db_statement_duration.observe(elapsed, operation)
+
+    @event.listens_for(engine, "handle_error")
+    def drop_timer(context):
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+    if db_pool_wait.observe not in WaitCountingPool.wait_listeners:
+        WaitCountingPool.wait_listeners.append(db_pool_wait.observe)
+
+
+def instrument_batcher(batcher) -> None:
+    def on_flush(size: int, seconds: float) -> None:
+        todo_create_batch_size.observe(size)
+        todo_create_flush_duration.observe(seconds)
+
+    batcher.on_flush = on_flush
+
+
+def instrument_broadcaster(broadcaster) -> None:
+    def on_event(event: str) -> None:
+        if event == "subscribed":
+            todo_push_subscribers.inc()
+        elif event == "unsubscribed":
+            todo_push_subscribers.dec()
+        else:
+            todo_push_events.inc(event)
+
+    broadcaster.on_event = on_event
+
+
+def sample_lines(
+    name: str, documentation: str, kind: str, label: str, values: dict[str, float]
+) -> list[str]:
+    # exposition lines for a labelled family whose values are read at scrape time
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines.extend(f'{name}{{{label}="{key}"}} {value}' for key, value in values.items())
+    return lines
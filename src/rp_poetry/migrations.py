@@ -0,0 +1,363 @@
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import Boolean, Column, Index, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+from rp_poetry.search import TS_CONFIG
+from rp_poetry.sync import SQLITE_NOW
+
+# Schema migrations, applied in order by `rp-poetry migrate` and recorded in
+# schema_version. Workers never change the schema: at startup they only
+# compare max(version) with LATEST (see check()).
+#
+# A migration is transactional unless it says otherwise. Non-transactional
+# migrations run in autocommit mode so Postgres can build indexes with
+# CREATE INDEX CONCURRENTLY, which does not block writes but cannot run in a
+# transaction; their statements must be safe to re-run, because a crash
+# halfway leaves the version unrecorded.
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+    transactional: bool = True
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+# pg_advisory_lock key, so two `migrate` runs cannot interleave
+LOCK_KEY = 0x7270706f  # "rppo"
+
+# rows of todo_change_counter that writers spread over (migration 12)
+CHANGE_COUNTER_SLOTS = 64
+
+VERSION_TABLE = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version integer PRIMARY KEY, "
+    "name varchar NOT NULL, "
+    "applied_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+)
+
+
+def create_index(conn: Connection, name: str, definition: str) -> None:
+    """CREATE INDEX name ON definition, concurrently on Postgres."""
+    if conn.dialect.name != "postgresql":
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}"))
+        return
+    # a failed concurrent build leaves an INVALID index behind, which
+    # IF NOT EXISTS would then skip; drop it and build again
+    invalid = conn.execute(text(
+        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+        "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+    ), {"name": name}).first()
+    if invalid:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+
+
+def add_column(conn: Connection, table: str, name: str, definition: str) -> None:
+    # SQLite has no ADD COLUMN IF NOT EXISTS; tables made by create_all()
+    # from a newer model may already have the column
+    if name not in {column["name"] for column in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+
+
+def create_todo(conn: Connection) -> None:
+    # the table as it was at version 1, not as the model is today; later
+    # columns come from their own migrations. checkfirst, so databases set
+    # up by the old create_all() are adopted.
+    table = Table(
+        "todo", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("content", String, nullable=False),
+        Column("status", Boolean, nullable=False),
+        Index("ix_todo_content", "content"),
+    )
+    table.create(conn, checkfirst=True)
+
+
+def add_search_columns(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            f"ALTER TABLE todo ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', content)) STORED"
+        ))
+    elif conn.dialect.name == "sqlite":
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS todo_fts "
+            "USING fts5(content, content='todo', content_rowid='id')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS todo_fts_insert AFTER INSERT ON todo BEGIN "
+            "INSERT INTO todo_fts(rowid, content) VALUES (new.id, new.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS todo_fts_delete AFTER DELETE ON todo BEGIN "
+            "INSERT INTO todo_fts(todo_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS todo_fts_update AFTER UPDATE OF content ON todo BEGIN "
+            "INSERT INTO todo_fts(todo_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+            "INSERT INTO todo_fts(rowid, content) VALUES (new.id, new.content); END"
+        ))
+        conn.execute(text("INSERT INTO todo_fts(todo_fts) VALUES ('rebuild')"))
+
+
+def add_search_indexes(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        # text_pattern_ops, unlike the plain ix_todo_content btree, can
+        # serve LIKE 'abc%' under any collation
+        create_index(conn, "ix_todo_content_prefix", "todo (lower(content) text_pattern_ops)")
+        create_index(conn, "ix_todo_content_tsv", "todo USING gin (content_tsv)")
+    else:
+        # SQLite's LIKE is already case-insensitive and only uses an index
+        # whose collation agrees, which an index on lower(content) does not
+        create_index(conn, "ix_todo_content_prefix", "todo (content COLLATE NOCASE)")
+
+
+def add_status_index(conn: Connection) -> None:
+    # serves status filters alone and keyset pages within one status
+    create_index(conn, "ix_todo_status_id", "todo (status, id)")
+
+
+def add_list_indexes(conn: Connection) -> None:
+    # GET /todos?status=...&order_by=... reads every column of todo, so
+    # these carry content too and Postgres answers from the index alone
+    if conn.dialect.name == "postgresql":
+        create_index(conn, "ix_todo_status_id_content", "todo (status, id) INCLUDE (content)")
+        # superseded by the covering index above
+        conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_todo_status_id"))
+    create_index(conn, "ix_todo_status_content_id", "todo (status, content, id)")
+
+
+def add_version_column(conn: Connection) -> None:
+    # a constant default: no table rewrite on Postgres 11+
+    add_column(conn, "todo", "version", "integer NOT NULL DEFAULT 1")
+
+
+def add_version_to_list_indexes(conn: Connection) -> None:
+    # the list indexes from version 5 stop covering GET /todos once it also
+    # reads `version`; build their replacements before dropping them
+    if conn.dialect.name == "postgresql":
+        create_index(conn, "ix_todo_status_id_cover", "todo (status, id) INCLUDE (content, version)")
+        create_index(conn, "ix_todo_status_content_cover", "todo (status, content, id) INCLUDE (version)")
+        conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_todo_status_id_content"))
+        conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_todo_status_content_id"))
+    else:
+        create_index(conn, "ix_todo_status_content_cover", "todo (status, content, id, version)")
+        conn.execute(text("DROP INDEX IF EXISTS ix_todo_status_content_id"))
+
+
+def add_sync_columns(conn: Connection) -> None:
+    # todo.updated_at and todo_tombstone are kept by the database itself, so
+    # every write path feeds GET /todos/changes. A change is a new version:
+    # updates that leave the version alone (an empty PUT) are not changes.
+    if conn.dialect.name == "postgresql":
+        add_column(conn, "todo", "updated_at", "timestamptz NOT NULL DEFAULT now()")
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS todo_tombstone ("
+            "id integer PRIMARY KEY, deleted_at timestamptz NOT NULL DEFAULT now())"
+        ))
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION todo_touch() RETURNS trigger LANGUAGE plpgsql AS "
+            "$$ BEGIN NEW.updated_at := now(); RETURN NEW; END $$"
+        ))
+        conn.execute(text("DROP TRIGGER IF EXISTS todo_touch ON todo"))
+        conn.execute(text(
+            "CREATE TRIGGER todo_touch BEFORE UPDATE ON todo FOR EACH ROW "
+            "WHEN (OLD.version IS DISTINCT FROM NEW.version) EXECUTE FUNCTION todo_touch()"
+        ))
+        # once per statement, so a bulk delete writes its tombstones in one go
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION todo_tombstone() RETURNS trigger LANGUAGE plpgsql AS "
+            "$$ BEGIN INSERT INTO todo_tombstone (id) SELECT id FROM deleted_todos "
+            "ON CONFLICT (id) DO UPDATE SET deleted_at = excluded.deleted_at; RETURN NULL; END $$"
+        ))
+        conn.execute(text("DROP TRIGGER IF EXISTS todo_tombstone ON todo"))
+        conn.execute(text(
+            "CREATE TRIGGER todo_tombstone AFTER DELETE ON todo "
+            "REFERENCING OLD TABLE AS deleted_todos FOR EACH STATEMENT EXECUTE FUNCTION todo_tombstone()"
+        ))
+    elif conn.dialect.name == "sqlite":
+        # ADD COLUMN only takes a constant default; the triggers set the time
+        add_column(conn, "todo", "updated_at", "timestamp NOT NULL DEFAULT '1970-01-01 00:00:00.000'")
+        conn.execute(text(f"UPDATE todo SET updated_at = {SQLITE_NOW}"))
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS todo_tombstone (id integer PRIMARY KEY, deleted_at timestamp NOT NULL)"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS todo_touch_insert AFTER INSERT ON todo BEGIN "
+            f"UPDATE todo SET updated_at = {SQLITE_NOW} WHERE id = new.id; END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS todo_touch_update AFTER UPDATE OF version ON todo "
+            f"WHEN new.version IS NOT old.version BEGIN "
+            f"UPDATE todo SET updated_at = {SQLITE_NOW} WHERE id = new.id; END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS todo_tombstone AFTER DELETE ON todo BEGIN "
+            f"INSERT OR REPLACE INTO todo_tombstone (id, deleted_at) VALUES (old.id, {SQLITE_NOW}); END"
+        ))
+
+
+def add_sync_indexes(conn: Connection) -> None:
+    create_index(conn, "ix_todo_updated_at_id", "todo (updated_at, id)")
+    create_index(conn, "ix_todo_tombstone_deleted_at_id", "todo_tombstone (deleted_at, id)")
+
+
+def add_change_notifications(conn: Connection) -> None:
+    # GET /todos/stream on every worker LISTENs for these; NOTIFY is sent on
+    # commit, so nothing is pushed for a write that rolls back. Other
+    # databases are polled instead.
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(
+        "CREATE OR REPLACE FUNCTION todo_notify() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "IF TG_OP = 'DELETE' THEN "
+        "PERFORM pg_notify('todo_changes', json_build_object('type', 'deleted', 'id', OLD.id)::text); "
+        "ELSE "
+        "PERFORM pg_notify('todo_changes', json_build_object("
+        "'type', CASE TG_OP WHEN 'INSERT' THEN 'created' ELSE 'updated' END, "
+        "'id', NEW.id, 'version', NEW.version)::text); "
+        "END IF; RETURN NULL; END $$"
+    ))
+    conn.execute(text("DROP TRIGGER IF EXISTS todo_notify ON todo"))
+    conn.execute(text(
+        "CREATE TRIGGER todo_notify AFTER INSERT OR DELETE ON todo FOR EACH ROW EXECUTE FUNCTION todo_notify()"
+    ))
+    conn.execute(text("DROP TRIGGER IF EXISTS todo_notify_update ON todo"))
+    conn.execute(text(
+        "CREATE TRIGGER todo_notify_update AFTER UPDATE ON todo FOR EACH ROW "
+        "WHEN (OLD.version IS DISTINCT FROM NEW.version) EXECUTE FUNCTION todo_notify()"
+    ))
+
+
+def add_change_counter(conn: Connection) -> None:
+    # One row counting the writes to todo, bumped by the writing transaction
+    # itself. GET /todos reads it in the same statement as a page, so the
+    # count is the state the page shows and serves as its ETag. Writers
+    # queued on this one row until they committed; migration 12 spreads
+    # them over several.
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS todo_change_counter (id integer PRIMARY KEY, value bigint NOT NULL)"
+    ))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("INSERT INTO todo_change_counter (id, value) VALUES (1, 0) ON CONFLICT (id) DO NOTHING"))
+        # once per statement, and not for statements that matched no rows
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION todo_count_change() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+            "IF EXISTS (SELECT 1 FROM changed_todos) THEN "
+            "UPDATE todo_change_counter SET value = value + 1 WHERE id = 1; "
+            "END IF; RETURN NULL; END $$"
+        ))
+        for operation, transition in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS todo_count_{operation} ON todo"))
+            conn.execute(text(
+                f"CREATE TRIGGER todo_count_{operation} AFTER {operation.upper()} ON todo "
+                f"REFERENCING {transition} TABLE AS changed_todos FOR EACH STATEMENT EXECUTE FUNCTION todo_count_change()"
+            ))
+    elif conn.dialect.name == "sqlite":
+        conn.execute(text("INSERT OR IGNORE INTO todo_change_counter (id, value) VALUES (1, 0)"))
+        # not on the todo_touch_* triggers' own UPDATE of updated_at
+        for operation in ("INSERT", "UPDATE OF content, status, version", "DELETE"):
+            name = "todo_count_" + operation.split()[0].lower()
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {operation} ON todo BEGIN "
+                f"UPDATE todo_change_counter SET value = value + 1 WHERE id = 1; END"
+            ))
+
+
+def stripe_change_counter(conn: Connection) -> None:
+    # Postgres only: the single counter row made every writer wait for the
+    # one before it to commit. Each session now bumps the slot its backend
+    # pid falls in, so two concurrent writers share a row only when their
+    # pids do modulo CHANGE_COUNTER_SLOTS. The count is the sum of the
+    # slots; row 1 keeps the count so far. SQLite has a single writer.
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(
+        "CREATE OR REPLACE FUNCTION todo_count_change() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "IF EXISTS (SELECT 1 FROM changed_todos) THEN "
+        f"INSERT INTO todo_change_counter (id, value) VALUES (pg_backend_pid() % {CHANGE_COUNTER_SLOTS}, 1) "
+        "ON CONFLICT (id) DO UPDATE SET value = todo_change_counter.value + 1; "
+        "END IF; RETURN NULL; END $$"
+    ))
+
+
+MIGRATIONS = [
+    Migration(1, "create todo", create_todo),
+    Migration(2, "search columns", add_search_columns),
+    Migration(3, "search indexes", add_search_indexes, transactional=False),
+    Migration(4, "status index", add_status_index, transactional=False),
+    Migration(5, "list indexes", add_list_indexes, transactional=False),
+    Migration(6, "todo version", add_version_column),
+    Migration(7, "list indexes with version", add_version_to_list_indexes, transactional=False),
+    Migration(8, "sync columns", add_sync_columns),
+    Migration(9, "sync indexes", add_sync_indexes, transactional=False),
+    Migration(10, "change notifications", add_change_notifications),
+    Migration(11, "change counter", add_change_counter),
+    Migration(12, "striped change counter", stripe_change_counter),
+]
+
+LATEST = MIGRATIONS[-1].version
+
+
+def current_version(conn: Connection) -> int:
+    return conn.execute(text("SELECT max(version) FROM schema_version")).scalar() or 0
+
+
+def check(engine: Engine) -> int:
+    """The startup check: one query, no DDL. Raises SchemaVersionError when
+    the database is behind this build; a newer schema is fine, migrations
+    only ever add."""
+    with engine.connect() as conn:
+        try:
+            version = current_version(conn)
+        except DBAPIError:
+            # no schema_version table: never migrated
+            version = 0
+    if version < LATEST:
+        raise SchemaVersionError(
+            f"Database schema is at version {version}, this build needs {LATEST}: "
+            f"run `rp-poetry migrate`"
+        )
+    return version
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> list[Migration]:
+    """Apply pending migrations up to ``target`` (default: all of them) and
+    return the ones applied."""
+    applied = []
+    with engine.connect() as conn:
+        isolation_level = conn.default_isolation_level
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        try:
+            conn.execute(text(VERSION_TABLE))
+            version = current_version(conn)
+            conn.commit()
+            for migration in MIGRATIONS:
+                if migration.version <= version or (target is not None and migration.version > target):
+                    continue
+                conn.execution_options(
+                    isolation_level=isolation_level if migration.transactional else "AUTOCOMMIT"
+                )
+                with conn.begin():
+                    migration.upgrade(conn)
+                    conn.execute(
+                        text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+                        {"version": migration.version, "name": migration.name},
+                    )
+                applied.append(migration)
+        finally:
+            if postgres:
+                conn.execution_options(isolation_level="AUTOCOMMIT")
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+                conn.commit()
+    return applied
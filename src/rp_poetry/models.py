@@ -0,0 +1,41 @@
+from typing import Optional
+from pydantic import TypeAdapter
+from sqlmodel import SQLModel, Field
+
+class Todo(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    content: str =  Field(index=True)
+    status: bool = Field(default=False)
+    # bumped by every write; the todo's ETag, checked against If-Match
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+class TodoCreate(SQLModel):
+    content: str
+    status: bool = False
+
+class TodoUpdate(SQLModel):
+    content: Optional[str] = None
+    status: Optional[bool] = None
+
+class TodoBulkUpdate(TodoUpdate):
+    id: int
+
+class TodoBulkResult(SQLModel):
+    id: int
+    ok: bool
+    todo: Optional[Todo] = None
+    detail: Optional[str] = None
+
+class TodoChanges(SQLModel):
+    # created or updated since the cursor, oldest change first
+    todos: list[Todo]
+    deleted: list[int]
+    # pass back as `since` on the next call
+    cursor: str
+    has_more: bool
+
+todo_list = TypeAdapter(list[Todo])
+
+todo_bulk_results = TypeAdapter(list[TodoBulkResult])
+
+todo_changes = TypeAdapter(TodoChanges)
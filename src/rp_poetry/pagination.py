@@ -0,0 +1,70 @@
+import base64
+import json
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from sqlalchemy import tuple_
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+
+def keyset(statement: SelectOfScalar, column, after: Optional[int]) -> SelectOfScalar:
+    # Keyset pagination: seek past the last seen key instead of using OFFSET,
+    # so every page is a single index range scan no matter how deep it is.
+    statement = statement.order_by(column)
+    if after is not None:
+        statement = statement.where(column > after)
+    return statement
+
+
+def keyset_columns(
+    statement: SelectOfScalar, columns: Sequence, after: Optional[Sequence[Any]]
+) -> SelectOfScalar:
+    # keyset() over a sort key that is not unique on its own: the columns
+    # end with the primary key and are compared as a row value, which both
+    # Postgres and SQLite can seek to in an index on the same columns
+    statement = statement.order_by(*columns)
+    if after is not None:
+        statement = statement.where(tuple_(*columns) > tuple_(*after))
+    return statement
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(cursor: str, length: int) -> list[Any]:
+    # raises ValueError for anything encode_cursor() did not produce
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return values
+
+
+def iter_ndjson(
+    bind: Engine | Connection, statement: SelectOfScalar, batch_size: int
+) -> Iterator[bytes]:
+    # The session is opened here rather than taken from the request because
+    # the body is sent after the request dependencies have been closed.
+    # yield_per makes psycopg use a server-side cursor, so only one batch of
+    # rows is held in memory at a time.
+    with Session(bind) as session:
+        result = session.exec(statement.execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            yield b"".join(row.model_dump_json().encode() + b"\n" for row in rows)
+
+
+async def aiter_ndjson(
+    bind: AsyncEngine, statement: SelectOfScalar, batch_size: int
+) -> AsyncIterator[bytes]:
+    async with AsyncSession(bind) as session:
+        result = await session.stream_scalars(
+            statement.execution_options(yield_per=batch_size)
+        )
+        async for rows in result.partitions():
+            yield b"".join(row.model_dump_json().encode() + b"\n" for row in rows)
@@ -0,0 +1,168 @@
+import json
+import logging
+import random
+import time
+import weakref
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from rp_poetry.db import WaitCountingPool
+
+logger = logging.getLogger(__name__)
+
+# A per-request query profiler, on for a sample of requests
+# (PROFILE_SAMPLE_RATE). A sampled request records every statement it runs,
+# with its duration and row count, and any time spent waiting for a pooled
+# connection. Its response gets a Server-Timing header splitting the time
+# between the pool, the database and everything else (routing, validation,
+# serialization), which browsers' network panels display as is. With
+# PROFILE_LOG the whole profile is also logged as one JSON line.
+#
+# Statements repeated within one request (the N+1 pattern) and statements
+# slower than PROFILE_SLOW_QUERY_MS are flagged in both.
+#
+# The SQLAlchemy hooks run for every statement but return after a single
+# ContextVar lookup unless the request is sampled. Most of their cost is
+# SQLAlchemy's event dispatch, which engines instrumented by metrics.py pay
+# already; benchmarks/bench_profiling.py measures the rest.
+
+# statements kept per profile; counts and durations still cover the rest
+MAX_STATEMENTS = 100
+
+current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, slow_seconds: float):
+        self.start = time.perf_counter()
+        self.slow_seconds = slow_seconds
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.statement_count = 0
+        # [(sql, seconds, rows)], rows None when the driver does not say
+        self.statements: list[tuple[str, float, Optional[int]]] = []
+        self.counts: dict[str, int] = {}
+        self.slow: list[tuple[str, float]] = []
+
+    def record(self, statement: str, seconds: float, rows: Optional[int]) -> None:
+        self.db_seconds += seconds
+        self.statement_count += 1
+        self.counts[statement] = self.counts.get(statement, 0) + 1
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append((statement, seconds, rows))
+        if seconds >= self.slow_seconds:
+            self.slow.append((statement, seconds))
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        return {statement: count for statement, count in self.counts.items() if count >= threshold}
+
+    def server_timing(self, total: float, repeat_threshold: int) -> str:
+        metrics = [
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.statement_count} queries"',
+            f"pool;dur={self.pool_wait_seconds * 1000:.2f}",
+            f"app;dur={max(total - self.db_seconds - self.pool_wait_seconds, 0) * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ]
+        repeated = self.repeated(repeat_threshold)
+        if repeated:
+            metrics.append(f'repeated;desc="{len(repeated)} statements repeated up to {max(repeated.values())} times"')
+        if self.slow:
+            metrics.append(f'slow;desc="{len(self.slow)} queries"')
+        return ", ".join(metrics)
+
+    def to_dict(self, total: float, repeat_threshold: int) -> dict:
+        return {
+            "total_ms": round(total * 1000, 3),
+            "db_ms": round(self.db_seconds * 1000, 3),
+            "pool_wait_ms": round(self.pool_wait_seconds * 1000, 3),
+            "statement_count": self.statement_count,
+            "statements": [
+                {"sql": sql, "ms": round(seconds * 1000, 3), "rows": rows}
+                for sql, seconds, rows in self.statements
+            ],
+            "repeated": [{"sql": sql, "count": count} for sql, count in self.repeated(repeat_threshold).items()],
+            "slow": [{"sql": sql, "ms": round(seconds * 1000, 3)} for sql, seconds in self.slow],
+        }
+
+
+instrumented_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+def instrument_engine(engine: Engine) -> None:
+    if record_pool_wait not in WaitCountingPool.wait_listeners:
+        WaitCountingPool.wait_listeners.append(record_pool_wait)
+    if engine in instrumented_engines:
+        return
+    instrumented_engines.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if current_profile.get() is not None:
+            conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        if profile is None or not conn.info.get("profile_start"):
+            return
+        elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        profile.record(statement, elapsed, rows)
+
+    @event.listens_for(engine, "handle_error")
+    def drop_timer(context):
+        if context.connection is not None and context.connection.info.get("profile_start"):
+            context.connection.info["profile_start"].pop()
+
+
+def record_pool_wait(seconds: float) -> None:
+    profile = current_profile.get()
+    if profile is not None:
+        profile.pool_wait_seconds += seconds
+
+
+class ProfilerMiddleware:
+    # Plain ASGI like MetricsMiddleware. The profile lives in a ContextVar,
+    # which the threadpool running sync routes and their dependencies
+    # copies along with the rest of the request's context.
+    def __init__(self, app: ASGIApp, sample_rate: float, slow_query_ms: float, repeat_threshold: int, log: bool):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_query_ms / 1000
+        self.repeat_threshold = repeat_threshold
+        self.log = log
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(self.slow_seconds)
+        token = current_profile.set(profile)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                # up to the headers: a streamed body is still to come
+                status = message["status"]
+                timing = profile.server_timing(time.perf_counter() - profile.start, self.repeat_threshold)
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            if self.log:
+                route = scope.get("route")
+                logger.info(json.dumps({
+                    "method": scope["method"],
+                    "route": route.path if route is not None else scope["path"],
+                    "status": status,
+                    **profile.to_dict(time.perf_counter() - profile.start, self.repeat_threshold),
+                }))
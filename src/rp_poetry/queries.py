@@ -0,0 +1,196 @@
+import json
+from enum import Enum
+from typing import Optional, Union
+
+from sqlalchemy import (
+    BigInteger, Boolean, Column, Integer, MetaData, String, Table, any_, bindparam, case, cast, column, delete, func, insert,
+    text, update, values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import Connection
+from sqlmodel import select
+from sqlmodel.sql.expression import Select, SelectOfScalar
+from rp_poetry.models import Todo, TodoBulkResult, TodoBulkUpdate, TodoCreate, TodoUpdate
+from rp_poetry.pagination import decode_cursor, encode_cursor, keyset, keyset_columns
+
+# Statements are built against the Core table so RETURNING hands back plain
+# rows: they survive the commit without the ORM re-loading each instance.
+todo_table = Todo.__table__
+
+# counts the writes to todo (migrations 11 and 12), spread over slots so
+# concurrent writers rarely bump the same row; their sum is the state a list
+# page shows, see list_todos(with_change_count=True)
+change_counter = Table(
+    "todo_change_counter", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("value", BigInteger, nullable=False),
+)
+
+change_count = select(cast(func.coalesce(func.sum(change_counter.c.value), 0), BigInteger))
+
+
+def read_change_count(conn: Connection) -> int:
+    return conn.execute(change_count).scalar_one()
+
+
+def update_todo(todo_id: int, todo: TodoUpdate, versions: Optional[list[int]] = None):
+    # UPDATE ... RETURNING replaces SELECT + UPDATE + refresh; no row back
+    # means no such todo, or with `versions` (from If-Match) that it has
+    # changed since. Only fields sent in the body are written and bump the
+    # version; an empty body only reads the current row, so no trigger
+    # fires and the list's ETag stays.
+    changes = todo.model_dump(exclude_none=True)
+    conditions = [todo_table.c.id == todo_id]
+    if versions is not None:
+        conditions.append(todo_table.c.version.in_(versions))
+    if not changes:
+        return todo_table.select().where(*conditions)
+    changes["version"] = todo_table.c.version + 1
+    return update(todo_table).where(*conditions).values(**changes).returning(todo_table)
+
+
+def delete_todo(todo_id: int, versions: Optional[list[int]] = None):
+    statement = delete(todo_table).where(todo_table.c.id == todo_id)
+    if versions is not None:
+        statement = statement.where(todo_table.c.version.in_(versions))
+    return statement.returning(todo_table)
+
+
+def bulk_insert(todos: list[TodoCreate]):
+    # one multi-row INSERT ... VALUES (...), (...) RETURNING; see inserted_todos()
+    return (
+        insert(todo_table)
+        .values([todo.model_dump() for todo in todos])
+        .returning(todo_table)
+    )
+
+
+def inserted_todos(rows) -> list[Todo]:
+    # bulk_insert() rows in request order. RETURNING promises no order, but
+    # the ids of one INSERT come from the sequence in VALUES order
+    return sorted((Todo(**row._mapping) for row in rows), key=lambda todo: todo.id)
+
+
+def bulk_update(todos: list[TodoBulkUpdate], dialect: str = "postgresql"):
+    # UPDATE todo SET ... FROM (VALUES ...) AS v WHERE todo.id = v.id RETURNING;
+    # a NULL in v leaves that column as it was
+    if dialect != "postgresql":
+        return bulk_update_case(todos)
+    rows = values(
+        column("id", Integer), column("content", String), column("status", Boolean),
+        name="v",
+    ).data([(todo.id, todo.content, todo.status) for todo in todos])
+    return (
+        update(todo_table)
+        .where(todo_table.c.id == rows.c.id)
+        .values(
+            content=func.coalesce(cast(rows.c.content, String), todo_table.c.content),
+            status=func.coalesce(cast(rows.c.status, Boolean), todo_table.c.status),
+            version=todo_table.c.version + 1,
+        )
+        .returning(todo_table)
+    )
+
+
+def bulk_update_case(todos: list[TodoBulkUpdate]):
+    # SQLite cannot name the columns of a VALUES list: one CASE on id per
+    # column instead, still a single statement
+    changes = {"version": todo_table.c.version + 1}
+    for name in ("content", "status"):
+        whens = {todo.id: getattr(todo, name) for todo in todos if getattr(todo, name) is not None}
+        if whens:
+            changes[name] = case(whens, value=todo_table.c.id, else_=todo_table.c[name])
+    return (
+        update(todo_table)
+        .where(todo_table.c.id.in_([todo.id for todo in todos]))
+        .values(**changes)
+        .returning(todo_table)
+    )
+
+
+def bulk_delete(ids: list[int], dialect: str = "postgresql"):
+    # a single array parameter keeps the statement text identical for any
+    # number of ids, so psycopg can reuse its prepared statement
+    if dialect == "postgresql":
+        condition = todo_table.c.id == any_(bindparam("ids", ids, type_=ARRAY(Integer)))
+    else:
+        condition = todo_table.c.id.in_(ids)
+    return delete(todo_table).where(condition).returning(todo_table)
+
+
+def bulk_results(ids: list[int], rows) -> list[TodoBulkResult]:
+    # one result per requested id, in request order
+    found = {row.id: Todo(**row._mapping) for row in rows}
+    return [
+        TodoBulkResult(id=todo_id, ok=True, todo=found[todo_id])
+        if todo_id in found
+        else TodoBulkResult(id=todo_id, ok=False, detail="Todo not found")
+        for todo_id in ids
+    ]
+
+
+class TodoOrder(str, Enum):
+    id = "id"
+    content = "content"
+
+
+def list_todos(
+    status: Optional[bool], order_by: TodoOrder, after: Optional[str], with_change_count: bool = False
+) -> Union[SelectOfScalar, Select]:
+    # Every combination is a range scan of one index: ix_todo_status_id_cover
+    # (ix_todo_status_id on SQLite) with a status filter,
+    # ix_todo_status_content_cover for content order within a status, the
+    # primary key or ix_todo_content without one. Raises ValueError for a cursor from another ordering.
+    # with_change_count adds the change counter to every row, read from the
+    # same snapshot as the page.
+    statement = select(Todo, change_count.scalar_subquery()) if with_change_count else select(Todo)
+    if status is not None:
+        statement = statement.where(Todo.status == status)
+    key = parse_after(order_by, after)
+    if order_by is TodoOrder.content:
+        return keyset_columns(statement, (Todo.content, Todo.id), key)
+    return keyset(statement, Todo.id, key[0] if key else None)
+
+
+def parse_after(order_by: TodoOrder, after: Optional[str]) -> Optional[tuple]:
+    # the sort key a page_cursor() stands for; raises ValueError for anything else
+    if not after:
+        return None
+    if order_by is TodoOrder.content:
+        content, todo_id = decode_cursor(after, 2)
+        if not isinstance(content, str) or not isinstance(todo_id, int):
+            raise ValueError(f"Invalid cursor: {after!r}")
+        return content, todo_id
+    return (int(after),)
+
+
+def page_cursor(todo: Todo, order_by: TodoOrder) -> str:
+    # id order keeps the plain id as its cursor, as before
+    if order_by is TodoOrder.content:
+        return encode_cursor((todo.content, todo.id))
+    return str(todo.id)
+
+
+def count_todos(conn: Connection, status: Optional[bool], exact_max_rows: int) -> tuple[int, bool]:
+    """Return (count, exact). Postgres tables above ``exact_max_rows``
+    rows get the planner's estimate instead of a count(*) that reads every
+    matching index entry."""
+    statement = select(func.count()).select_from(todo_table)
+    if status is not None:
+        statement = statement.where(todo_table.c.status == status)
+    if conn.dialect.name == "postgresql":
+        # refreshed by VACUUM and ANALYZE; -1 until the table is first analyzed
+        reltuples = conn.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = 'todo'::regclass")
+        ).scalar()
+        if reltuples is not None and reltuples > exact_max_rows:
+            if status is None:
+                return int(reltuples), False
+            plan = conn.execute(
+                text("EXPLAIN (FORMAT JSON) SELECT 1 FROM todo WHERE status = :status"),
+                {"status": status},
+            ).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"]), False
+    return conn.execute(statement).scalar(), True
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional, Protocol
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Two guards in front of the database, each off unless configured:
+#
+# - RateLimitMiddleware: a token bucket per client, the X-API-Key header
+#   (RATE_LIMIT_KEY_HEADER) or else the client's address, refilled at
+#   RATE_LIMIT_PER_SECOND up to RATE_LIMIT_BURST. A client out of tokens
+#   gets 429 with Retry-After. The buckets live in the worker
+#   (RATE_LIMIT_BACKEND=memory, so each worker allows the full rate) or in
+#   Redis, shared by all workers.
+# - AdmissionMiddleware (ADMISSION_CONTROL): at most as many requests in
+#   flight as the worker's pool has connections (DB_POOL_SIZE +
+#   DB_MAX_OVERFLOW). The rest wait in line for ADMISSION_QUEUE_TIMEOUT and
+#   are then turned away with 503, instead of piling up on the pool for
+#   DB_POOL_TIMEOUT and taking every other client's requests down with
+#   them.
+#
+# A flooding client runs out of tokens first; admission control covers
+# bursts from many clients at once. benchmarks/bench_admission.py measures
+# both against a flood of POST /todos.
+
+# served without the database, or held open for as long as the client
+# likes (SSE), so not counted against the pool
+UNADMITTED_PATHS = frozenset({
+    "/", "/metrics", "/cache/stats", "/pool/stats", "/todos/stream",
+    "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json",
+})
+
+
+class RateLimiter(Protocol):
+    # True when take() does network I/O, so it is moved off the event loop
+    blocking: bool
+
+    def take(self, key: str) -> float:
+        """Take a token from ``key``'s bucket: 0 when there was one, else
+        the seconds until there will be."""
+
+
+class MemoryRateLimiter:
+    blocking = False
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        # key -> (tokens, when counted), least recently seen first; only
+        # touched from the event loop, so no lock
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str) -> float:
+        now = self.clock()
+        tokens, counted = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - counted) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            # the longest idle client; its bucket has most likely refilled
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# the same bucket as MemoryRateLimiter, kept in a hash and timed by the
+# Redis server's clock so workers on different hosts agree
+TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "counted")
+local tokens = math.min(burst, (tonumber(state[1]) or burst) + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call("HSET", KEYS[1], "tokens", tokens, "counted", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter:
+    blocking = True
+
+    def __init__(self, url: str, rate: float, burst: int, prefix: str = "rp_poetry:ratelimit:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+
+    def take(self, key: str) -> float:
+        try:
+            return float(self.script(keys=[self.prefix + key], args=[self.rate, self.burst]))
+        except Exception:
+            # an unreachable Redis lets requests through rather than
+            # taking the API down with it
+            logger.warning("Rate limit backend unavailable", exc_info=True)
+            return 0.0
+
+
+def create_limiter(url: str, rate: float, burst: int) -> RateLimiter:
+    if url == "memory":
+        return MemoryRateLimiter(rate, burst)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRateLimiter(url, rate, burst)
+    raise ValueError(f"Unsupported rate limit backend: {url}")
+
+
+def client_key(scope: Scope, key_header: str) -> str:
+    api_key = Headers(scope=scope).get(key_header)
+    if api_key:
+        # keys are secrets; Redis only ever sees a digest
+        return "key:" + hashlib.blake2b(api_key.encode(), digest_size=16).hexdigest()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail}, status_code=status_code, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class RateLimitMiddleware:
+    # Plain ASGI like MetricsMiddleware. WebSocket handshakes are not
+    # limited; the connections they open are bounded by
+    # TODO_PUSH_MAX_SUBSCRIBERS.
+    def __init__(
+        self, app: ASGIApp, limiter: RateLimiter, key_header: str, on_reject: Optional[Callable[[str], None]] = None
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.key_header = key_header
+        self.on_reject = on_reject
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        key = client_key(scope, self.key_header)
+        if self.limiter.blocking:
+            wait = await run_in_threadpool(self.limiter.take, key)
+        else:
+            wait = self.limiter.take(key)
+        if wait:
+            if self.on_reject is not None:
+                self.on_reject("rate_limited")
+            await reject(429, "Rate limit exceeded", wait)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class AdmissionController:
+    """At most ``limit`` holders at a time, the others waiting first come,
+    first served for up to ``queue_timeout`` seconds. Only used from one
+    event loop."""
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.shed = 0
+        # each resolved True when handed a slot, False when its time is up
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            return False
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+
+        def expire():
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                waiter.set_result(False)
+
+        timer = loop.call_later(self.queue_timeout, expire)
+        try:
+            admitted = await waiter
+        except asyncio.CancelledError:
+            # the client went away; a slot handed over meanwhile goes on
+            # to the next in line
+            if waiter.cancelled():
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            elif waiter.result():
+                self.release()
+            raise
+        finally:
+            timer.cancel()
+        if not admitted:
+            self.shed += 1
+        return admitted
+
+    def release(self) -> None:
+        # straight to the next waiter, so nobody arriving meanwhile jumps
+        # the line; one cancelled but not yet removed is passed over
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict[str, int]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": len(self._waiters), "shed": self.shed}
+
+
+class AdmissionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        controller: AdmissionController,
+        retry_after: float,
+        on_reject: Optional[Callable[[str], None]] = None,
+    ):
+        self.app = app
+        self.controller = controller
+        self.retry_after = retry_after
+        self.on_reject = on_reject
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in UNADMITTED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        if not await self.controller.acquire():
+            if self.on_reject is not None:
+                self.on_reject("shed")
+            await reject(503, "Server busy", self.retry_after)(scope, receive, send)
+            return
+        try:
+            # held until the response is sent: a streamed export reads the
+            # database to the end
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
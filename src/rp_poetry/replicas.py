@@ -0,0 +1,84 @@
+import itertools
+import time
+from typing import Generic, Sequence, TypeVar, Union
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import QueuePool
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from rp_poetry import settings
+
+# Read replicas for the read-only routes (GET /todos, GET /todos/search),
+# configured with DATABASE_REPLICA_URLS. Writes, and every read a route
+# makes around a write, stay on the primary.
+#
+# Replicas lag behind the primary, so a client that has just written would
+# not always see its own write. Write responses set a cookie holding the
+# time until which that client reads from the primary too
+# (DB_READ_YOUR_WRITES_SECONDS). It is a cookie and not server state so
+# that it holds whichever worker the next request lands on.
+
+STICKY_COOKIE = "rp_primary_until"
+
+# methods that only read; any other marks the client as having written
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+E = TypeVar("E", Engine, AsyncEngine)
+
+
+class ReplicaSet(Generic[E]):
+    def __init__(self, engines: Sequence[E], policy: str):
+        if policy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown DB_REPLICA_POLICY: {policy!r}")
+        self.engines = list(engines)
+        self.policy = policy
+        # next() on a count is atomic under the GIL, no lock needed
+        self._turn = itertools.count()
+
+    def choose(self) -> E:
+        start = next(self._turn) % len(self.engines)
+        engines = self.engines[start:] + self.engines[:start]
+        if self.policy == "least_connections":
+            # fewest connections checked out, ties going round robin;
+            # pools that do not count (NullPool behind PgBouncer) only
+            # take turns
+            return min(engines, key=checked_out)
+        return engines[0]
+
+
+def checked_out(engine: Union[Engine, AsyncEngine]) -> int:
+    pool = engine.pool
+    return pool.checkedout() if isinstance(pool, QueuePool) else 0
+
+
+def wrote_recently(connection: HTTPConnection) -> bool:
+    try:
+        return float(connection.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReadYourWritesMiddleware:
+    # Plain ASGI like MetricsMiddleware. Only successful writes are marked:
+    # a rejected one changed nothing there is to read back.
+    def __init__(self, app: ASGIApp, window: float):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{STICKY_COOKIE}={time.time() + self.window:.3f}; Max-Age={int(self.window) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,275 @@
+import secrets
+import threading
+from bisect import bisect_right
+from typing import Annotated, Iterable, Iterator, Optional, Protocol
+
+from fastapi import Depends
+from sqlmodel import Session
+
+from rp_poetry import queries, settings
+from rp_poetry.db import get_read_session, get_session
+from rp_poetry.models import Todo, TodoCreate, TodoUpdate
+from rp_poetry.pagination import iter_ndjson
+from rp_poetry.queries import TodoOrder
+
+# Storage behind the core Todo routes (create, list, update, delete), chosen
+# by TODO_BACKEND:
+#
+# - "database": SqlTodoRepository over DATABASE_URL, Postgres or SQLite
+#   (which db.make_engine puts in WAL mode).
+# - "memory": one MemoryTodoStore per app, for tests and edge caches. It
+#   needs no database, is lost on restart and is not shared between workers.
+#
+# Search, sync, bulk writes, batching and push are built on SQL features
+# and are only served by the database backend. tests/test_repository.py
+# runs the same conformance tests against every backend.
+
+
+class TodoNotFound(Exception):
+    pass
+
+
+class TodoVersionMismatch(Exception):
+    # the todo exists, but not at any of the versions asked for (If-Match)
+    pass
+
+
+class TodoRepository(Protocol):
+    # names the data behind the repository; apps in one process share the
+    # response cache, so its keys start with this
+    store_id: str
+
+    def create(self, todo: TodoCreate) -> Todo: ...
+
+    def get(self, todo_id: int) -> Optional[Todo]: ...
+
+    def list_page(
+        self, status: Optional[bool], order_by: TodoOrder, after: Optional[str], limit: int
+    ) -> tuple[list[Todo], str, str]:
+        """A page of todos, the cursor of the next one ("" after the last
+        page) and the state_tag() the page shows ("" when writes made that
+        impossible to tell). Raises ValueError for a cursor from another
+        ordering."""
+
+    def state_tag(self) -> str:
+        """Changes with every write, so a page read at the same tag is the
+        same page: the ETag of GET /todos."""
+
+    def export(self, status: Optional[bool], order_by: TodoOrder, after: Optional[str]) -> Iterator[bytes]:
+        """Every matching todo as NDJSON, in chunks."""
+
+    def count(self, status: Optional[bool]) -> tuple[int, bool]:
+        """Return (count, exact)."""
+
+    def update(self, todo_id: int, todo: TodoUpdate, versions: Optional[list[int]] = None) -> Todo: ...
+
+    def delete(self, todo_id: int, versions: Optional[list[int]] = None) -> Todo: ...
+
+
+def database_id(bind) -> str:
+    # a database's store_id: its URL, without the password; ``bind`` is an
+    # engine or a connection, sync or async
+    return bind.engine.url.render_as_string(hide_password=True)
+
+
+class SqlTodoRepository:
+    # one per request, around the request's session; every write commits.
+    # Reads from a replica pass the primary's store_id, so every replica
+    # fills the same cache entries.
+    def __init__(self, session: Session, store_id: Optional[str] = None):
+        self.session = session
+        self.store_id = store_id or database_id(session.get_bind())
+
+    def create(self, todo: TodoCreate) -> Todo:
+        todo = Todo.model_validate(todo)
+        self.session.add(todo)
+        self.session.commit()
+        self.session.refresh(todo)
+        return todo
+
+    def get(self, todo_id: int) -> Optional[Todo]:
+        return self.session.get(Todo, todo_id)
+
+    def list_page(
+        self, status: Optional[bool], order_by: TodoOrder, after: Optional[str], limit: int
+    ) -> tuple[list[Todo], str, str]:
+        statement = queries.list_todos(status, order_by, after, with_change_count=True).limit(limit)
+        rows = self.session.exec(statement).all()
+        if not rows:
+            # no row to carry the count: read it, then make sure the page is
+            # still empty and the count the same, so nothing came in between
+            before = self.state_tag()
+            rows = self.session.exec(statement).all()
+            if not rows:
+                return [], "", before if self.state_tag() == before else ""
+        todos = [todo for todo, _ in rows]
+        cursor = queries.page_cursor(todos[-1], order_by) if len(todos) == limit else ""
+        return todos, cursor, str(rows[0][1])
+
+    def state_tag(self) -> str:
+        return str(queries.read_change_count(self.session.connection()))
+
+    def export(self, status: Optional[bool], order_by: TodoOrder, after: Optional[str]) -> Iterator[bytes]:
+        # validates the cursor now, not once the response has started
+        statement = queries.list_todos(status, order_by, after)
+        return iter_ndjson(self.session.get_bind(), statement, settings.TODO_STREAM_BATCH_SIZE)
+
+    def count(self, status: Optional[bool]) -> tuple[int, bool]:
+        return queries.count_todos(self.session.connection(), status, settings.TODO_COUNT_EXACT_MAX_ROWS)
+
+    def update(self, todo_id: int, todo: TodoUpdate, versions: Optional[list[int]] = None) -> Todo:
+        row = self.session.exec(queries.update_todo(todo_id, todo, versions)).first()
+        if not row:
+            self._missing(todo_id, versions)
+        self.session.commit()
+        return Todo(**row._mapping)
+
+    def delete(self, todo_id: int, versions: Optional[list[int]] = None) -> Todo:
+        row = self.session.exec(queries.delete_todo(todo_id, versions)).first()
+        if not row:
+            self._missing(todo_id, versions)
+        self.session.commit()
+        return Todo(**row._mapping)
+
+    def _missing(self, todo_id: int, versions: Optional[list[int]]):
+        # only a failed conditional write pays for telling 412 from 404
+        if versions is not None and self.session.get(Todo, todo_id) is not None:
+            raise TodoVersionMismatch()
+        raise TodoNotFound()
+
+
+class _Snapshot:
+    # an immutable state of the store; sorted keys per (status, order) are
+    # built on first use, which two readers may both do, harmlessly
+    def __init__(self, todos: dict[int, Todo], next_id: int, change: int):
+        self.todos = todos
+        self.next_id = next_id
+        # snapshots published before this one
+        self.change = change
+        self._indexes: dict[tuple[Optional[bool], TodoOrder], list[tuple]] = {}
+
+    def index(self, status: Optional[bool], order_by: TodoOrder) -> list[tuple]:
+        index = self._indexes.get((status, order_by))
+        if index is None:
+            todos = [todo for todo in self.todos.values() if status is None or todo.status == status]
+            if order_by is TodoOrder.content:
+                index = sorted((todo.content, todo.id) for todo in todos)
+            else:
+                index = sorted((todo.id,) for todo in todos)
+            self._indexes[(status, order_by)] = index
+        return index
+
+
+class MemoryTodoStore:
+    """Todos in this process's memory. Readers never take a lock: writers
+    are serialized and each publishes a new snapshot, so a read sees one
+    state from start to finish. A write copies the table, which suits the
+    small, read-mostly sets of tests and edge caches. Todos handed out are
+    shared with the store and must not be modified."""
+
+    def __init__(self, todos: Iterable[Todo] = ()):
+        # `todos` preloads the store in one go, ids included
+        self._write_lock = threading.Lock()
+        # tells this store's counts from another's, or from the same
+        # worker's before a restart
+        self._epoch = secrets.token_hex(4)
+        self.store_id = f"memory-{self._epoch}"
+        loaded = {todo.id: todo for todo in todos}
+        self._snapshot = _Snapshot(loaded, max(loaded, default=0) + 1, 0)
+
+    def create(self, todo: TodoCreate) -> Todo:
+        with self._write_lock:
+            snapshot = self._snapshot
+            todo_id = snapshot.next_id
+            stored = Todo(id=todo_id, content=todo.content, status=todo.status)
+            self._publish({**snapshot.todos, todo_id: stored}, todo_id + 1)
+        return stored
+
+    def get(self, todo_id: int) -> Optional[Todo]:
+        return self._snapshot.todos.get(todo_id)
+
+    def list_page(
+        self, status: Optional[bool], order_by: TodoOrder, after: Optional[str], limit: int
+    ) -> tuple[list[Todo], str, str]:
+        snapshot = self._snapshot
+        todos = [snapshot.todos[key[-1]] for key in self._page(snapshot, status, order_by, after, limit)]
+        cursor = queries.page_cursor(todos[-1], order_by) if len(todos) == limit else ""
+        return todos, cursor, self._tag(snapshot)
+
+    def state_tag(self) -> str:
+        return self._tag(self._snapshot)
+
+    def export(self, status: Optional[bool], order_by: TodoOrder, after: Optional[str]) -> Iterator[bytes]:
+        snapshot = self._snapshot
+        keys = self._page(snapshot, status, order_by, after, None)
+
+        def chunks():
+            batch_size = settings.TODO_STREAM_BATCH_SIZE
+            for start in range(0, len(keys), batch_size):
+                yield b"".join(
+                    snapshot.todos[key[-1]].model_dump_json().encode() + b"\n"
+                    for key in keys[start:start + batch_size]
+                )
+
+        return chunks()
+
+    def count(self, status: Optional[bool]) -> tuple[int, bool]:
+        return len(self._snapshot.index(status, TodoOrder.id)), True
+
+    def update(self, todo_id: int, todo: TodoUpdate, versions: Optional[list[int]] = None) -> Todo:
+        with self._write_lock:
+            snapshot = self._snapshot
+            current = self._current(snapshot, todo_id, versions)
+            # as in SQL: only the fields sent are written and bump the version
+            changes = todo.model_dump(exclude_none=True)
+            if not changes:
+                return current
+            updated = Todo(**{**current.model_dump(), **changes, "version": current.version + 1})
+            self._publish({**snapshot.todos, todo_id: updated}, snapshot.next_id)
+        return updated
+
+    def delete(self, todo_id: int, versions: Optional[list[int]] = None) -> Todo:
+        with self._write_lock:
+            snapshot = self._snapshot
+            current = self._current(snapshot, todo_id, versions)
+            todos = dict(snapshot.todos)
+            del todos[todo_id]
+            self._publish(todos, snapshot.next_id)
+        return current
+
+    def _current(self, snapshot: _Snapshot, todo_id: int, versions: Optional[list[int]]) -> Todo:
+        current = snapshot.todos.get(todo_id)
+        if current is None:
+            raise TodoNotFound()
+        if versions is not None and current.version not in versions:
+            raise TodoVersionMismatch()
+        return current
+
+    def _publish(self, todos: dict[int, Todo], next_id: int) -> None:
+        # one reference assignment; readers holding the old snapshot finish with it
+        self._snapshot = _Snapshot(todos, next_id, self._snapshot.change + 1)
+
+    def _tag(self, snapshot: _Snapshot) -> str:
+        return f"{self._epoch}.{snapshot.change}"
+
+    @staticmethod
+    def _page(
+        snapshot: _Snapshot, status: Optional[bool], order_by: TodoOrder, after: Optional[str], limit: Optional[int]
+    ) -> list[tuple]:
+        key = queries.parse_after(order_by, after)
+        index = snapshot.index(status, order_by)
+        start = bisect_right(index, key) if key is not None else 0
+        return index[start:start + limit] if limit is not None else index[start:]
+
+
+# create_app overrides both with the app's MemoryTodoStore when
+# TODO_BACKEND is "memory"
+def get_todo_repository(session: Annotated[Session, Depends(get_session)]) -> TodoRepository:
+    return SqlTodoRepository(session)
+
+
+def get_read_todo_repository(
+    session: Annotated[Session, Depends(get_read_session)], primary: Annotated[Session, Depends(get_session)]
+) -> TodoRepository:
+    # a replica's, unless the client has just written (see replicas.py)
+    return SqlTodoRepository(session, database_id(primary.get_bind()))
@@ -0,0 +1,29 @@
+from typing import Any, Mapping, Optional
+
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+from rp_poetry import settings
+
+
+def default_response_class(json_response: Optional[str] = None) -> type[JSONResponse]:
+    # JSON_RESPONSE=orjson renders every route through orjson, about twice as
+    # fast as json.dumps on large bodies; fail at startup, not on the first
+    # request, when the extra is not installed
+    if (json_response or settings.JSON_RESPONSE) == "orjson":
+        import orjson  # noqa: F401
+
+        return ORJSONResponse
+    return JSONResponse
+
+
+def dump_response(
+    adapter: TypeAdapter,
+    value: Any,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    # For values built from database rows through the model itself: skip
+    # FastAPI's response validation and jsonable_encoder and let
+    # pydantic-core write the bytes. The route's response_model still
+    # documents the shape.
+    return Response(adapter.dump_json(value), media_type="application/json", headers=headers)
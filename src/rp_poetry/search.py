@@ -0,0 +1,112 @@
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy import REAL, and_, cast, column, func, literal_column, or_, table
+from sqlalchemy.engine import Connection, Engine, Row
+from sqlmodel import select
+from sqlmodel.sql.expression import Select, SelectOfScalar
+
+from rp_poetry.models import Todo
+from rp_poetry.pagination import decode_cursor, encode_cursor
+
+# Search over Todo.content. Postgres keeps a stored tsvector column (not on
+# the model, so it never shows up in responses) with a GIN index; SQLite
+# keeps an external-content FTS5 table in sync with triggers. Prefix search
+# runs on lower(content) with a text_pattern_ops index. The columns and
+# indexes are created by migrations 2 and 3 in rp_poetry.migrations.
+#
+# Prefix results page on the id, and the cursor is the plain id. Fulltext
+# results page on (rank, id), so the cursor carries both and the next page
+# seeks on them, even once the row they came from is gone. Fulltext
+# statements select (Todo, rank) rows for search_cursor().
+
+TS_CONFIG = "english"
+
+class SearchMode(str, Enum):
+    prefix = "prefix"
+    fulltext = "fulltext"
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def fts5_query(q: str) -> str:
+    # quote every term so user input can never be read as FTS5 syntax
+    return " ".join('"%s"' % term.replace('"', '""') for term in q.split())
+
+
+def parse_after(mode: SearchMode, after: Optional[str]) -> Optional[tuple]:
+    # the sort key a search_cursor() stands for; raises ValueError for anything else
+    if not after:
+        return None
+    if mode is SearchMode.fulltext:
+        rank, todo_id = decode_cursor(after, 2)
+        if isinstance(rank, bool) or not isinstance(rank, (int, float)) or not isinstance(todo_id, int):
+            raise ValueError(f"Invalid cursor: {after!r}")
+        return float(rank), todo_id
+    return (int(after),)
+
+
+def search_cursor(mode: SearchMode, row: Todo | Row) -> str:
+    if mode is SearchMode.fulltext:
+        todo, rank = row
+        return encode_cursor((rank, todo.id))
+    return str(row.id)
+
+
+def search_statement(
+    bind: Engine | Connection,
+    q: str,
+    mode: SearchMode,
+    status: Optional[bool],
+    after: Optional[str],
+) -> Select | SelectOfScalar:
+    key = parse_after(mode, after)
+    if mode is SearchMode.prefix:
+        content = Todo.content if bind.dialect.name == "sqlite" else func.lower(Todo.content)
+        # ESCAPE is spelled out so SQLite, which has no default escape
+        # character, reads the pattern the same way as Postgres
+        statement = select(Todo).where(content.like(escape_like(q.lower()) + "%", escape="\\"))
+        if key is not None:
+            statement = statement.where(Todo.id > key[0])
+        statement = statement.order_by(Todo.id)
+    elif bind.dialect.name == "sqlite":
+        statement = sqlite_fulltext(q, key)
+    else:
+        statement = postgres_fulltext(q, key)
+    if status is not None:
+        statement = statement.where(Todo.status == status)
+    return statement
+
+
+def postgres_fulltext(q: str, key: Optional[tuple[float, int]]) -> Select:
+    query = func.websearch_to_tsquery(TS_CONFIG, q)
+    rank = func.ts_rank(literal_column("todo.content_tsv"), query)
+    statement = select(Todo, rank.label("rank")).where(literal_column("todo.content_tsv").op("@@")(query))
+    if key is not None:
+        # keyset on (rank DESC, id DESC). ts_rank() is a real; the cursor's
+        # rank is compared as one too, or ties would never be equal
+        after_rank, after_id = cast(key[0], REAL), key[1]
+        statement = statement.where(
+            or_(rank < after_rank, and_(rank == after_rank, Todo.id < after_id))
+        )
+    return statement.order_by(rank.desc(), Todo.id.desc())
+
+
+def sqlite_fulltext(q: str, key: Optional[tuple[float, int]]) -> Select:
+    match = fts5_query(q)
+    fts = table("todo_fts", column("rowid"))
+    # bm25() is lower-is-better
+    rank = func.bm25(literal_column("todo_fts"))
+    statement = (
+        select(Todo, rank.label("rank"))
+        .join(fts, fts.c.rowid == Todo.id)
+        .where(literal_column("todo_fts").op("MATCH")(match))
+    )
+    if key is not None:
+        after_rank, after_id = key
+        statement = statement.where(
+            or_(rank > after_rank, and_(rank == after_rank, Todo.id > after_id))
+        )
+    return statement.order_by(rank, Todo.id)
@@ -1,5 +1,8 @@
+import os
+import tempfile
+
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 try:
     config = Config(".env")
@@ -8,4 +11,195 @@ except FileNotFoundError:
 
 DATABASE_URL = config("DATABASE_URL", cast=Secret)
 
-TEST_DATABASE_URL = config("TEST_DATABASE_URL", cast=Secret)
\ No newline at end of file
+TEST_DATABASE_URL = config("TEST_DATABASE_URL", cast=Secret)
+
+# read replicas for GET /todos and GET /todos/search, comma separated
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", cast=CommaSeparatedStrings, default="")
+
+TODO_PAGE_SIZE = config("TODO_PAGE_SIZE", cast=int, default=100)
+
+TODO_MAX_PAGE_SIZE = config("TODO_MAX_PAGE_SIZE", cast=int, default=1000)
+
+TODO_STREAM_BATCH_SIZE = config("TODO_STREAM_BATCH_SIZE", cast=int, default=500)
+
+# GET /todos?include_total=true counts exactly up to this many rows in the
+# table and uses the planner's estimate above it (Postgres only)
+TODO_COUNT_EXACT_MAX_ROWS = config("TODO_COUNT_EXACT_MAX_ROWS", cast=int, default=100_000)
+
+# POST /todos write-behind batching: creates are queued and written as one
+# multi-row INSERT once TODO_CREATE_BATCH_SIZE have arrived or the first has
+# waited TODO_CREATE_BATCH_DELAY_MS; 0 commits every todo on its own
+TODO_CREATE_BATCH_SIZE = config("TODO_CREATE_BATCH_SIZE", cast=int, default=0)
+
+TODO_CREATE_BATCH_DELAY_MS = config("TODO_CREATE_BATCH_DELAY_MS", cast=float, default=2.0)
+
+# creates waiting beyond this are refused with 503 until the queue drains
+TODO_CREATE_QUEUE_SIZE = config("TODO_CREATE_QUEUE_SIZE", cast=int, default=10_000)
+
+# GET /todos/changes only returns changes older than this many milliseconds,
+# so writes still committing are not skipped by a client's cursor
+TODO_SYNC_LAG_MS = config("TODO_SYNC_LAG_MS", cast=int, default=1000)
+
+# tombstones of deleted todos are compacted after this many days; older
+# sync cursors get 410 and the client has to start over
+TODO_TOMBSTONE_RETENTION_DAYS = config("TODO_TOMBSTONE_RETENTION_DAYS", cast=float, default=30.0)
+
+# push todo changes to clients over GET /todos/stream (SSE) and /todos/ws
+TODO_PUSH_ENABLED = config("TODO_PUSH_ENABLED", cast=bool, default=False)
+
+# events queued per connection; a client that falls this far behind is
+# disconnected and has to catch up with GET /todos/changes
+TODO_PUSH_BUFFER = config("TODO_PUSH_BUFFER", cast=int, default=100)
+
+# open streams per worker, 0 for no limit
+TODO_PUSH_MAX_SUBSCRIBERS = config("TODO_PUSH_MAX_SUBSCRIBERS", cast=int, default=0)
+
+# seconds between keepalives on an idle stream
+TODO_PUSH_HEARTBEAT = config("TODO_PUSH_HEARTBEAT", cast=float, default=15.0)
+
+# seconds between change polls on databases without LISTEN/NOTIFY
+TODO_PUSH_POLL_INTERVAL = config("TODO_PUSH_POLL_INTERVAL", cast=float, default=1.0)
+
+# where todos are kept: "database" (DATABASE_URL, Postgres or SQLite) or
+# "memory", per worker and gone on restart, for tests and edge caches; the
+# memory backend serves only the core /todos routes
+TODO_BACKEND = config("TODO_BACKEND", default="database")
+
+# async routes for the database backend on Postgres; refused for SQLite
+DB_ASYNC = config("DB_ASYNC", cast=bool, default=False)
+
+TODO_BULK_MAX_ITEMS = config("TODO_BULK_MAX_ITEMS", cast=int, default=1000)
+
+# "memory" (per-worker LRU; a write on one worker leaves the others serving
+# their pages for up to TODO_CACHE_TTL), "off", or a redis:// URL shared by
+# all workers
+TODO_CACHE = config("TODO_CACHE", default="memory")
+
+TODO_CACHE_TTL = config("TODO_CACHE_TTL", cast=float, default=5.0)
+
+TODO_CACHE_MAX_ENTRIES = config("TODO_CACHE_MAX_ENTRIES", cast=int, default=1024)
+
+# "round_robin" or "least_connections" (fewest connections checked out)
+DB_REPLICA_POLICY = config("DB_REPLICA_POLICY", default="round_robin")
+
+# seconds a client reads from the primary after a write, so it sees its
+# own writes however far the replicas lag; 0 turns that off
+DB_READ_YOUR_WRITES_SECONDS = config("DB_READ_YOUR_WRITES_SECONDS", cast=float, default=5.0)
+
+DB_SSLMODE = config("DB_SSLMODE", default="require")
+
+DB_POOL_SIZE = config("DB_POOL_SIZE", cast=int, default=5)
+
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", cast=int, default=10)
+
+# seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", cast=float, default=30.0)
+
+# recycle connections after 5 minutes
+# to correspond with the compute scale down
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", cast=int, default=300)
+
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", cast=bool, default=False)
+
+# milliseconds, 0 disables the limit
+DB_STATEMENT_TIMEOUT = config("DB_STATEMENT_TIMEOUT", cast=int, default=0)
+
+# connect through PgBouncer in transaction mode: no client-side pool and no
+# server-side prepared statements
+DB_PGBOUNCER = config("DB_PGBOUNCER", cast=bool, default=False)
+
+# apply pending migrations when the app starts instead of refusing to start;
+# for development and single-worker setups, deployments run `rp-poetry migrate`
+DB_MIGRATE_ON_STARTUP = config("DB_MIGRATE_ON_STARTUP", cast=bool, default=False)
+
+# `rp-poetry serve` defaults
+HOST = config("HOST", default="127.0.0.1")
+
+PORT = config("PORT", cast=int, default=8000)
+
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", cast=int, default=1)
+
+# connections the database allows this deployment; `rp-poetry serve` divides
+# them between its workers, 0 leaves DB_POOL_SIZE/DB_MAX_OVERFLOW as they are
+DB_MAX_CONNECTIONS = config("DB_MAX_CONNECTIONS", cast=int, default=0)
+
+# seconds in-flight requests get to finish after SIGTERM
+GRACEFUL_TIMEOUT = config("GRACEFUL_TIMEOUT", cast=int, default=30)
+
+# requests per second each client (the RATE_LIMIT_KEY_HEADER header, else
+# its address) may make, in bursts of up to RATE_LIMIT_BURST; over it the
+# client gets 429. 0 turns rate limiting off
+RATE_LIMIT_PER_SECOND = config("RATE_LIMIT_PER_SECOND", cast=float, default=0.0)
+
+RATE_LIMIT_BURST = config("RATE_LIMIT_BURST", cast=int, default=20)
+
+RATE_LIMIT_KEY_HEADER = config("RATE_LIMIT_KEY_HEADER", default="X-API-Key")
+
+# "memory" (per worker, each allowing the full rate) or a redis:// URL
+# shared by all workers
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="memory")
+
+# let only as many requests at the database as the pool has connections
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW); the rest wait ADMISSION_QUEUE_TIMEOUT
+# seconds, ADMISSION_MAX_QUEUE at most, and then get 503
+ADMISSION_CONTROL = config("ADMISSION_CONTROL", cast=bool, default=False)
+
+ADMISSION_QUEUE_TIMEOUT = config("ADMISSION_QUEUE_TIMEOUT", cast=float, default=0.5)
+
+ADMISSION_MAX_QUEUE = config("ADMISSION_MAX_QUEUE", cast=int, default=100)
+
+# Retry-After, in seconds, on those 503s
+ADMISSION_RETRY_AFTER = config("ADMISSION_RETRY_AFTER", cast=float, default=1.0)
+
+METRICS_ENABLED = config("METRICS_ENABLED", cast=bool, default=True)
+
+# share of requests profiled, 0 to 1: every SQL statement timed and a
+# Server-Timing header on the response; 1 for debugging, 0.01 is cheap
+# enough for production
+PROFILE_SAMPLE_RATE = config("PROFILE_SAMPLE_RATE", cast=float, default=0.0)
+
+# profiled statements slower than this many milliseconds are flagged
+PROFILE_SLOW_QUERY_MS = config("PROFILE_SLOW_QUERY_MS", cast=float, default=100.0)
+
+# a statement run this many times in one profiled request is flagged (N+1)
+PROFILE_REPEATED_QUERY_THRESHOLD = config("PROFILE_REPEATED_QUERY_THRESHOLD", cast=int, default=3)
+
+# also log each profile as a JSON line (logger rp_poetry.profiling)
+PROFILE_LOG = config("PROFILE_LOG", cast=bool, default=False)
+
+# response compression, the first of these the client accepts: "gzip",
+# "br" (needs the brotli extra) or "zstd" (needs the zstd extra); empty
+# turns it off
+COMPRESSION_ENCODINGS = config("COMPRESSION_ENCODINGS", cast=CommaSeparatedStrings, default="gzip")
+
+# bodies smaller than this many bytes are sent as they are
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", cast=int, default=1024)
+
+# gzip 1-9, brotli 0-11, zstd 1-22; higher is smaller and slower
+COMPRESSION_GZIP_LEVEL = config("COMPRESSION_GZIP_LEVEL", cast=int, default=6)
+
+COMPRESSION_BROTLI_LEVEL = config("COMPRESSION_BROTLI_LEVEL", cast=int, default=4)
+
+COMPRESSION_ZSTD_LEVEL = config("COMPRESSION_ZSTD_LEVEL", cast=int, default=3)
+
+# bodies, and streamed chunks, of at least this many bytes are compressed
+# in the threadpool, off the event loop
+COMPRESSION_THREADPOOL_MIN_SIZE = config("COMPRESSION_THREADPOOL_MIN_SIZE", cast=int, default=64 * 1024)
+
+# "json" or "orjson" (needs the orjson extra)
+JSON_RESPONSE = config("JSON_RESPONSE", default="json")
+
+# JSON or CSV file for the fastneon item catalog, reloaded when it changes;
+# empty serves the built-in items
+ITEMS_CATALOG_PATH = config("ITEMS_CATALOG_PATH", default="")
+
+ITEMS_CATALOG_RELOAD_INTERVAL = config("ITEMS_CATALOG_RELOAD_INTERVAL", cast=float, default=2.0)
+
+# where POST /files/ streams uploads to, removed once the request is handled
+UPLOAD_DIR = config("UPLOAD_DIR", default=os.path.join(tempfile.gettempdir(), "rp-poetry-uploads"))
+
+# bytes buffered per upload before each write to disk
+UPLOAD_CHUNK_SIZE = config("UPLOAD_CHUNK_SIZE", cast=int, default=1024 * 1024)
+
+# largest accepted request body in bytes, all parts together
+UPLOAD_MAX_SIZE = config("UPLOAD_MAX_SIZE", cast=int, default=1024 * 1024 * 1024)
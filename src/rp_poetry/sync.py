@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Integer, MetaData, String, Table, delete, literal, literal_column, null, select,
+    text, tuple_, union_all,
+)
+from sqlalchemy.engine import Connection
+
+from rp_poetry.models import Todo, TodoChanges
+from rp_poetry.pagination import decode_cursor, encode_cursor
+
+# Incremental sync: GET /todos/changes returns the todos created or updated
+# and the ids deleted since a cursor, oldest first. todo.updated_at and the
+# todo_tombstone table are maintained by triggers (migration 8) and are not
+# part of the Todo model, so the list queries and their covering indexes
+# never read them.
+#
+# Timestamps are not commit order: a transaction can commit after another
+# one that started later. Only changes older than `lag` are handed out, so
+# a write still in flight when a client polls shows up on its next poll
+# instead of falling behind that client's cursor.
+
+# the database clock on SQLite, to the millisecond (CURRENT_TIMESTAMP is
+# whole seconds)
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# a cursor's id when every change at its timestamp has been handed out
+END_OF_TIMESTAMP = 2**63 - 1
+
+todo_table = Todo.__table__
+updated_at = literal_column("todo.updated_at", DateTime(timezone=True))
+tombstones = Table(
+    "todo_tombstone", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("deleted_at", DateTime(timezone=True), nullable=False),
+)
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def db_now(conn: Connection) -> datetime:
+    # one clock for the timestamps and the horizon: the database's
+    if conn.dialect.name == "sqlite":
+        return datetime.fromisoformat(conn.execute(text(f"SELECT {SQLITE_NOW}")).scalar())
+    return conn.execute(text("SELECT now()")).scalar()
+
+
+def bound_timestamp(conn: Connection, value: datetime):
+    # SQLite keeps timestamps as SQLITE_NOW text and compares them as
+    # strings, so the bound value has to be written the same way: with six
+    # fractional digits a row at the cursor's own millisecond sorts before it
+    if conn.dialect.name == "sqlite":
+        return literal(value.isoformat(sep=" ", timespec="milliseconds"), String)
+    return literal(value, DateTime(timezone=True))
+
+
+def parse_cursor(cursor: Optional[str], now: datetime) -> tuple[Optional[datetime], int]:
+    # raises ValueError for anything changes() did not produce
+    if not cursor:
+        return None, 0
+    changed_at, todo_id = decode_cursor(cursor, 2)
+    if not isinstance(changed_at, str) or not isinstance(todo_id, int):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    changed_at = datetime.fromisoformat(changed_at)
+    # Postgres hands out aware timestamps, SQLite naive UTC ones
+    if now.tzinfo is None and changed_at.tzinfo is not None:
+        changed_at = changed_at.astimezone(timezone.utc).replace(tzinfo=None)
+    elif now.tzinfo is not None and changed_at.tzinfo is None:
+        changed_at = changed_at.replace(tzinfo=timezone.utc)
+    return changed_at, todo_id
+
+
+def changes(
+    conn: Connection,
+    since: Optional[str],
+    limit: int,
+    lag: timedelta,
+    retention: timedelta,
+) -> TodoChanges:
+    """Changes after the ``since`` cursor (from the beginning without one).
+    Raises ValueError for a malformed cursor and CursorExpired for one older
+    than the tombstones kept, whose client has to sync from scratch."""
+    now = db_now(conn)
+    after, after_id = parse_cursor(since, now)
+    if after is not None and after < now - retention:
+        raise CursorExpired()
+    horizon = now - lag
+
+    def window(changed_at, id_column):
+        conditions = [changed_at <= bound_timestamp(conn, horizon)]
+        if after is not None:
+            conditions.append(
+                tuple_(changed_at, id_column) > tuple_(bound_timestamp(conn, after), literal(after_id))
+            )
+        return conditions
+
+    updated = select(
+        todo_table.c.id, todo_table.c.content, todo_table.c.status, todo_table.c.version,
+        updated_at.label("changed_at"), literal(False, Boolean).label("deleted"),
+    ).where(*window(updated_at, todo_table.c.id))
+    deleted = select(
+        tombstones.c.id, null().cast(String), null().cast(Boolean), null().cast(Integer),
+        tombstones.c.deleted_at.label("changed_at"), literal(True, Boolean).label("deleted"),
+    ).where(*window(tombstones.c.deleted_at, tombstones.c.id))
+    merged = union_all(updated, deleted).subquery()
+    rows = conn.execute(
+        select(merged).order_by(merged.c.changed_at, merged.c.id).limit(limit + 1)
+    ).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        cursor = (rows[-1].changed_at, rows[-1].id)
+    else:
+        # everything up to the horizon has been seen
+        cursor = (horizon, END_OF_TIMESTAMP)
+    return TodoChanges(
+        todos=[
+            Todo(id=row.id, content=row.content, status=row.status, version=row.version)
+            for row in rows if not row.deleted
+        ],
+        deleted=[row.id for row in rows if row.deleted],
+        cursor=encode_cursor((cursor[0].isoformat(), cursor[1])),
+        has_more=has_more,
+    )
+
+
+def head_cursor(conn: Connection, lag: timedelta) -> str:
+    """A cursor past every change so far, for following only new ones."""
+    return encode_cursor(((db_now(conn) - lag).isoformat(), END_OF_TIMESTAMP))
+
+
+def compact_tombstones(conn: Connection, retention: timedelta) -> int:
+    """Delete tombstones older than ``retention`` and return how many went.
+    Cursors older than that get 410 from GET /todos/changes."""
+    horizon = db_now(conn) - retention
+    return conn.execute(delete(tombstones).where(tombstones.c.deleted_at < horizon)).rowcount
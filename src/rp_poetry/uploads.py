@@ -0,0 +1,203 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Multipart uploads streamed straight from the request body to disk.
+# File(bytes) reads the whole upload into memory and UploadFile spools it
+# before the handler runs; here every file part is hashed and written one
+# chunk at a time, so a worker holds at most about chunk_size bytes per
+# upload whatever the file size.
+
+# form fields that are not files stay in memory, so keep them small
+MAX_FIELD_SIZE = 64 * 1024
+
+
+@dataclass
+class StoredFile:
+    filename: str
+    content_type: str
+    path: str
+    size: int = 0
+    sha256: str = ""
+
+
+@dataclass
+class StreamedForm:
+    fields: dict[str, str] = field(default_factory=dict)
+    files: dict[str, StoredFile] = field(default_factory=dict)
+
+    def remove_files(self) -> None:
+        for stored in self.files.values():
+            try:
+                os.remove(stored.path)
+            except FileNotFoundError:
+                pass
+
+
+class _Part:
+    def __init__(self, headers: dict[bytes, bytes], upload_dir: str):
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        self.name = options.get(b"name", b"").decode("latin-1")
+        self.file: Optional[StoredFile] = None
+        self.value = bytearray()
+        if b"filename" in options:
+            self.file = StoredFile(
+                filename=options[b"filename"].decode("utf-8", "replace"),
+                content_type=headers.get(b"content-type", b"application/octet-stream").decode("latin-1"),
+                path=os.path.join(upload_dir, uuid.uuid4().hex),
+            )
+            self.digest = hashlib.sha256()
+            self.handle: Optional[BinaryIO] = None
+
+
+class StreamingMultipartParser:
+    """Feed request body chunks in with ``write``, flush buffered file data
+    to disk with ``flush``. Parser callbacks only buffer; all disk I/O
+    happens in ``flush`` so it can run off the event loop."""
+
+    def __init__(self, boundary: bytes, upload_dir: str, chunk_size: int, max_size: int):
+        self.upload_dir = upload_dir
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.form = StreamedForm()
+        self.received = 0
+        self.complete = False
+        self.opened: list[BinaryIO] = []
+        self.part: Optional[_Part] = None
+        self.names: set[str] = set()
+        self.headers: dict[bytes, bytes] = {}
+        self.header_field = bytearray()
+        self.header_value = bytearray()
+        # (part, data or None to close) waiting for the next flush
+        self.pending: list[tuple[_Part, Optional[bytes]]] = []
+        self.pending_size = 0
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_end": self.on_end,
+        })
+
+    def on_part_begin(self) -> None:
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.headers[bytes(self.header_field).lower()] = bytes(self.header_value)
+        self.header_field.clear()
+        self.header_value.clear()
+
+    def on_headers_finished(self) -> None:
+        self.part = _Part(self.headers, self.upload_dir)
+        # a second part of the same name would replace the first, and a
+        # file already on disk would be left behind
+        if self.part.name in self.names:
+            raise HTTPException(status_code=400, detail=f"Duplicate form field {self.part.name!r}")
+        self.names.add(self.part.name)
+        if self.part.file is not None:
+            self.form.files[self.part.name] = self.part.file
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        part = self.part
+        if part.file is None:
+            part.value += data[start:end]
+            if len(part.value) > MAX_FIELD_SIZE:
+                raise HTTPException(status_code=413, detail=f"Form field {part.name!r} is too large")
+            return
+        chunk = data[start:end]
+        part.file.size += len(chunk)
+        part.digest.update(chunk)
+        self.pending.append((part, chunk))
+        self.pending_size += len(chunk)
+
+    def on_part_end(self) -> None:
+        part = self.part
+        if part.file is None:
+            self.form.fields[part.name] = part.value.decode("utf-8", "replace")
+        else:
+            part.file.sha256 = part.digest.hexdigest()
+            self.pending.append((part, None))
+
+    def on_end(self) -> None:
+        self.complete = True
+
+    def write(self, chunk: bytes) -> None:
+        self.received += len(chunk)
+        if self.received > self.max_size:
+            raise HTTPException(status_code=413, detail="Request body is too large")
+        self.parser.write(chunk)
+
+    @property
+    def needs_flush(self) -> bool:
+        return self.pending_size >= self.chunk_size or any(data is None for _, data in self.pending)
+
+    def flush(self) -> None:
+        pending, self.pending, self.pending_size = self.pending, [], 0
+        for part, data in pending:
+            if part.handle is None:
+                # opened on first use, so an empty file is still created
+                part.handle = open(part.file.path, "wb")
+                self.opened.append(part.handle)
+            if data is None:
+                part.handle.close()
+            else:
+                part.handle.write(data)
+
+    def close(self) -> None:
+        for handle in self.opened:
+            handle.close()
+
+
+async def stream_upload(request: Request, upload_dir: str, chunk_size: int, max_size: int) -> StreamedForm:
+    """Parse a multipart/form-data body without buffering file parts.
+
+    Bodies larger than ``max_size`` bytes and form fields larger than
+    MAX_FIELD_SIZE are refused with 413, and a malformed body or a repeated
+    part name with 400; either way the files written so far are removed.
+    Otherwise the files are the caller's, to move or to remove with
+    ``remove_files()`` once the request is handled.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > max_size:
+        # cheap early refusal, before a single byte of the body is read
+        raise HTTPException(status_code=413, detail="Request body is too large")
+
+    os.makedirs(upload_dir, exist_ok=True)
+    parser = StreamingMultipartParser(options[b"boundary"], upload_dir, chunk_size, max_size)
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if parser.needs_flush:
+                await run_in_threadpool(parser.flush)
+        parser.parser.finalize()
+        if not parser.complete:
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+        await run_in_threadpool(parser.flush)
+    except MultipartParseError as exc:
+        parser.close()
+        parser.form.remove_files()
+        raise HTTPException(status_code=400, detail="Malformed multipart body") from exc
+    except BaseException:
+        parser.close()
+        parser.form.remove_files()
+        raise
+    return parser.form
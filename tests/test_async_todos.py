@@ -0,0 +1,57 @@
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel.ext.asyncio.session import AsyncSession
+from rp_poetry import migrations, settings
+from rp_poetry.async_todos import router
+from rp_poetry.db import get_async_session, make_async_engine, make_engine
+
+def test_async_todo_round_trip():
+    engine = make_engine(settings.TEST_DATABASE_URL)
+    if engine.dialect.name != "postgresql":
+        # the async routes refuse anything else, see test_async_needs_postgres
+        pytest.skip("async mode is Postgres only")
+    migrations.upgrade(engine)
+    async_engine = make_async_engine(settings.TEST_DATABASE_URL)
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_async_session] = get_async_session_override
+
+    with TestClient(app=app) as client:
+        response = client.post("/todos", json={"content": "Async Biryani"})
+        assert response.status_code == 200
+        todo = response.json()
+
+        response = client.get("/todos", params={"after": todo["id"] - 1, "limit": 1})
+        assert response.json() == [todo]
+
+        response = client.get("/todos", params={"status": False, "include_total": True, "limit": 1})
+        assert int(response.headers["X-Total-Count"]) >= 1
+
+        response = client.get("/todos", params={"after": todo["id"] - 1, "stream": True})
+        assert json.loads(response.text.splitlines()[0]) == todo
+
+        response = client.put(f"/todos/{todo['id']}", json={"content": todo["content"], "status": True})
+        assert response.status_code == 200
+        assert response.json()["status"] is True
+
+        response = client.post("/todos/bulk", json=[{"content": "Async bulk"}])
+        bulk_id = response.json()[0]["id"]
+        response = client.patch("/todos/bulk", json=[{"id": bulk_id, "status": True}])
+        assert response.json()[0]["todo"]["status"] is True
+        response = client.request("DELETE", "/todos/bulk", json=[bulk_id])
+        assert response.json()[0]["ok"] is True
+
+        response = client.delete(f"/todos/{todo['id']}")
+        assert response.status_code == 200
+        assert client.delete(f"/todos/{todo['id']}").status_code == 404
+
+def test_async_needs_postgres():
+    with pytest.raises(ValueError):
+        make_async_engine("sqlite:///todos.db")
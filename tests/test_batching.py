@@ -0,0 +1,119 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from rp_poetry import db, migrations, settings
+from rp_poetry.cache import todo_cache
+from rp_poetry.batching import BatchQueueFull, InsertBatcher
+from rp_poetry.db import make_engine
+from rp_poetry.main import create_app
+from rp_poetry.models import Todo, TodoCreate
+
+def recording_flush(batches):
+    async def flush(todos):
+        batches.append([todo.content for todo in todos])
+        start = sum(len(batch) for batch in batches[:-1])
+        return [Todo(id=start + i + 1, **todo.model_dump()) for i, todo in enumerate(todos)]
+    return flush
+
+def test_batches_by_size_and_answers_each_caller():
+    batches, flushes = [], []
+
+    async def main():
+        batcher = InsertBatcher(recording_flush(batches), max_size=4, max_delay=0.05, queue_size=100)
+        batcher.on_flush = lambda size, seconds: flushes.append(size)
+        batcher.start()
+        todos = await asyncio.gather(*(batcher.submit(TodoCreate(content=f"t{i}")) for i in range(10)))
+        await batcher.stop()
+        return todos
+
+    todos = asyncio.run(main())
+    assert [todo.content for todo in todos] == [f"t{i}" for i in range(10)]
+    assert [todo.id for todo in todos] == list(range(1, 11))
+    assert [len(batch) for batch in batches] == flushes == [4, 4, 2]
+
+def test_answers_callers_whatever_the_returning_order():
+    batches = []
+    flush = recording_flush(batches)
+
+    async def reversed_flush(todos):
+        return list(reversed(await flush(todos)))
+
+    async def main():
+        batcher = InsertBatcher(reversed_flush, max_size=4, max_delay=0.05, queue_size=100)
+        batcher.start()
+        todos = await asyncio.gather(*(batcher.submit(TodoCreate(content=f"t{i}")) for i in range(4)))
+        await batcher.stop()
+        return todos
+
+    assert [todo.content for todo in asyncio.run(main())] == ["t0", "t1", "t2", "t3"]
+
+def test_flushes_after_delay():
+    batches = []
+
+    async def main():
+        batcher = InsertBatcher(recording_flush(batches), max_size=100, max_delay=0.01, queue_size=100)
+        batcher.start()
+        todo = await asyncio.wait_for(batcher.submit(TodoCreate(content="alone")), 1)
+        await batcher.stop()
+        return todo
+
+    assert asyncio.run(main()).id == 1
+    assert batches == [["alone"]]
+
+def test_full_queue_is_refused():
+    async def main():
+        never = asyncio.Event()
+
+        async def flush(todos):
+            await never.wait()
+
+        batcher = InsertBatcher(flush, max_size=1, max_delay=0, queue_size=1)
+        batcher.start()
+        first = asyncio.ensure_future(batcher.submit(TodoCreate(content="flushing")))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(batcher.submit(TodoCreate(content="queued")))
+        await asyncio.sleep(0)
+        with pytest.raises(BatchQueueFull):
+            await batcher.submit(TodoCreate(content="refused"))
+        for task in (first, second, batcher._task):
+            task.cancel()
+
+    asyncio.run(main())
+
+def test_flush_error_reaches_every_caller():
+    async def main():
+        async def flush(todos):
+            raise RuntimeError("database down")
+
+        batcher = InsertBatcher(flush, max_size=10, max_delay=0.01, queue_size=10)
+        batcher.start()
+        results = await asyncio.gather(
+            *(batcher.submit(TodoCreate(content=str(i))) for i in range(3)), return_exceptions=True
+        )
+        await batcher.stop()
+        return results
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main()))
+
+def test_batched_create_route(tmp_path, monkeypatch):
+    engine = make_engine(f"sqlite:///{tmp_path}/batching.db")
+    migrations.upgrade(engine)
+    monkeypatch.setattr(db, "engine", engine)
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app_settings.DB_MIGRATE_ON_STARTUP = False
+    app_settings.TODO_CREATE_BATCH_SIZE = 10
+    todo_cache.invalidate()
+
+    with TestClient(app=create_app(app_settings)) as client:
+        assert client.get("/todos").json() == []
+        response = client.post("/todos", json={"content": "Batched", "status": True})
+        assert response.status_code == 200
+        todo = response.json()
+        assert todo["content"] == "Batched" and todo["id"] is not None
+        # the cache is invalidated by the batch, not left stale
+        assert client.get("/todos").json() == [todo]
@@ -0,0 +1,50 @@
+from rp_poetry.cache import LRUCache, ResponseCache, etag_matches
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert cache.evictions == 1
+
+def test_lru_cache_expires_entries():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=2, ttl=5, clock=clock)
+    cache.set("a", b"1")
+    clock.now = 4.9
+    assert cache.get("a") == b"1"
+    clock.now = 5
+    assert cache.get("a") is None
+    assert cache.evictions == 1
+    assert len(cache) == 0
+
+def test_response_cache_skips_stale_fill():
+    cache = ResponseCache(LRUCache(maxsize=8, ttl=60))
+    generation = cache.generation
+    cache.invalidate()
+    entry = cache.put("todos", b"[]", "", generation, '"todos-1"')
+    assert cache.get("todos", cache.generation) is None
+    cache.put("todos", b"[]", "", cache.generation, '"todos-1"')
+    assert cache.get("todos", cache.generation) == entry
+    # nothing to revalidate against, so not kept
+    cache.put("untagged", b"[]", "", cache.generation, "")
+    assert cache.get("untagged", cache.generation) is None
+    # the stale fill is kept, under a generation no reader asks for
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0, "entries": 2}
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"abc"', 'W/"xyz", W/"abc"')
+    assert etag_matches('"abc"', "*")
+    assert not etag_matches('"abc"', '"ab"')
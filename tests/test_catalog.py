@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from rp_poetry.catalog import Catalog
+
+class Item(BaseModel):
+    name: str
+    description: str | None = None
+    price: float
+    tax: float = 10.5
+
+PROJECTIONS = {
+    "full": {},
+    "name": {"include": {"name", "description"}},
+    "public": {"exclude": {"tax"}},
+}
+
+def test_catalog_projections():
+    catalog = Catalog(Item, PROJECTIONS)
+    catalog.load({"foo": {"name": "Foo", "price": 50.2}})
+    assert len(catalog) == 1
+    assert json.loads(catalog.get("foo", "full")) == {"name": "Foo", "description": None, "price": 50.2, "tax": 10.5}
+    assert json.loads(catalog.get("foo", "name")) == {"name": "Foo", "description": None}
+    assert json.loads(catalog.get("foo", "public")) == {"name": "Foo", "description": None, "price": 50.2}
+    assert catalog.get("bar", "full") is None
+    assert catalog.item("foo") == Item(name="Foo", price=50.2)
+
+def test_catalog_load_is_all_or_nothing():
+    catalog = Catalog(Item, PROJECTIONS)
+    catalog.load({"foo": {"name": "Foo", "price": 50.2}})
+    with pytest.raises(ValidationError):
+        catalog.load({"bar": {"name": "Bar", "price": 1}, "baz": {"name": "Baz"}})
+    assert catalog.get("foo", "name") is not None
+    assert catalog.get("bar", "name") is None
+
+def test_catalog_csv(tmp_path):
+    path = tmp_path / "items.csv"
+    path.write_text("id,name,description,price,tax\nfoo,Foo,,50.2,\nbar,Bar,The Bar fighters,62,20.2\n")
+    catalog = Catalog(Item, PROJECTIONS)
+    catalog.load_file(str(path))
+    assert catalog.item("foo") == Item(name="Foo", price=50.2)
+    assert catalog.item("bar") == Item(name="Bar", description="The Bar fighters", price=62, tax=20.2)
+
+def test_catalog_reload_if_changed(tmp_path):
+    path = tmp_path / "items.json"
+    path.write_text(json.dumps({"foo": {"name": "Foo", "price": 1}}))
+    catalog = Catalog(Item, PROJECTIONS)
+    catalog.load_file(str(path))
+    assert catalog.reload_if_changed() is False
+
+    path.write_text(json.dumps({"foo": {"name": "Foo", "price": 2}}))
+    os.utime(path, (1, 1))
+    assert catalog.reload_if_changed() is True
+    assert catalog.item("foo").price == 2
+
+    # a broken file is logged and skipped, the last good catalog keeps serving
+    path.write_text("{not json")
+    os.utime(path, (2, 2))
+    assert catalog.reload_if_changed() is False
+    assert catalog.item("foo").price == 2
+
+def test_catalog_etag(tmp_path):
+    catalog = Catalog(Item, PROJECTIONS)
+    catalog.load({"foo": {"name": "Foo", "price": 1}})
+    etag = catalog.etag
+    catalog.load({"foo": {"name": "Foo", "price": 2}})
+    assert catalog.etag != etag
+    # the same items in another worker get the same tag
+    other = Catalog(Item, PROJECTIONS)
+    other.load({"foo": {"name": "Foo", "price": 1}})
+    assert other.etag == etag
+
+    # every worker loading the same file tags it alike
+    path = tmp_path / "items.json"
+    path.write_text(json.dumps({"foo": {"name": "Foo", "price": 1}}))
+    tags = set()
+    for _ in range(2):
+        catalog = Catalog(Item, PROJECTIONS)
+        catalog.load_file(str(path))
+        tags.add(catalog.etag)
+    assert len(tags) == 1
+
+def test_catalog_watch_stops(tmp_path):
+    path = tmp_path / "items.json"
+    path.write_text(json.dumps({"foo": {"name": "Foo", "price": 1}}))
+    catalog = Catalog(Item, PROJECTIONS)
+    catalog.load_file(str(path))
+    catalog.watch(60)
+    watcher = catalog._watcher
+    assert watcher.is_alive()
+    # stop wakes the sleeping thread instead of waiting out the interval
+    catalog.stop()
+    assert not watcher.is_alive()
+    assert catalog._watcher is None
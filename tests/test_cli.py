@@ -0,0 +1,35 @@
+import os
+
+import pytest
+import uvicorn
+
+from rp_poetry import cli, settings
+
+def test_pool_budget():
+    assert cli.pool_budget(40, 4) == (5, 5)
+    assert cli.pool_budget(40, 4, engines=2) == (2, 3)
+    assert cli.pool_budget(3, 3) == (1, 0)
+    # a LISTEN connection per worker comes off the top
+    assert cli.pool_budget(44, 4, dedicated=1) == (5, 5)
+    with pytest.raises(ValueError):
+        cli.pool_budget(3, 4)
+
+def test_serve_divides_connections(monkeypatch):
+    calls = []
+    monkeypatch.setattr(uvicorn, "run", lambda app, **options: calls.append((app, options)))
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", False)
+    monkeypatch.setattr(settings, "DB_ASYNC", False)
+    monkeypatch.setattr(settings, "TODO_PUSH_ENABLED", False)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", settings.DB_POOL_SIZE)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", settings.DB_MAX_OVERFLOW)
+    monkeypatch.delenv("DB_POOL_SIZE", raising=False)
+    monkeypatch.delenv("DB_MAX_OVERFLOW", raising=False)
+
+    assert cli.main(["serve", "--workers", "4", "--db-connections", "40", "--loop", "uvloop", "--http", "httptools"]) == 0
+    app, options = calls[0]
+    assert app == "rp_poetry.main:app"
+    assert options["workers"] == 4
+    assert options["loop"] == "uvloop" and options["http"] == "httptools"
+    assert options["timeout_graceful_shutdown"] == settings.GRACEFUL_TIMEOUT
+    assert (settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW) == (5, 5)
+    assert (os.environ["DB_POOL_SIZE"], os.environ["DB_MAX_OVERFLOW"]) == ("5", "5")
\ No newline at end of file
@@ -0,0 +1,126 @@
+import gzip
+import json
+from types import SimpleNamespace
+
+import brotli
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from rp_poetry import settings
+from rp_poetry.compression import CompressionMiddleware, compressors, negotiate
+from rp_poetry.main import create_app
+from rp_poetry.metrics import http_requests
+
+LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+
+def make_settings(**overrides) -> SimpleNamespace:
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app_settings.TODO_BACKEND = "memory"
+    for name, value in overrides.items():
+        setattr(app_settings, name, value)
+    return app_settings
+
+def make_client(body: bytes, **options) -> TestClient:
+    def page(request):
+        return Response(body, media_type="application/json", headers={"ETag": '"page"'})
+
+    def stream(request):
+        return StreamingResponse(iter([body, body]), media_type="application/x-ndjson")
+
+    def events(request):
+        return StreamingResponse(iter([body]), media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/page", page), Route("/stream", stream), Route("/events", events)])
+    options = {"min_size": 100, "threadpool_min_size": 1000, **options}
+    return TestClient(CompressionMiddleware(app, encodings=compressors(["zstd", "br", "gzip"], LEVELS), **options))
+
+def test_negotiate():
+    encodings = ["zstd", "br", "gzip"]
+    assert negotiate("gzip, deflate, br", encodings) == "br"
+    assert negotiate("br;q=0, gzip;q=0.5", encodings) == "gzip"
+    assert negotiate("*", encodings) == "zstd"
+    assert negotiate("identity", encodings) is None
+    assert negotiate("", encodings) is None
+    with pytest.raises(ValueError):
+        compressors(["deflate"], LEVELS)
+
+@pytest.mark.parametrize("encoding, decompress", [
+    ("gzip", gzip.decompress),
+    ("br", brotli.decompress),
+    ("zstd", lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)),
+])
+def test_streamed_chunks_decompress(encoding, decompress):
+    compressor = compressors([encoding], LEVELS)[encoding]()
+    chunks = [b'{"id": %d}\n' % i * 50 for i in range(3)]
+    # every chunk flushed, the last one closing the stream
+    data = b"".join(compressor.compress(chunk, final=i == 2) for i, chunk in enumerate(chunks))
+    assert decompress(data) == b"".join(chunks)
+
+@pytest.mark.parametrize("threadpool_min_size", [1000, 0])
+def test_compresses_large_bodies(threadpool_min_size):
+    body = json.dumps([{"id": i, "content": "Eating Biryani"} for i in range(50)]).encode()
+    client = make_client(body, threadpool_min_size=threadpool_min_size)
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(body)
+    assert response.headers["ETag"] == '"page-gzip"'
+    assert response.content == body
+
+    response = client.get("/page", headers={"Accept-Encoding": "br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.content == body
+
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert response.content == body * 2
+
+def test_leaves_small_and_unencodable_bodies():
+    client = make_client(b'{"id": 1}')
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == '"page"'
+    assert response.content == b'{"id": 1}'
+
+    client = make_client(b"data: x\n\n" * 100)
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+def test_list_revalidates_compressed():
+    app = create_app(make_settings(COMPRESSION_ENCODINGS=["gzip"], COMPRESSION_MIN_SIZE=100))
+    client = TestClient(app=app)
+    for i in range(20):
+        client.post("/todos", json={"content": f"Todo {i}"})
+    response = client.get("/todos", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    assert etag.startswith('"todos-') and etag.endswith('-gzip"')
+
+    response = client.get("/todos", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    client.post("/todos", json={"content": "One more"})
+    response = client.get("/todos", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_compressed_304_keeps_route_label():
+    app = create_app(make_settings(METRICS_ENABLED=True, COMPRESSION_ENCODINGS=["gzip"], COMPRESSION_MIN_SIZE=100))
+    client = TestClient(app=app)
+    for i in range(20):
+        client.post("/todos", json={"content": f"Todo {i}"})
+    etag = client.get("/todos", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    before = http_requests.values.get(("GET", "/todos", "304"), 0)
+    response = client.get("/todos", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert http_requests.values[("GET", "/todos", "304")] == before + 1
@@ -0,0 +1,76 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from rp_poetry import migrations, settings
+from rp_poetry.conditional import if_match_versions
+from rp_poetry.db import make_engine
+from rp_poetry.main import app, get_session
+
+
+@pytest.fixture(params=["postgresql", "sqlite"])
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        url = f"sqlite:///{tmp_path}/conditional.db"
+    else:
+        url = settings.TEST_DATABASE_URL
+    engine = make_engine(url)
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    with Session(engine) as session:
+        app.dependency_overrides[get_session] = lambda: session
+        yield TestClient(app=app)
+    app.dependency_overrides.pop(get_session, None)
+
+
+def test_if_match_versions():
+    assert if_match_versions(None) is None
+    assert if_match_versions(" * ") is None
+    assert if_match_versions('"3"') == [3]
+    assert if_match_versions('"3", W/"4", "x", "5"') == [3, 5]
+    assert if_match_versions('W/"4"') == []
+
+
+def test_put_with_if_match(client):
+    response = client.post("/todos", json={"content": "Versioned"})
+    todo = response.json()
+    assert todo["version"] == 1
+    assert response.headers["ETag"] == '"1"'
+
+    # two clients toggle from the same version: the second one loses
+    response = client.put(f"/todos/{todo['id']}", json={"status": True}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["ETag"] == '"2"'
+    response = client.put(f"/todos/{todo['id']}", json={"status": False}, headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+
+    # unconditional writes still work and still bump the version
+    response = client.put(f"/todos/{todo['id']}", json={"content": "Renamed"})
+    assert response.json()["version"] == 3
+    # an empty body changes nothing, so the version stays
+    response = client.put(f"/todos/{todo['id']}", json={}, headers={"If-Match": '"3"'})
+    assert response.json()["version"] == 3
+
+    assert client.put("/todos/0", json={"status": True}, headers={"If-Match": '"1"'}).status_code == 404
+
+
+def test_delete_with_if_match(client):
+    todo = client.post("/todos", json={"content": "Deleted"}).json()
+    client.put(f"/todos/{todo['id']}", json={"status": True})
+
+    assert client.delete(f"/todos/{todo['id']}", headers={"If-Match": '"1"'}).status_code == 412
+    response = client.delete(f"/todos/{todo['id']}", headers={"If-Match": '"1", "2"'})
+    assert response.status_code == 200
+    assert client.delete(f"/todos/{todo['id']}", headers={"If-Match": '"2"'}).status_code == 404
+
+
+def test_bulk_update_bumps_version(client):
+    todo = client.post("/todos", json={"content": "Bulk"}).json()
+    response = client.patch("/todos/bulk", json=[{"id": todo["id"], "status": True}])
+    assert response.json()[0]["todo"]["version"] == 2
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import pytest
+from sqlalchemy.exc import TimeoutError
+from rp_poetry.db import WaitCountingQueuePool, connection_url, pool_stats
+
+def test_connection_url_uses_psycopg():
+    assert connection_url("postgresql://u:p@host/db") == "postgresql+psycopg://u:p@host/db"
+    assert connection_url("postgres://u:p@host/db") == "postgresql+psycopg://u:p@host/db"
+    assert connection_url("postgresql+psycopg://u:p@host/db") == "postgresql+psycopg://u:p@host/db"
+    assert connection_url("sqlite:///todos.db") == "sqlite:///todos.db"
+
+def test_pool_counts_waits_and_timeouts():
+    pool = WaitCountingQueuePool(
+        lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=0, timeout=0.01
+    )
+    connection = pool.connect()
+    assert pool_stats(pool)["checked_out"] == 1
+    with pytest.raises(TimeoutError):
+        pool.connect()
+    connection.close()
+    pool.connect().close()
+
+    stats = pool_stats(pool)
+    assert stats["waits"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["wait_seconds"] >= 0.01
+    assert stats["checked_out"] == 0
+    assert stats["overflow"] == 0
+
+def test_fork_starts_with_fresh_engines(monkeypatch):
+    from rp_poetry import db
+
+    monkeypatch.setattr(db, "engine", db.make_engine("sqlite://"))
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if db.engine is None else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert db.engine is not None
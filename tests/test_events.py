@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from rp_poetry import db, migrations, settings
+from rp_poetry.db import make_engine
+from rp_poetry.events import Broadcaster, EventStreamResponse, TooManySubscribers, sse_events
+from rp_poetry.main import create_app
+
+def test_fan_out_and_slow_consumer_eviction():
+    async def main():
+        broadcaster = Broadcaster(buffer=2, max_subscribers=0)
+        fast, slow = broadcaster.subscribe(), broadcaster.subscribe()
+        received = []
+        for event in ("a", "b", "c"):
+            broadcaster.publish(event)
+            received.append(await fast.get(1))
+        # slow never read: its backlog is dropped and it is told to go
+        assert slow.evicted and await slow.get(1) is None
+        assert not fast.evicted and received == ["a", "b", "c"]
+        assert await fast.get(0.01) == ""
+        return broadcaster.stats()
+
+    assert asyncio.run(main()) == {"connected": 0, "subscribers": 1, "published": 3, "evictions": 1}
+
+def test_max_subscribers():
+    async def main():
+        broadcaster = Broadcaster(buffer=1, max_subscribers=1)
+        first = broadcaster.subscribe()
+        with pytest.raises(TooManySubscribers):
+            broadcaster.subscribe()
+        broadcaster.unsubscribe(first)
+        broadcaster.subscribe()
+
+    asyncio.run(main())
+
+def test_sse_format():
+    async def main():
+        broadcaster = Broadcaster(buffer=1, max_subscribers=0)
+        subscription = broadcaster.subscribe()
+        broadcaster.publish('{"id": 1}')
+        broadcaster.publish('{"id": 2}')
+        return [chunk async for chunk in sse_events(broadcaster, subscription)], broadcaster.stats()
+
+    chunks, stats = asyncio.run(main())
+    assert chunks == [b": connected\n\n", b'event: evicted\ndata: {"reason": "slow consumer"}\n\n']
+    assert stats["subscribers"] == 0
+
+def test_stream_unsubscribes_a_client_gone_before_the_body():
+    async def main():
+        broadcaster = Broadcaster(buffer=1, max_subscribers=1)
+        subscription = broadcaster.subscribe()
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client went away")
+
+        with pytest.raises(Exception):
+            await EventStreamResponse(broadcaster, subscription)({"type": "http"}, receive, send)
+        return broadcaster.stats()["subscribers"]
+
+    assert asyncio.run(main()) == 0
+
+@pytest.fixture(params=["postgresql", "sqlite"])
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        engine = make_engine(f"sqlite:///{tmp_path}/events.db")
+    else:
+        engine = make_engine(str(settings.TEST_DATABASE_URL))
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+def test_websocket_receives_changes(engine, monkeypatch):
+    # Postgres LISTENs, SQLite is polled
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(settings, "TODO_SYNC_LAG_MS", 0)
+    monkeypatch.setattr(settings, "TODO_PUSH_POLL_INTERVAL", 0.05)
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app_settings.DB_MIGRATE_ON_STARTUP = False
+    app_settings.TODO_PUSH_ENABLED = True
+
+    app = create_app(app_settings)
+    with TestClient(app=app) as client, client.websocket_connect("/todos/ws") as websocket:
+        deadline = time.monotonic() + 5
+        while not app.state.todo_broadcaster.connected:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        def next_event(todo_id):
+            while True:
+                event = json.loads(websocket.receive_text())
+                if event["id"] == todo_id:
+                    return event
+
+        # one write at a time: a poll sees only the latest state of a todo
+        todo = client.post("/todos", json={"content": "Pushed", "status": False}).json()
+        assert next_event(todo["id"]) == {"type": "created", "id": todo["id"], "version": 1}
+        client.put(f"/todos/{todo['id']}", json={"status": True})
+        assert next_event(todo["id"]) == {"type": "updated", "id": todo["id"], "version": 2}
+        client.delete(f"/todos/{todo['id']}")
+        assert next_event(todo["id"]) == {"type": "deleted", "id": todo["id"]}
@@ -0,0 +1,115 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session, func, select
+
+from rp_poetry import migrations, queries, settings
+from rp_poetry.db import make_engine
+from rp_poetry.main import app, get_session
+from rp_poetry.models import Todo
+from rp_poetry.pagination import encode_cursor
+from rp_poetry.queries import TodoOrder
+from tests.test_search import explain
+
+
+@pytest.fixture(params=["postgresql", "sqlite"])
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        url = f"sqlite:///{tmp_path}/listing.db"
+    else:
+        url = settings.TEST_DATABASE_URL
+    engine = make_engine(url)
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    with Session(engine) as session:
+        app.dependency_overrides[get_session] = lambda: session
+        yield TestClient(app=app)
+    app.dependency_overrides.pop(get_session, None)
+
+
+def test_status_filter_pages_by_id(client):
+    ids = [client.post("/todos", json={"content": f"Open {i}", "status": i % 2 == 1}).json()["id"] for i in range(5)]
+    done = [ids[1], ids[3]]
+
+    response = client.get("/todos", params={"status": True, "after": ids[0] - 1, "limit": 1})
+    assert [todo["id"] for todo in response.json()] == done[:1]
+    assert all(todo["status"] for todo in response.json())
+    response = client.get("/todos", params={"status": True, "after": response.headers["X-Next-Cursor"], "limit": 1})
+    assert [todo["id"] for todo in response.json()] == done[1:]
+
+
+def test_order_by_content_pages(client):
+    tag = uuid.uuid4().hex
+    for content in ("b", "a", "c", "a"):
+        client.post("/todos", json={"content": f"{tag} {content}"})
+
+    # start just before this test's rows
+    cursor, seen = encode_cursor((tag, 0)), []
+    for _ in range(2):
+        response = client.get("/todos", params={"order_by": "content", "after": cursor, "limit": 2})
+        seen += response.json()
+        cursor = response.headers["X-Next-Cursor"]
+    assert [todo["content"] for todo in seen] == [f"{tag} a", f"{tag} a", f"{tag} b", f"{tag} c"]
+    assert seen[0]["id"] < seen[1]["id"]
+
+
+def test_invalid_cursor(client):
+    assert client.get("/todos", params={"after": "abc"}).status_code == 422
+    assert client.get("/todos", params={"order_by": "content", "after": "12"}).status_code == 422
+
+
+def test_include_total(client, engine):
+    client.post("/todos", json={"content": "Counted", "status": True})
+    with engine.connect() as conn:
+        expected = conn.execute(select(func.count()).select_from(Todo).where(Todo.status == True)).scalar()  # noqa: E712
+
+    response = client.get("/todos", params={"status": True, "include_total": True, "limit": 1})
+    assert response.headers["X-Total-Count"] == str(expected)
+    assert response.headers["X-Total-Count-Exact"] == "true"
+    assert "X-Total-Count" not in client.get("/todos", params={"limit": 1}).headers
+
+
+def test_count_estimate(engine):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("estimates come from pg_class")
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE todo"))
+        total = conn.execute(select(func.count()).select_from(Todo)).scalar()
+        estimate, exact = queries.count_todos(conn, None, exact_max_rows=0)
+        assert not exact and abs(estimate - total) <= max(10, total // 10)
+        estimate, exact = queries.count_todos(conn, False, exact_max_rows=0)
+        assert not exact and 0 < estimate <= total
+
+
+@pytest.mark.parametrize("order_by", list(TodoOrder))
+def test_status_filter_uses_covering_index(engine, order_by):
+    postgres = engine.dialect.name == "postgresql"
+    with engine.connect() as conn, conn.begin() as transaction:
+        if postgres:
+            # open todos as the minority, as in a long-lived list; rolled back
+            conn.execute(text(
+                "INSERT INTO todo (content, status) SELECT 'Done ' || i, true FROM generate_series(1, 5000) i"
+            ))
+            conn.execute(text("ANALYZE todo"))
+            conn.execute(text("SET LOCAL enable_bitmapscan = off"))
+        plan = explain(conn, queries.list_todos(False, order_by, None).limit(10))
+        count_plan = explain(conn, select(func.count()).select_from(Todo).where(Todo.status == False))  # noqa: E712
+        transaction.rollback()
+    if order_by is TodoOrder.content:
+        index = "ix_todo_status_content_cover"
+    else:
+        index = "ix_todo_status_id_cover" if postgres else "ix_todo_status_id"
+    assert index in plan
+    if postgres:
+        assert "Index Only Scan" in plan and "Index Only Scan" in count_plan
+    else:
+        assert "COVERING INDEX" in count_plan
+        if order_by is TodoOrder.content:
+            assert "COVERING INDEX" in plan
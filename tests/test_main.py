@@ -1,7 +1,10 @@
+import json
 from fastapi.testclient import TestClient
-from src.rp_poetry.main import app, get_session, Todo
-from sqlmodel import SQLModel, create_engine, Session, select, Field
-from src.rp_poetry import settings
+from src.rp_poetry.main import app, get_session, todo_cache, Todo
+from src.rp_poetry.db import make_engine
+from sqlmodel import SQLModel, Session, select, Field
+from sqlalchemy import event
+from src.rp_poetry import migrations, settings
 
 def test_main():
     client = TestClient(app=app)
@@ -10,12 +13,9 @@ def test_main():
     assert response.json() == {"greeting": "Welcome To Todo App!"}
 
 def test_write_main():
-    connection_string = str(settings.TEST_DATABASE_URL).replace(
-        "postgresql", "postgresql+psycopg"
-    )
-    engine = create_engine(connection_string, connect_args={"sslmode": "require"}, pool_recycle=600)
+    engine = make_engine(settings.TEST_DATABASE_URL)
     
-    SQLModel.metadata.create_all(engine)
+    migrations.upgrade(engine)
     
     with Session(engine) as session:
         
@@ -35,12 +35,9 @@ def test_write_main():
         assert data["content"] == todo_content
 
 def test_read_list_main():
-    connection_string = str(settings.TEST_DATABASE_URL).replace(
-        "postgresql", "postgresql+psycopg"
-    )
-    engine = create_engine(connection_string, connect_args={"sslmode": "require"}, pool_recycle=600)
+    engine = make_engine(settings.TEST_DATABASE_URL)
 
-    SQLModel.metadata.create_all(engine)
+    migrations.upgrade(engine)
 
     with Session(engine) as session:
 
@@ -56,12 +53,9 @@ def test_read_list_main():
         assert response.status_code == 200
 
 def test_update_main():
-    connection_string = str(settings.TEST_DATABASE_URL).replace(
-        "postgresql", "postgresql+psycopg"
-    )
-    engine = create_engine(connection_string, connect_args={"sslmode": "require"}, pool_recycle=600)
+    engine = make_engine(settings.TEST_DATABASE_URL)
 
-    SQLModel.metadata.create_all(engine)
+    migrations.upgrade(engine)
 
     with Session(engine) as session:
 
@@ -72,7 +66,8 @@ def test_update_main():
 
         client = TestClient(app=app)
         todo_content = "Eating Biryani"
-        response = client.put("/todos/32",
+        todo_id = client.post("/todos", json={"content": todo_content}).json()["id"]
+        response = client.put(f"/todos/{todo_id}",
                     json={"content": todo_content,
                     "status": True})
         data = response.json()
@@ -80,12 +75,9 @@ def test_update_main():
         assert data["content"] == todo_content
 
 def test_delete_main():
-    connection_string = str(settings.TEST_DATABASE_URL).replace(
-        "postgresql", "postgresql+psycopg"
-    )
-    engine = create_engine(connection_string, connect_args={"sslmode": "require"}, pool_recycle=600)
+    engine = make_engine(settings.TEST_DATABASE_URL)
 
-    SQLModel.metadata.create_all(engine)
+    migrations.upgrade(engine)
 
     with Session(engine) as session:
 
@@ -96,7 +88,188 @@ def test_delete_main():
 
         client = TestClient(app=app)
         todo_content = "Eating Biryani"
-        response = client.delete("/todos/32")
+        todo_id = client.post("/todos", json={"content": todo_content}).json()["id"]
+        response = client.delete(f"/todos/{todo_id}")
         data = response.json()
         assert response.status_code == 200
-        assert data["content"] == todo_content
\ No newline at end of file
+        assert data["content"] == todo_content
+
+def test_read_list_paginated_main():
+    engine = make_engine(settings.TEST_DATABASE_URL)
+
+    migrations.upgrade(engine)
+
+    with Session(engine) as session:
+
+        def get_session_override():
+            return session
+
+        app.dependency_overrides[get_session] = get_session_override
+
+        client = TestClient(app=app)
+        ids = [client.post("/todos", json={"content": f"Page {i}"}).json()["id"] for i in range(3)]
+
+        response = client.get("/todos", params={"after": ids[0] - 1, "limit": 2})
+        data = response.json()
+        assert response.status_code == 200
+        assert [todo["id"] for todo in data] == ids[:2]
+        assert response.headers["X-Next-Cursor"] == str(ids[1])
+
+        response = client.get("/todos", params={"after": ids[1], "limit": 2})
+        assert [todo["id"] for todo in response.json()] == ids[2:]
+        assert "X-Next-Cursor" not in response.headers
+
+def test_read_list_stream_main():
+    engine = make_engine(settings.TEST_DATABASE_URL)
+
+    migrations.upgrade(engine)
+
+    with Session(engine) as session:
+
+        def get_session_override():
+            return session
+
+        app.dependency_overrides[get_session] = get_session_override
+
+        client = TestClient(app=app)
+        ids = [client.post("/todos", json={"content": f"Export {i}"}).json()["id"] for i in range(3)]
+
+        response = client.get("/todos", params={"after": ids[0] - 1, "stream": True})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [todo["id"] for todo in rows] == sorted(todo["id"] for todo in rows)
+        assert [todo["id"] for todo in rows[:3]] == ids
+
+def test_bulk_main():
+    engine = make_engine(settings.TEST_DATABASE_URL)
+
+    migrations.upgrade(engine)
+
+    with Session(engine) as session:
+
+        def get_session_override():
+            return session
+
+        app.dependency_overrides[get_session] = get_session_override
+
+        client = TestClient(app=app)
+        response = client.post("/todos/bulk",
+                    json=[{"content": "Bulk 1"}, {"content": "Bulk 2", "status": True}])
+        created = response.json()
+        assert response.status_code == 200
+        assert [todo["content"] for todo in created] == ["Bulk 1", "Bulk 2"]
+        assert [todo["status"] for todo in created] == [False, True]
+        ids = [todo["id"] for todo in created]
+
+        missing = ids[-1] + 1000
+        response = client.patch("/todos/bulk",
+                    json=[{"id": ids[0], "status": True},
+                          {"id": ids[1], "content": "Bulk 2 renamed"},
+                          {"id": missing, "status": True}])
+        results = response.json()
+        assert response.status_code == 200
+        assert results[0]["todo"] == {"id": ids[0], "content": "Bulk 1", "status": True, "version": 2}
+        assert results[1]["todo"] == {"id": ids[1], "content": "Bulk 2 renamed", "status": True, "version": 2}
+        assert results[2] == {"id": missing, "ok": False, "todo": None, "detail": "Todo not found"}
+
+        response = client.request("DELETE", "/todos/bulk", json=[ids[1], missing, ids[0]])
+        results = response.json()
+        assert response.status_code == 200
+        assert [result["ok"] for result in results] == [True, False, True]
+        assert results[2]["todo"]["content"] == "Bulk 1"
+
+        # item i of the response is item i of the request
+        contents = [f"Bulk order {i}" for i in range(50)]
+        response = client.post("/todos/bulk", json=[{"content": content} for content in contents])
+        created = response.json()
+        assert [todo["content"] for todo in created] == contents
+        assert [todo["id"] for todo in created] == sorted(todo["id"] for todo in created)
+
+def test_update_delete_single_statement_main():
+    engine = make_engine(settings.TEST_DATABASE_URL)
+
+    migrations.upgrade(engine)
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with Session(engine) as session:
+
+        def get_session_override():
+            return session
+
+        app.dependency_overrides[get_session] = get_session_override
+
+        client = TestClient(app=app)
+        todo_id = client.post("/todos", json={"content": "Round trip"}).json()["id"]
+
+        statements.clear()
+        response = client.put(f"/todos/{todo_id}", json={"status": True})
+        assert response.status_code == 200
+        assert response.json() == {"id": todo_id, "content": "Round trip", "status": True, "version": 2}
+        assert len(statements) == 1
+
+        statements.clear()
+        response = client.delete(f"/todos/{todo_id}")
+        assert response.status_code == 200
+        assert response.json()["content"] == "Round trip"
+        assert len(statements) == 1
+
+        statements.clear()
+        assert client.put(f"/todos/{todo_id}", json={"status": False}).status_code == 404
+        assert client.delete(f"/todos/{todo_id}").status_code == 404
+        assert len(statements) == 2
+
+def test_read_list_cached_main():
+    engine = make_engine(settings.TEST_DATABASE_URL)
+
+    migrations.upgrade(engine)
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statements(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with Session(engine) as session:
+
+        def get_session_override():
+            return session
+
+        app.dependency_overrides[get_session] = get_session_override
+
+        client = TestClient(app=app)
+        todo_id = client.post("/todos", json={"content": "Cached"}).json()["id"]
+
+        statements.clear()
+        response = client.get("/todos", params={"after": todo_id - 1})
+        etag = response.headers["ETag"]
+        assert response.json()[0]["content"] == "Cached"
+        response = client.get("/todos", params={"after": todo_id - 1})
+        assert response.headers["ETag"] == etag
+        response = client.get("/todos", params={"after": todo_id - 1},
+                    headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert len(statements) == 1
+
+        client.put(f"/todos/{todo_id}", json={"status": True})
+        response = client.get("/todos", params={"after": todo_id - 1},
+                    headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()[0]["status"] is True
+        assert response.headers["ETag"] != etag
+
+        # revalidated without the cache by the change counter alone
+        etag = response.headers["ETag"]
+        todo_cache.invalidate()
+        statements.clear()
+        response = client.get("/todos", params={"after": todo_id - 1},
+                    headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert len(statements) == 1
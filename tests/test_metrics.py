@@ -0,0 +1,33 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from rp_poetry.metrics import Histogram, MetricsMiddleware, http_requests
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.1, "/a")
+    histogram.observe(5, "/a")
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 2.0',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2.0',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3.0',
+        'latency_seconds_count{route="/a"} 3.0',
+        'latency_seconds_sum{route="/a"} 5.15',
+    ]
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+
+    @app.get("/widgets/{widget_id}")
+    async def read_widget(widget_id: int):
+        return {"id": widget_id}
+
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app=app)
+    client.get("/widgets/1")
+    client.get("/widgets/2")
+    client.get("/widgets/x")
+    assert http_requests.values[("GET", "/widgets/{widget_id}", "200")] == 2
+    assert http_requests.values[("GET", "/widgets/{widget_id}", "422")] == 1
@@ -0,0 +1,63 @@
+import uuid
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
+
+from rp_poetry import cli, migrations, settings
+from rp_poetry.db import make_engine
+
+
+@pytest.fixture(params=["postgresql", "sqlite"])
+def database_url(request, tmp_path):
+    # a fresh database each time, so version 0 really is version 0
+    if request.param == "sqlite":
+        yield f"sqlite:///{tmp_path}/migrations.db"
+        return
+    name = f"migrations_{uuid.uuid4().hex[:12]}"
+    admin = make_engine(settings.TEST_DATABASE_URL).execution_options(isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    yield make_url(str(settings.TEST_DATABASE_URL)).set(database=name).render_as_string(hide_password=False)
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {name}"))
+    admin.dispose()
+
+
+@pytest.fixture
+def engine(database_url):
+    engine = make_engine(database_url)
+    yield engine
+    engine.dispose()
+
+
+def test_check_refuses_unmigrated_database(engine):
+    with pytest.raises(migrations.SchemaVersionError):
+        migrations.check(engine)
+
+
+def test_upgrade_is_idempotent(engine):
+    applied = migrations.upgrade(engine)
+    assert [m.version for m in applied] == [m.version for m in migrations.MIGRATIONS]
+    assert migrations.upgrade(engine) == []
+    assert migrations.check(engine) == migrations.LATEST
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("todo")}
+    assert {"ix_todo_content_prefix", "ix_todo_status_content_cover"} <= indexes
+
+
+def test_upgrade_to_target(engine):
+    assert [m.version for m in migrations.upgrade(engine, target=2)] == [1, 2]
+    with pytest.raises(migrations.SchemaVersionError):
+        migrations.check(engine)
+    assert [m.version for m in migrations.upgrade(engine)] == [3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+
+
+def test_migrate_command(database_url, engine, capsys):
+    assert cli.main(["migrate", "--database-url", database_url, "--to", "1"]) == 0
+    assert "applied 1: create todo" in capsys.readouterr().out
+    assert cli.main(["migrate", "--database-url", database_url, "--list"]) == 0
+    out = capsys.readouterr().out
+    assert "applied  create todo" in out and "pending  status index" in out
+    assert cli.main(["migrate", "--database-url", database_url]) == 0
+    assert migrations.check(engine) == migrations.LATEST
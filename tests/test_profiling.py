@@ -0,0 +1,61 @@
+import json
+import logging
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from rp_poetry import db, migrations, settings
+from rp_poetry.db import make_engine
+from rp_poetry.main import create_app
+from rp_poetry.profiling import RequestProfile
+
+def server_timing(header: str) -> dict[str, str]:
+    # {name: rest of the entry}
+    return {entry.split(";", 1)[0]: entry for entry in header.split(", ")}
+
+def test_flags_repeated_and_slow_statements():
+    profile = RequestProfile(slow_seconds=0.05)
+    for _ in range(3):
+        profile.record("SELECT todo.id FROM todo WHERE todo.id = ?", 0.001, 1)
+    profile.record("UPDATE todo SET status=?", 0.2, 10)
+    timing = server_timing(profile.server_timing(total=0.3, repeat_threshold=3))
+    assert timing["db"] == 'db;dur=203.00;desc="4 queries"'
+    assert timing["app"] == "app;dur=97.00"
+    assert timing["repeated"] == 'repeated;desc="1 statements repeated up to 3 times"'
+    assert timing["slow"] == 'slow;desc="1 queries"'
+    report = profile.to_dict(total=0.3, repeat_threshold=4)
+    assert report["repeated"] == []
+    assert report["slow"] == [{"sql": "UPDATE todo SET status=?", "ms": 200.0}]
+
+def test_sampled_requests_get_server_timing(tmp_path, monkeypatch, caplog):
+    engine = make_engine(f"sqlite:///{tmp_path}/profiling.db")
+    migrations.upgrade(engine)
+    monkeypatch.setattr(db, "engine", engine)
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app_settings.PROFILE_SAMPLE_RATE = 1.0
+    app_settings.PROFILE_LOG = True
+
+    with TestClient(app=create_app(app_settings)) as client, caplog.at_level(logging.INFO, "rp_poetry.profiling"):
+        response = client.post("/todos", json={"content": "Profiled"})
+        # the INSERT and session.refresh()'s SELECT
+        assert server_timing(response.headers["Server-Timing"])["db"].endswith('desc="2 queries"')
+        client.get("/todos", params={"include_total": True, "limit": 1})
+
+    post, get = (json.loads(record.getMessage()) for record in caplog.records)
+    assert (post["method"], post["route"], post["status"]) == ("POST", "/todos", 200)
+    assert [statement["sql"].split()[0] for statement in post["statements"]] == ["INSERT", "SELECT"]
+    assert get["statement_count"] == 2 and get["statements"][0]["rows"] is None
+
+def test_unsampled_requests_are_untouched(tmp_path, monkeypatch):
+    engine = make_engine(f"sqlite:///{tmp_path}/profiling.db")
+    migrations.upgrade(engine)
+    monkeypatch.setattr(db, "engine", engine)
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app_settings.PROFILE_SAMPLE_RATE = 1e-9
+
+    with TestClient(app=create_app(app_settings)) as client:
+        assert "Server-Timing" not in client.get("/todos").headers
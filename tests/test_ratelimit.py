@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from rp_poetry import settings
+from rp_poetry.main import create_app
+from rp_poetry.ratelimit import AdmissionController, MemoryRateLimiter, create_limiter
+
+def make_settings(**overrides) -> SimpleNamespace:
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app_settings.TODO_CREATE_BATCH_SIZE = 0
+    app_settings.TODO_PUSH_ENABLED = False
+    app_settings.PROFILE_SAMPLE_RATE = 0.0
+    app_settings.DATABASE_REPLICA_URLS = []
+    for name, value in overrides.items():
+        setattr(app_settings, name, value)
+    return app_settings
+
+def test_token_bucket():
+    now = [0.0]
+    limiter = MemoryRateLimiter(rate=2, burst=3, max_clients=2, clock=lambda: now[0])
+    assert [limiter.take("a") for _ in range(3)] == [0, 0, 0]
+    assert limiter.take("a") == pytest.approx(0.5)
+    # other clients have buckets of their own
+    assert limiter.take("b") == 0
+    now[0] = 0.5
+    assert limiter.take("a") == 0
+    assert limiter.take("a") == pytest.approx(0.5)
+    # refills up to the burst, no further
+    now[0] = 100
+    assert [limiter.take("a") for _ in range(4)][-1] > 0
+    with pytest.raises(ValueError):
+        create_limiter("memcached://localhost", 1, 1)
+
+def test_admission_queues_then_sheds():
+    async def main():
+        controller = AdmissionController(limit=1, max_queue=1, queue_timeout=0.05)
+        assert await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        # the line is full
+        assert not await controller.acquire()
+        controller.release()
+        assert await waiting
+        assert controller.stats() == {"limit": 1, "in_flight": 1, "queued": 0, "shed": 1}
+        # nobody releases in time
+        assert not await controller.acquire()
+        # a cancelled waiter gives up its place
+        cancelled = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        controller.release()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return controller.stats()
+
+    assert asyncio.run(main()) == {"limit": 1, "in_flight": 0, "queued": 0, "shed": 2}
+
+def test_rate_limited_per_client():
+    app = create_app(make_settings(TODO_BACKEND="memory", RATE_LIMIT_PER_SECOND=0.1, RATE_LIMIT_BURST=2))
+    client = TestClient(app=app)
+    for _ in range(2):
+        assert client.post("/todos", json={"content": "Flood"}, headers={"X-API-Key": "abuser"}).status_code == 200
+    response = client.post("/todos", json={"content": "Flood"}, headers={"X-API-Key": "abuser"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "10"
+    assert client.get("/todos", headers={"X-API-Key": "polite"}).status_code == 200
+    # without a key the client is known by its address
+    assert client.get("/todos").status_code == 200
+
+def test_busy_pool_sheds_with_503():
+    app = create_app(make_settings(
+        ADMISSION_CONTROL=True, DB_POOL_SIZE=2, DB_MAX_OVERFLOW=1, ADMISSION_QUEUE_TIMEOUT=0.01,
+        ADMISSION_RETRY_AFTER=2,
+    ))
+    client = TestClient(app=app)
+    assert app.state.admission.limit == 3
+    # every connection taken, as by requests still running
+    app.state.admission.in_flight = 3
+    response = client.get("/todos")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+    # routes that leave the database alone are not held up
+    assert client.get("/").status_code == 200
+    assert app.state.admission.stats() == {"limit": 3, "in_flight": 3, "queued": 0, "shed": 1}
@@ -0,0 +1,98 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from rp_poetry import db, migrations, settings
+from rp_poetry.cache import todo_cache
+from rp_poetry.db import make_engine
+from rp_poetry.main import create_app
+from rp_poetry.models import Todo
+from rp_poetry.replicas import ReplicaSet
+
+def test_round_robin_and_least_connections(tmp_path):
+    engines = [make_engine(f"sqlite:///{tmp_path}/replica{i}.db") for i in range(3)]
+    replicas = ReplicaSet(engines, "round_robin")
+    assert [replicas.choose() for _ in range(4)] == [*engines, engines[0]]
+
+    busy = engines[1].connect()
+    replicas = ReplicaSet(engines, "least_connections")
+    assert engines[1] not in [replicas.choose() for _ in range(6)]
+    busy.close()
+    with pytest.raises(ValueError):
+        ReplicaSet(engines, "random")
+    for engine in engines:
+        engine.dispose()
+
+@pytest.fixture
+def primary_and_replica(tmp_path, monkeypatch):
+    # Two separate databases with nothing replicating between them, so
+    # which one answered shows in what comes back.
+    primary = make_engine(f"sqlite:///{tmp_path}/primary.db")
+    replica_url = f"sqlite:///{tmp_path}/replica.db"
+    replica = make_engine(replica_url)
+    for engine in (primary, replica):
+        migrations.upgrade(engine)
+    monkeypatch.setattr(db, "engine", primary)
+    monkeypatch.setattr(db, "replicas", None)
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URLS", [replica_url])
+    monkeypatch.setattr(settings, "TODO_SYNC_LAG_MS", 0)
+    yield primary, replica
+    for engine in (primary, replica):
+        engine.dispose()
+
+def test_reads_go_to_the_replica_except_after_a_write(primary_and_replica):
+    primary, replica = primary_and_replica
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app_settings.TODO_CREATE_BATCH_SIZE = 0
+    app_settings.TODO_PUSH_ENABLED = False
+    app_settings.DB_READ_YOUR_WRITES_SECONDS = 0.5
+    todo_cache.invalidate()
+
+    with TestClient(app=create_app(app_settings)) as writer, TestClient(app=create_app(app_settings)) as reader:
+        todo = writer.post("/todos", json={"content": "Written"}).json()
+        assert "rp_primary_until" in writer.cookies
+        # the writer reads its write back from the primary, past the cache
+        assert writer.get("/todos").json() == [todo]
+        assert writer.get("/todos/changes").json()["todos"][0]["id"] == todo["id"]
+
+        # anyone else reads the replica, which has not caught up
+        todo_cache.invalidate()
+        assert reader.get("/todos").json() == []
+        assert reader.get("/todos/search", params={"q": "Written", "mode": "prefix"}).json() == []
+        # the sync feed stays on the primary
+        assert reader.get("/todos/changes").json()["todos"][0]["id"] == todo["id"]
+
+        with Session(replica) as session:
+            session.add(Todo(**todo))
+            session.commit()
+        todo_cache.invalidate()
+        assert reader.get("/todos").json() == [todo]
+
+        # a failed write does not make a client sticky
+        assert reader.delete("/todos/12345").status_code == 404
+        assert "rp_primary_until" not in reader.cookies
+
+        time.sleep(0.6)
+        with Session(primary) as session:
+            session.delete(session.get(Todo, todo["id"]))
+            session.commit()
+        todo_cache.invalidate()
+        assert writer.get("/todos").json() == [todo]
+    assert db.replicas is None
+
+def test_replica_engines_are_instrumented(primary_and_replica):
+    from rp_poetry import metrics
+
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = True
+    app_settings.DB_ASYNC = False
+    app_settings.TODO_CREATE_BATCH_SIZE = 0
+    app_settings.TODO_PUSH_ENABLED = False
+    with TestClient(app=create_app(app_settings)):
+        assert db.replicas.engines
+        assert all(replica in metrics.instrumented_engines for replica in db.replicas.engines)
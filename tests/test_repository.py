@@ -0,0 +1,157 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session
+
+from rp_poetry import db, migrations, settings
+from rp_poetry.db import make_engine
+from rp_poetry.main import create_app
+from rp_poetry.models import TodoCreate, TodoUpdate
+from rp_poetry.queries import TodoOrder
+from rp_poetry.repository import MemoryTodoStore, SqlTodoRepository, TodoNotFound, TodoVersionMismatch
+
+# The same behaviour from every backend. The database ones run in a
+# transaction that is rolled back afterwards, so each test starts from an
+# empty table; the repository's commits only release savepoints.
+
+@pytest.fixture(params=["postgresql", "sqlite", "memory"])
+def repository(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryTodoStore()
+        return
+    url = str(settings.TEST_DATABASE_URL) if request.param == "postgresql" else f"sqlite:///{tmp_path}/repository.db"
+    engine = make_engine(url)
+    migrations.upgrade(engine)
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        conn.execute(text("DELETE FROM todo"))
+        with Session(bind=conn, join_transaction_mode="create_savepoint") as session:
+            yield SqlTodoRepository(session)
+        transaction.rollback()
+    engine.dispose()
+
+def create(repository, *contents, status=False):
+    return [repository.create(TodoCreate(content=content, status=status)) for content in contents]
+
+def test_create_and_get(repository):
+    first, second = create(repository, "a", "b")
+    assert first.id < second.id
+    assert (first.content, first.status, first.version) == ("a", False, 1)
+    assert repository.get(second.id) == second
+    assert repository.get(second.id + 1) is None
+
+def test_pages_by_id(repository):
+    todos = create(repository, "c", "a", "b", "d", "e")
+    page, cursor, _ = repository.list_page(None, TodoOrder.id, None, 2)
+    assert page == todos[:2]
+    page, cursor, _ = repository.list_page(None, TodoOrder.id, cursor, 2)
+    assert page == todos[2:4]
+    page, cursor, _ = repository.list_page(None, TodoOrder.id, cursor, 2)
+    assert page == todos[4:] and cursor == ""
+
+def test_pages_by_content_within_status(repository):
+    done = create(repository, "b", "a", "b", status=True)
+    create(repository, "a", "c")
+    page, cursor, _ = repository.list_page(True, TodoOrder.content, None, 2)
+    # ties in content are ordered by id
+    assert page == [done[1], done[0]]
+    page, cursor, _ = repository.list_page(True, TodoOrder.content, cursor, 2)
+    assert page == [done[2]] and cursor == ""
+
+def test_invalid_cursor(repository):
+    create(repository, "a")
+    for order_by, cursor in ((TodoOrder.id, "nope"), (TodoOrder.content, "1")):
+        with pytest.raises(ValueError):
+            repository.list_page(None, order_by, cursor, 10)
+
+def test_export_and_count(repository):
+    todos = create(repository, "a", "b", "c") + create(repository, "d", status=True)
+    body = b"".join(repository.export(False, TodoOrder.id, str(todos[0].id)))
+    assert [json.loads(line)["content"] for line in body.splitlines()] == ["b", "c"]
+    assert repository.count(None) == (4, True)
+    assert repository.count(True) == (1, True)
+
+def test_update(repository):
+    todo, = create(repository, "a")
+    updated = repository.update(todo.id, TodoUpdate(status=True))
+    assert (updated.content, updated.status, updated.version) == ("a", True, 2)
+    # nothing sent, nothing changed
+    assert repository.update(todo.id, TodoUpdate()).version == 2
+    with pytest.raises(TodoVersionMismatch):
+        repository.update(todo.id, TodoUpdate(content="b"), versions=[1])
+    assert repository.update(todo.id, TodoUpdate(content="b"), versions=[1, 2]).version == 3
+    with pytest.raises(TodoNotFound):
+        repository.update(todo.id + 1, TodoUpdate(content="b"))
+    assert repository.get(todo.id).content == "b"
+
+def test_delete(repository):
+    todo_id = create(repository, "a")[0].id
+    with pytest.raises(TodoVersionMismatch):
+        repository.delete(todo_id, versions=[2])
+    assert repository.delete(todo_id, versions=[1]).model_dump() == {
+        "id": todo_id, "content": "a", "status": False, "version": 1,
+    }
+    assert repository.get(todo_id) is None
+    with pytest.raises(TodoNotFound):
+        repository.delete(todo_id)
+    assert repository.list_page(None, TodoOrder.id, None, 10)[:2] == ([], "")
+
+def test_state_tag(repository):
+    empty = repository.state_tag()
+    assert repository.list_page(None, TodoOrder.id, None, 10) == ([], "", empty)
+    todo, = create(repository, "a")
+    created = repository.state_tag()
+    assert created != empty
+    # every page read in one state carries its tag
+    assert repository.list_page(None, TodoOrder.id, None, 10)[2] == created
+    assert repository.list_page(None, TodoOrder.id, str(todo.id), 10) == ([], "", created)
+    # changed by every write that changes a todo, and only those
+    repository.update(todo.id, TodoUpdate(status=True))
+    assert repository.state_tag() not in (empty, created)
+    updated = repository.state_tag()
+    assert repository.update(todo.id, TodoUpdate()).version == 2
+    assert repository.state_tag() == updated
+    with pytest.raises(TodoNotFound):
+        repository.delete(todo.id + 1)
+    assert repository.state_tag() == updated
+    repository.delete(todo.id)
+    assert repository.state_tag() not in (empty, created, updated)
+
+def test_memory_backend_app(monkeypatch):
+    # no engine, no migrations: the app runs without a database
+    monkeypatch.setattr(db, "engine", None)
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.TODO_BACKEND = "memory"
+    app_settings.METRICS_ENABLED = False
+    app = create_app(app_settings)
+    assert "/todos/search" not in {route.path for route in app.routes}
+
+    with TestClient(app=app) as client:
+        todo = client.post("/todos", json={"content": "In memory"}).json()
+        assert todo == {"id": 1, "content": "In memory", "status": False, "version": 1}
+        # id and version are the server's; a client cannot pick them
+        todo = client.post("/todos", json={"id": 1, "content": "Again", "version": 9}).json()
+        assert todo == {"id": 2, "content": "Again", "status": False, "version": 1}
+        client.delete("/todos/2")
+        response = client.put("/todos/1", json={"status": True}, headers={"If-Match": '"1"'})
+        assert response.headers["ETag"] == '"2"'
+        assert client.delete("/todos/1", headers={"If-Match": '"1"'}).status_code == 412
+        response = client.get("/todos", params={"include_total": True})
+        assert response.json() == [{"id": 1, "content": "In memory", "status": True, "version": 2}]
+        assert response.headers["X-Total-Count"] == "1"
+        assert client.delete("/todos/1").status_code == 200
+        assert client.delete("/todos/1").status_code == 404
+    assert db.engine is None
+
+def test_memory_apps_keep_their_own_pages():
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.TODO_BACKEND = "memory"
+    app_settings.METRICS_ENABLED = False
+    # both fill the process's one response cache
+    first, second = TestClient(app=create_app(app_settings)), TestClient(app=create_app(app_settings))
+    first.post("/todos", json={"content": "First app"})
+    assert len(first.get("/todos").json()) == 1
+    assert second.get("/todos").json() == []
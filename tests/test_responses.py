@@ -0,0 +1,22 @@
+import json
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from rp_poetry import settings
+from rp_poetry.models import Todo, todo_list
+from rp_poetry.responses import default_response_class, dump_response
+
+def test_default_response_class(monkeypatch):
+    monkeypatch.setattr(settings, "JSON_RESPONSE", "json")
+    assert default_response_class() is JSONResponse
+    monkeypatch.setattr(settings, "JSON_RESPONSE", "orjson")
+    assert default_response_class() is ORJSONResponse
+
+def test_dump_response_matches_json_response():
+    todos = [Todo(id=1, content="Eating Biryani", status=False), Todo(id=2, content="Çay", status=True)]
+    response = dump_response(todo_list, todos, {"X-Next-Cursor": "2"})
+    assert response.media_type == "application/json"
+    assert response.headers["X-Next-Cursor"] == "2"
+    expected = JSONResponse([todo.model_dump() for todo in todos])
+    assert json.loads(response.body) == json.loads(expected.body)
+    assert response.body == expected.body
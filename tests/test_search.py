@@ -0,0 +1,143 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session
+
+from rp_poetry import migrations, settings
+from rp_poetry.db import make_engine
+from rp_poetry.main import app, get_session
+from rp_poetry.models import Todo
+from rp_poetry.search import SearchMode, search_statement
+
+
+@pytest.fixture(params=["postgresql", "sqlite"])
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        url = f"sqlite:///{tmp_path}/search.db"
+    else:
+        url = settings.TEST_DATABASE_URL
+    engine = make_engine(url)
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    with Session(engine) as session:
+        app.dependency_overrides[get_session] = lambda: session
+        yield TestClient(app=app)
+    app.dependency_overrides.pop(get_session, None)
+
+
+def test_prefix_search(client):
+    tag = uuid.uuid4().hex[:12]
+    for content in (f"{tag} Buy milk", f"{tag} buy bread", f"x{tag} buy eggs", f"{tag}_50% off"):
+        client.post("/todos", json={"content": content})
+
+    response = client.get("/todos/search", params={"q": f"{tag} BUY", "mode": "prefix"})
+    assert response.status_code == 200
+    assert [todo["content"] for todo in response.json()] == [f"{tag} Buy milk", f"{tag} buy bread"]
+
+    # LIKE wildcards in the query are matched literally
+    response = client.get("/todos/search", params={"q": f"{tag}_50%", "mode": "prefix"})
+    assert [todo["content"] for todo in response.json()] == [f"{tag}_50% off"]
+    response = client.get("/todos/search", params={"q": f"{tag}%", "mode": "prefix"})
+    assert response.json() == []
+
+
+def test_fulltext_search_ranks_and_pages(client):
+    tag = uuid.uuid4().hex
+    ids = {}
+    for content in (
+        f"{tag} water the plants",
+        f"{tag} plants plants plants",
+        f"{tag} call mom",
+        f'{tag} "plants" - (repot) * AND',
+    ):
+        ids[content] = client.post("/todos", json={"content": content}).json()["id"]
+    client.put(f"/todos/{ids[f'{tag} water the plants']}", json={"status": True})
+
+    response = client.get("/todos/search", params={"q": f"{tag} plants", "limit": 2})
+    assert response.status_code == 200
+    first = response.json()
+    assert first[0]["content"] == f"{tag} plants plants plants"
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get("/todos/search", params={"q": f"{tag} plants", "limit": 2, "after": cursor})
+    second = response.json()
+    assert len(second) == 1
+    assert "X-Next-Cursor" not in response.headers
+    found = {todo["id"] for todo in first + second}
+    assert found == {ids[c] for c in ids if "plants" in c}
+
+    response = client.get("/todos/search", params={"q": f"{tag} plants", "after": "1"})
+    assert response.status_code == 422
+
+    done = client.get("/todos/search", params={"q": f"{tag} plants", "status": True}).json()
+    assert [todo["id"] for todo in done] == [ids[f"{tag} water the plants"]]
+
+    # search syntax in user input is never an error
+    response = client.get("/todos/search", params={"q": f'{tag} "repot" -( AND *'})
+    assert response.status_code == 200
+
+    # the cursor keeps its place after the row it came from is deleted
+    client.delete(f"/todos/{first[-1]['id']}")
+    response = client.get("/todos/search", params={"q": f"{tag} plants", "limit": 2, "after": cursor})
+    assert response.json() == second
+
+
+def test_search_rejects_empty_query(client):
+    assert client.get("/todos/search", params={"q": ""}).status_code == 422
+
+
+def explain(conn, statement) -> str:
+    if conn.dialect.name == "postgresql":
+        # a tiny test table is always cheaper to scan, so force the planner
+        # to show whether the index can serve the query at all
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        prefix = "EXPLAIN "
+    else:
+        prefix = "EXPLAIN QUERY PLAN "
+    compiled = statement.compile(conn)
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return "\n".join(str(row) for row in conn.exec_driver_sql(prefix + str(compiled), params))
+
+
+@pytest.mark.parametrize("mode", list(SearchMode))
+def test_search_uses_index(engine, mode):
+    with engine.begin() as conn:
+        plan = explain(conn, search_statement(conn, "buy milk", mode, None, None).limit(10))
+    if mode is SearchMode.prefix:
+        assert "ix_todo_content_prefix" in plan
+    elif engine.dialect.name == "postgresql":
+        assert "ix_todo_content_tsv" in plan
+    else:
+        assert "VIRTUAL TABLE INDEX" in plan
+
+
+def test_fts_index_follows_writes(engine):
+    tag = uuid.uuid4().hex
+    with Session(engine) as session:
+        todo = Todo(content=f"{tag} original")
+        session.add(todo)
+        session.commit()
+        session.refresh(todo)
+
+        def search(q):
+            rows = session.exec(search_statement(session.get_bind(), q, SearchMode.fulltext, None, None)).all()
+            return [todo for todo, _ in rows]
+
+        assert [t.id for t in search(f"{tag} original")] == [todo.id]
+        todo.content = f"{tag} renamed"
+        session.add(todo)
+        session.commit()
+        assert search(f"{tag} original") == []
+        assert [t.id for t in search(f"{tag} renamed")] == [todo.id]
+        session.delete(todo)
+        session.commit()
+        assert search(tag) == []
@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from rp_poetry import settings
+from rp_poetry.main import create_app
+
+# Import time is tracked here because cold starts show up in p99: every
+# worker the autoscaler starts pays it before serving. Each check runs in a
+# fresh interpreter so modules cached by other tests do not hide the cost.
+
+# generous, to catch regressions like an eager connection or a heavy
+# import, not to measure; fastapi, pydantic and sqlalchemy are most of it
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 3000))
+
+OWN_CODE_BUDGET_MS = float(os.environ.get("OWN_CODE_BUDGET_MS", 300))
+
+def run_python(code: str, *args: str, **env: str) -> subprocess.CompletedProcess:
+    # nothing listens on port 1, so connecting at import would fail loudly
+    env = dict(
+        os.environ,
+        DATABASE_URL="postgresql://nobody@127.0.0.1:1/none",
+        TEST_DATABASE_URL="postgresql://nobody@127.0.0.1:1/none",
+        **env,
+    )
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(os.path.dirname(__file__), "..", "src"), env.get("PYTHONPATH", "")]
+    )
+    return subprocess.run(
+        [sys.executable, *args, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    # {module: (self us, cumulative us)} from python -X importtime
+    stderr = run_python(f"import {module}", "-X", "importtime").stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+def test_import_builds_no_engine():
+    run_python(
+        "import sys, rp_poetry.main, rp_poetry.db as db\n"
+        "assert db.engine is None and db.async_engine is None\n"
+        "assert 'psycopg' not in sys.modules",
+        DB_ASYNC="true",
+    )
+
+def test_optional_modules_are_not_imported():
+    run_python(
+        "import sys, rp_poetry.main\n"
+        "assert 'rp_poetry.metrics' not in sys.modules\n"
+        "assert 'rp_poetry.async_todos' not in sys.modules\n"
+        "assert 'rp_poetry.events' not in sys.modules\n"
+        "assert 'rp_poetry.profiling' not in sys.modules\n"
+        "assert 'rp_poetry.ratelimit' not in sys.modules",
+        DB_ASYNC="false",
+        METRICS_ENABLED="false",
+        PROFILE_SAMPLE_RATE="0",
+    )
+
+def test_import_time_budget():
+    for module in ("rp_poetry.main", "rp_poetry.fastneon"):
+        times = import_times(module)
+        total_ms = times[module][1] / 1000
+        own_ms = sum(own for name, (own, _) in times.items() if name.startswith("rp_poetry")) / 1000
+        print(f"{module}: {total_ms:.0f} ms cumulative, {own_ms:.0f} ms in rp_poetry modules")
+        assert total_ms < IMPORT_BUDGET_MS
+        assert own_ms < OWN_CODE_BUDGET_MS
+
+def test_create_app_from_settings():
+    app_settings = SimpleNamespace(**{name: getattr(settings, name) for name in dir(settings) if name.isupper()})
+    app_settings.METRICS_ENABLED = False
+    app_settings.DB_ASYNC = False
+    app = create_app(app_settings)
+    assert app.state.settings is app_settings
+    paths = {route.path for route in app.routes}
+    assert "/todos" in paths
+    assert "/metrics" not in paths
+    assert create_app(app_settings) is not app
+
+    client = TestClient(app=app)
+    assert client.get("/").status_code == 200
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from rp_poetry import cli, migrations, settings, sync
+from rp_poetry.db import make_engine
+from rp_poetry.main import app, get_session
+from rp_poetry.pagination import encode_cursor
+
+
+@pytest.fixture(params=["postgresql", "sqlite"])
+def database_url(request, tmp_path):
+    if request.param == "sqlite":
+        return f"sqlite:///{tmp_path}/sync.db"
+    return str(settings.TEST_DATABASE_URL)
+
+
+@pytest.fixture
+def engine(database_url):
+    engine = make_engine(database_url)
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    monkeypatch.setattr(settings, "TODO_SYNC_LAG_MS", 0)
+
+    # a session per request, as in production: a change is stamped with the
+    # time its own transaction started
+    def get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    yield TestClient(app=app)
+    app.dependency_overrides.pop(get_session, None)
+
+
+def sync_all(client, since=None, limit=1000):
+    todos, deleted = {}, set()
+    while True:
+        params = {"limit": limit} if since is None else {"since": since, "limit": limit}
+        response = client.get("/todos/changes", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        todos.update((todo["id"], todo) for todo in page["todos"])
+        deleted.update(page["deleted"])
+        since = page["cursor"]
+        if not page["has_more"]:
+            return todos, deleted, since
+
+
+def test_changes_since_cursor(client):
+    _, _, cursor = sync_all(client)
+
+    kept = client.post("/todos", json={"content": "Synced"}).json()
+    gone = client.post("/todos", json={"content": "Deleted"}).json()
+    client.put(f"/todos/{kept['id']}", json={"status": True})
+    client.delete(f"/todos/{gone['id']}")
+
+    todos, deleted, cursor = sync_all(client, cursor)
+    assert list(todos) == [kept["id"]]
+    assert todos[kept["id"]]["status"] is True and todos[kept["id"]]["version"] == 2
+    assert deleted == {gone["id"]}
+
+    # an empty PUT is not a change
+    client.put(f"/todos/{kept['id']}", json={})
+    assert sync_all(client, cursor)[:2] == ({}, set())
+
+
+def test_changes_page_in_order(client):
+    _, _, cursor = sync_all(client)
+    ids = [client.post("/todos", json={"content": f"Page {i}"}).json()["id"] for i in range(3)]
+
+    page = client.get("/todos/changes", params={"since": cursor, "limit": 2}).json()
+    assert [todo["id"] for todo in page["todos"]] == ids[:2]
+    assert page["has_more"] is True
+    page = client.get("/todos/changes", params={"since": page["cursor"], "limit": 2}).json()
+    assert [todo["id"] for todo in page["todos"]] == ids[2:]
+    assert page["has_more"] is False
+
+
+def test_changes_page_through_one_transaction(client):
+    # every row a transaction writes shares its timestamp
+    _, _, cursor = sync_all(client)
+    created = client.post("/todos/bulk", json=[{"content": f"Bulk {i}"} for i in range(5)]).json()
+    todos, _, _ = sync_all(client, cursor, limit=2)
+    assert sorted(todos) == sorted(todo["id"] for todo in created)
+
+
+def test_changes_wait_for_the_lag(client, monkeypatch):
+    _, _, cursor = sync_all(client)
+    client.post("/todos", json={"content": "Too recent"})
+    monkeypatch.setattr(settings, "TODO_SYNC_LAG_MS", 3_600_000)
+    page = client.get("/todos/changes", params={"since": cursor}).json()
+    assert page["todos"] == []
+
+
+def test_bad_and_expired_cursors(client):
+    assert client.get("/todos/changes", params={"since": "nope"}).status_code == 422
+    expired = encode_cursor(("2000-01-01T00:00:00+00:00", 0))
+    assert client.get("/todos/changes", params={"since": expired}).status_code == 410
+
+
+def test_compact_tombstones(client, engine, database_url, capsys):
+    todo = client.post("/todos", json={"content": "Compacted"}).json()
+    client.delete(f"/todos/{todo['id']}")
+    with engine.begin() as conn:
+        # too recent to go
+        sync.compact_tombstones(conn, timedelta(days=1))
+        deleted_ids = {row.id for row in conn.execute(sync.tombstones.select())}
+    assert todo["id"] in deleted_ids
+
+    assert cli.main(["compact-tombstones", "--older-than-days", "0", "--database-url", database_url]) == 0
+    assert "tombstones" in capsys.readouterr().out
+    with engine.connect() as conn:
+        assert todo["id"] not in {row.id for row in conn.execute(sync.tombstones.select())}
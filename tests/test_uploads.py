@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from rp_poetry.uploads import stream_upload
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    return str(tmp_path / "uploads")
+
+
+@pytest.fixture
+def client(upload_dir):
+    app = FastAPI()
+
+    @app.post("/files/")
+    async def create_file(request: Request):
+        # a tiny chunk size so every upload is flushed many times
+        form = await stream_upload(request, upload_dir, chunk_size=1000, max_size=100_000)
+        return {
+            "fields": form.fields,
+            "files": {name: vars(stored) for name, stored in form.files.items()},
+        }
+
+    return TestClient(app=app)
+
+
+def test_stream_upload(client, upload_dir):
+    data = os.urandom(50_000)
+    response = client.post(
+        "/files/",
+        files={"file": ("data.bin", data, "application/octet-stream"), "empty": ("empty.txt", b"", "text/plain")},
+        data={"token": "secret"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["fields"] == {"token": "secret"}
+    stored = body["files"]["file"]
+    assert stored["filename"] == "data.bin"
+    assert stored["size"] == len(data)
+    assert stored["sha256"] == hashlib.sha256(data).hexdigest()
+    with open(stored["path"], "rb") as f:
+        assert f.read() == data
+    assert body["files"]["empty"]["size"] == 0
+    assert os.path.getsize(body["files"]["empty"]["path"]) == 0
+
+
+def test_stream_upload_too_large(client, upload_dir):
+    response = client.post("/files/", files={"file": ("big.bin", os.urandom(200_000))})
+    assert response.status_code == 413
+    # refused on Content-Length before anything is written
+    assert not os.path.exists(upload_dir)
+
+    # without a Content-Length the limit is enforced while streaming
+    def body():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"x\"\r\n\r\n"
+        for _ in range(20):
+            yield os.urandom(10_000)
+
+    response = client.post("/files/", content=body(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+    assert os.listdir(upload_dir) == []
+
+
+def test_stream_upload_rejects_bad_bodies(client, upload_dir):
+    assert client.post("/files/", json={"file": "x"}).status_code == 415
+    truncated = b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"x\"\r\n\r\nabc"
+    response = client.post("/files/", content=truncated, headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 400
+    assert os.listdir(upload_dir) == []
+
+
+def test_stream_upload_rejects_duplicate_names(client, upload_dir):
+    response = client.post(
+        "/files/", files=[("file", ("a.bin", os.urandom(5_000))), ("file", ("b.bin", os.urandom(5_000)))]
+    )
+    assert response.status_code == 400
+    assert os.listdir(upload_dir) == []